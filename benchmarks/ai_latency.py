@@ -0,0 +1,133 @@
+"""
+Latency of non-AI endpoints while AI calls are in flight.
+
+Fires ``--ai-calls`` concurrent /ai/prompt requests against a fake model that
+takes ``--model-latency`` seconds, and meanwhile measures sequential
+GET /transactions/user/{id} requests. ``--blocking`` makes the fake sleep
+synchronously, reproducing the old behaviour of calling the sync client from
+``async def`` handlers.
+
+    python -m benchmarks.ai_latency
+    python -m benchmarks.ai_latency --blocking
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("AI_MAX_CONCURRENCY", "4")
+os.environ.setdefault("AI_MAX_QUEUE", "64")
+
+import httpx
+from tortoise import Tortoise
+
+import server.routers.ai as ai_module
+from server.db.main import MODELS_MODULES
+from server.db.models import Transactions
+from server.index import app
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModels:
+    def __init__(self, latency, blocking):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def generate_content(self, model, contents, config=None):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return _FakeResponse("[]")
+
+
+class FakeClient:
+    """Stand-in for genai.Client exposing only what ai.py uses."""
+
+    def __init__(self, latency=1.0, blocking=False):
+        self.models = _FakeModels(latency, blocking)
+        self.aio = self
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def probe(http, path, count):
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = await http.get(path)
+        latencies.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+    return latencies
+
+
+def summary(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    await Transactions.bulk_create(
+        [
+            Transactions(
+                user_id="bench", amount=i, type="expense", detail="seed", tag="food"
+            )
+            for i in range(200)
+        ]
+    )
+    ai_module.client = FakeClient(args.model_latency, args.blocking)
+
+    path = "/transactions/user/bench?limit=50"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        idle = await probe(http, path, args.probes)
+
+        ai_tasks = [
+            asyncio.create_task(http.post("/ai/prompt", json={"prompt": "hi"}))
+            for _ in range(args.ai_calls)
+        ]
+        await asyncio.sleep(0)
+        busy = await probe(http, path, args.probes)
+        ai_responses = await asyncio.gather(*ai_tasks)
+
+    await Tortoise.close_connections()
+    print(
+        json.dumps(
+            {
+                "benchmark": "ai_latency",
+                "blocking_fake": args.blocking,
+                "model_latency_s": args.model_latency,
+                "ai_calls": args.ai_calls,
+                "ai_status_codes": sorted({r.status_code for r in ai_responses}),
+                "idle": summary(idle),
+                "during_ai": summary(busy),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--ai-calls", type=int, default=16)
+    parser.add_argument("--model-latency", type=float, default=0.5)
+    parser.add_argument("--probes", type=int, default=200)
+    parser.add_argument("--blocking", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+Transaction ingest throughput: one POST per row vs POST /transactions/batch.
+
+Runs the app in-process against SQLite and reports rows per second.
+
+    python -m benchmarks.bulk_ingest
+    python -m benchmarks.bulk_ingest --rows 20000 --batch 5000
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+from tortoise import Tortoise
+
+from server.db.main import MODELS_MODULES
+from server.index import app
+
+TAGS = ["food", "transportation", "groceries", "shopping", "bills"]
+
+
+def make_items(user_id: str, count: int, rng: random.Random) -> list:
+    return [
+        {
+            "user_id": user_id,
+            "amount": round(rng.expovariate(1 / 250), 2),
+            "type": "expense",
+            "detail": f"imported row {i}",
+            "tag": rng.choice(TAGS),
+        }
+        for i in range(count)
+    ]
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    rng = random.Random(7)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        single_items = make_items("bench-single", args.single_rows, rng)
+        start = time.perf_counter()
+        for item in single_items:
+            (await http.post("/transactions/", json=item)).raise_for_status()
+        single_s = time.perf_counter() - start
+
+        batch_items = make_items("bench-batch", args.rows, rng)
+        start = time.perf_counter()
+        for offset in range(0, len(batch_items), args.batch):
+            chunk = batch_items[offset : offset + args.batch]
+            response = await http.post("/transactions/batch", json={"items": chunk})
+            response.raise_for_status()
+        batch_s = time.perf_counter() - start
+
+    await Tortoise.close_connections()
+    print(
+        json.dumps(
+            {
+                "benchmark": "bulk_ingest",
+                "single": {
+                    "rows": args.single_rows,
+                    "seconds": round(single_s, 3),
+                    "rows_per_s": round(args.single_rows / single_s, 1),
+                },
+                "batch": {
+                    "rows": args.rows,
+                    "items_per_request": args.batch,
+                    "seconds": round(batch_s, 3),
+                    "rows_per_s": round(args.rows / batch_s, 1),
+                },
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--single-rows", type=int, default=500)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=5000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Transaction writes racing a settings-cache miss, checked for hangs.
+
+Each round empties ``settings_cache`` and then sends concurrent POST
+/transactions/, POST /transactions/batch and PUT /transactions/{id} for a
+user with budget alerts on, together with GET /usersettings/{user_id}, so a
+read can become the cache-miss leader while the writes are in their DB
+transactions. A round that does not finish within ``--timeout`` seconds
+counts as a hang, and the script exits non-zero on any hang or error.
+
+    python -m benchmarks.cache_contention
+    python -m benchmarks.cache_contention --rounds 100 --writers 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+from tortoise import Tortoise
+
+from server.db.main import MODELS_MODULES
+from server.index import app
+from server.services.entity_cache import settings_cache
+
+SETTINGS = {
+    "user_id": "contention",
+    "daily_spending_limit": 500,
+    "monthly_income": 30000,
+    "notify_over_budget": True,
+    "notify_low_saving": True,
+    "goal_description": "save",
+    "conclusion_routine": "weekly",
+}
+RECORD = {
+    "user_id": "contention",
+    "amount": 40,
+    "type": "expense",
+    "detail": "lunch",
+    "tag": "Food",
+}
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    transport = httpx.ASGITransport(app=app)
+    timings, hangs, errors = [], 0, []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        (await http.post("/usersettings/", json=SETTINGS)).raise_for_status()
+        created = await http.post("/transactions/", json=RECORD)
+        created.raise_for_status()
+        record_id = created.json()["body"]["id"]
+
+        for _ in range(args.rounds):
+            settings_cache.clear()
+            requests = [
+                *(
+                    http.post("/transactions/", json=RECORD)
+                    for _ in range(args.writers)
+                ),
+                http.post("/transactions/batch", json={"items": [RECORD] * 3}),
+                http.put(
+                    f"/transactions/{record_id}", json={**RECORD, "id": record_id}
+                ),
+                *(http.get("/usersettings/contention") for _ in range(args.readers)),
+            ]
+            start = time.perf_counter()
+            try:
+                responses = await asyncio.wait_for(
+                    asyncio.gather(*requests), args.timeout
+                )
+            except asyncio.TimeoutError:
+                hangs += 1
+                # The stuck requests hold the database; later rounds would too.
+                break
+            timings.append((time.perf_counter() - start) * 1000)
+            errors += [
+                f"{r.request.method} {r.request.url.path}: {r.status_code}"
+                for r in responses
+                if r.status_code != 200
+            ]
+    if not hangs:
+        await Tortoise.close_connections()
+
+    print(
+        json.dumps(
+            {
+                "benchmark": "cache_contention",
+                "rounds": args.rounds,
+                "completed": len(timings),
+                "hangs": hangs,
+                "errors": errors[:10],
+                "round_p50_ms": round(statistics.median(timings), 2)
+                if timings
+                else None,
+                "round_max_ms": round(max(timings), 2) if timings else None,
+            },
+            indent=2,
+        )
+    )
+    if hangs:
+        # The stuck tasks would keep asyncio.run from ever returning.
+        sys.stdout.flush()
+        os._exit(1)
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--writers", type=int, default=3)
+    parser.add_argument("--readers", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
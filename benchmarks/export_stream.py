@@ -0,0 +1,104 @@
+"""
+Peak memory of a full export vs the legacy JSON list endpoint.
+
+Seeds users with increasing history sizes and measures the tracemalloc peak
+while reading ``/transactions/export/{user_id}`` and
+``/transactions/user/{user_id}``. Export memory should stay flat.
+
+    python -m benchmarks.export_stream
+    python -m benchmarks.export_stream --sizes 1000 10000 100000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+import httpx
+from tortoise import Tortoise
+
+from server.db.main import MODELS_MODULES
+from server.index import app
+from server.services.transaction_export import export_transactions
+
+
+async def seed(http, user_id: str, rows: int):
+    for offset in range(0, rows, 5000):
+        items = [
+            {
+                "user_id": user_id,
+                "amount": float(i),
+                "type": "income" if i % 5 == 0 else "expense",
+                "detail": f"row {i} " + "x" * 40,
+                "tag": "bench",
+            }
+            for i in range(offset, min(rows, offset + 5000))
+        ]
+        response = await http.post("/transactions/batch", json={"items": items})
+        response.raise_for_status()
+
+
+async def peak(work):
+    tracemalloc.start()
+    start = time.perf_counter()
+    size = await work()
+    elapsed = time.perf_counter() - start
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak_bytes
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    transport = httpx.ASGITransport(app=app)
+    report = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for rows in args.sizes:
+            user_id = f"bench-{rows}"
+            await seed(http, user_id, rows)
+
+            async def export():
+                # Consume the generator directly: ASGITransport buffers bodies.
+                size = 0
+                async for chunk in export_transactions(user_id, args.format, args.gzip):
+                    size += len(chunk)
+                return size
+
+            async def legacy():
+                response = await http.get(f"/transactions/user/{user_id}")
+                return len(response.content)
+
+            export_size, export_s, export_peak = await peak(export)
+            legacy_size, legacy_s, legacy_peak = await peak(legacy)
+            report.append(
+                {
+                    "rows": rows,
+                    "export": {
+                        "bytes": export_size,
+                        "seconds": round(export_s, 3),
+                        "peak_mb": round(export_peak / 2**20, 2),
+                    },
+                    "legacy_list": {
+                        "bytes": legacy_size,
+                        "seconds": round(legacy_s, 3),
+                        "peak_mb": round(legacy_peak / 2**20, 2),
+                    },
+                }
+            )
+    await Tortoise.close_connections()
+    print(
+        json.dumps(
+            {"benchmark": "export_stream", "format": args.format, "results": report},
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,133 @@
+"""
+Bytes sent to the model and event-loop blocking for receipt uploads.
+
+Compares the old path (decode the upload with PIL on the event loop and let
+the SDK re-encode it at full resolution) with ``preprocess_images`` running
+in the executor. A ticker coroutine measures the worst event-loop stall.
+
+Uses a synthetic corpus of phone-sized receipt photos unless ``--corpus``
+points at a directory of real images.
+
+    python -m benchmarks.image_preprocess
+    python -m benchmarks.image_preprocess --corpus ~/receipts
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import pathlib
+import random
+import time
+
+import PIL.Image
+import PIL.ImageDraw
+
+from server.services.image_preprocess import preprocess_images
+
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789."
+
+
+def synthetic_receipt(seed: int, size=(3024, 4032)) -> bytes:
+    """A white, text-covered photo stored sideways with an EXIF rotation tag."""
+    rng = random.Random(seed)
+    width, height = size
+    img = PIL.Image.new("RGB", (height, width), (245, 243, 238))
+    draw = PIL.ImageDraw.Draw(img)
+    for y in range(80, width - 80, 48):
+        x = 120
+        while x < height - 400:
+            length = rng.randint(3, 10)
+            word = "".join(rng.choice(ALPHABET) for _ in range(length))
+            draw.text((x, y), word, fill=(20, 20, 20))
+            x += 30 * len(word)
+    # sensor noise so the JPEG is as large as a real photo
+    noise = PIL.Image.effect_noise(img.size, 12).convert("RGB")
+    img = PIL.Image.blend(img, noise, 0.08)
+    exif = PIL.Image.Exif()
+    exif[0x0112] = 6  # rotate 90 CW on display
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92, exif=exif)
+    return out.getvalue()
+
+
+def load_corpus(args):
+    if args.corpus:
+        root = pathlib.Path(args.corpus).expanduser()
+        paths = sorted(p for p in root.iterdir() if p.is_file())
+        return [p.read_bytes() for p in paths]
+    return [synthetic_receipt(i) for i in range(args.images)]
+
+
+def legacy_encode(data: bytes) -> bytes:
+    """What the old handler did on the loop: open with PIL, SDK re-encodes as-is."""
+    img = PIL.Image.open(io.BytesIO(data))
+    out = io.BytesIO()
+    img.save(out, format=img.format or "JPEG")
+    return out.getvalue()
+
+
+async def measure(work):
+    """Run ``work()`` while sampling loop lag every millisecond."""
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst = max(worst, time.perf_counter() - start - 0.001)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    result = await work()
+    elapsed = time.perf_counter() - start
+    done = True
+    await task
+    return result, elapsed, worst
+
+
+async def main(args):
+    corpus = load_corpus(args)
+
+    async def legacy():
+        return [legacy_encode(data) for data in corpus]
+
+    async def pipeline():
+        return [data for data, _ in await preprocess_images(corpus)]
+
+    legacy_out, legacy_time, legacy_stall = await measure(legacy)
+    new_out, new_time, new_stall = await measure(pipeline)
+
+    sent_before = sum(len(d) for d in legacy_out)
+    sent_after = sum(len(d) for d in new_out)
+    print(
+        json.dumps(
+            {
+                "benchmark": "image_preprocess",
+                "images": len(corpus),
+                "upload_bytes": sum(len(d) for d in corpus),
+                "legacy": {
+                    "bytes_sent": sent_before,
+                    "wall_s": round(legacy_time, 3),
+                    "max_loop_stall_ms": round(legacy_stall * 1000, 2),
+                },
+                "preprocessed": {
+                    "bytes_sent": sent_after,
+                    "wall_s": round(new_time, 3),
+                    "max_loop_stall_ms": round(new_stall * 1000, 2),
+                },
+                "bytes_reduction": round(1 - sent_after / sent_before, 4),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", default=None, help="directory of receipt images")
+    parser.add_argument("--images", type=int, default=6, help="synthetic corpus size")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,477 @@
+"""
+Mixed-workload load test with a fake Gemini backend.
+
+For every ``--scales`` preset the database is seeded with synthetic users,
+settings and transactions, then ``--concurrency`` virtual users send
+``--requests`` requests to the in-process app, picking endpoints from
+``WORKLOAD`` by weight. Gemini is replaced by ``FakeGemini``, which answers
+after ``--ai-latency`` ± ``--ai-jitter`` seconds. Reports throughput and
+p50/p95/p99 per endpoint as JSON; the seed makes runs repeatable. A request
+that takes longer than ``--request-timeout`` seconds is cancelled and
+counted as an error (status ``timeout``), so a hang fails the run instead
+of stalling it; the script exits non-zero if any request timed out.
+
+SQLite (a fresh temp file per scale) is used unless ``--db-url`` points at
+another database, whose tables are emptied first and so require
+``--reset-db``.
+
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --scales small,medium,large --requests 5000
+    python -m benchmarks.load_test --db-url postgres://... --reset-db --output run.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from types import SimpleNamespace
+
+import httpx
+import PIL.Image
+from tortoise import Tortoise
+
+import server.routers.ai as ai_module
+from server.db.main import get_tortoise_config
+from server.db.models import Transactions, User, UsersSetting
+from server.db.rollup import rebuild
+from server.index import app
+
+# name -> (users, transactions per user)
+SCALES = {
+    "small": (20, 50),
+    "medium": (100, 500),
+    "large": (500, 2000),
+}
+SEED_CHUNK = 5000
+TAGS = ["food", "transportation", "groceries", "shopping", "bills", "salary"]
+
+
+class FakeGemini:
+    """Stand-in for genai.Client with the ``aio.models`` calls ai.py makes."""
+
+    def __init__(self, latency: float, jitter: float, chunks: int, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunks = chunks
+        self.rng = rng
+        self.calls = 0
+        self.aio = self
+        self.models = self
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def _answer(self, contents) -> str:
+        if isinstance(contents, list):
+            # receipt analysis: [prompt, *image parts]
+            return '[{"amount": 42.0, "type": "expense", "detail": "fake", "tag": "food"}]'
+        return "## 📊 สรุปการเงิน\n- fake analysis\n" * 4
+
+    @staticmethod
+    def _usage(contents, text: str):
+        return SimpleNamespace(
+            prompt_token_count=len(str(contents)) // 4,
+            candidates_token_count=len(text) // 4,
+            thoughts_token_count=None,
+            cached_content_token_count=None,
+        )
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(self._delay())
+        text = self._answer(contents)
+        return SimpleNamespace(text=text, usage_metadata=self._usage(contents, text))
+
+    async def generate_content_stream(self, model, contents, config=None):
+        self.calls += 1
+        text = self._answer(contents)
+        step = max(1, len(text) // self.chunks)
+        pieces = [text[i : i + step] for i in range(0, len(text), step)]
+        delay = self._delay() / len(pieces)
+
+        async def chunks():
+            for index, piece in enumerate(pieces):
+                await asyncio.sleep(delay)
+                last = index == len(pieces) - 1
+                yield SimpleNamespace(
+                    text=piece,
+                    usage_metadata=self._usage(contents, text) if last else None,
+                )
+
+        return chunks()
+
+
+# --- Seeding ----------------------------------------------------------------
+
+
+async def reset_tables() -> None:
+    for models in Tortoise.apps.values():
+        for model in models.values():
+            await model.all().delete()
+
+
+async def seed(users: int, per_user: int, rng: random.Random) -> dict:
+    """Insert users, settings and transactions; return what the workload needs."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    user_rows = [
+        User(
+            id=uuid.uuid4(),
+            username=f"load-{i}",
+            email=f"load-{i}@example.com",
+            password=f"pw-{i}",
+        )
+        for i in range(users)
+    ]
+    await User.bulk_create(user_rows, batch_size=SEED_CHUNK)
+    await UsersSetting.bulk_create(
+        [
+            UsersSetting(
+                user_id=str(user.id),
+                daily_spending_limit=500,
+                monthly_income=30000,
+                notify_over_budget=True,
+                notify_low_saving=False,
+                goal_description="save for a trip",
+                conclusion_routine="weekly",
+            )
+            for user in user_rows
+        ],
+        batch_size=SEED_CHUNK,
+    )
+
+    batch = []
+    for user in user_rows:
+        for _ in range(per_user):
+            created = now - datetime.timedelta(seconds=rng.uniform(0, 180 * 86400))
+            income = rng.random() < 0.1
+            batch.append(
+                Transactions(
+                    user_id=str(user.id),
+                    amount=round(rng.expovariate(1 / (20000 if income else 250)), 2),
+                    type="income" if income else "expense",
+                    detail="seeded",
+                    tag="salary" if income else rng.choice(TAGS[:-1]),
+                    created_at=created,
+                    lastest_edit=created,
+                )
+            )
+            if len(batch) >= SEED_CHUNK:
+                await Transactions.bulk_create(batch)
+                batch = []
+    if batch:
+        await Transactions.bulk_create(batch)
+    await rebuild()
+
+    users_out = []
+    for user in user_rows:
+        ids = await Transactions.filter(user_id=str(user.id)).limit(20).values_list(
+            "id", flat=True
+        )
+        users_out.append(
+            {
+                "id": str(user.id),
+                "email": user.email,
+                "password": user.password,
+                "transaction_ids": [str(i) for i in ids],
+            }
+        )
+    return {"users": users_out}
+
+
+# --- Workload ---------------------------------------------------------------
+
+
+def _receipt_image() -> bytes:
+    buf = io.BytesIO()
+    PIL.Image.new("RGB", (1200, 1600), "white").save(buf, "JPEG", quality=85)
+    return buf.getvalue()
+
+
+RECEIPT = _receipt_image()
+
+
+def _transaction(user: dict, rng: random.Random) -> dict:
+    return {
+        "user_id": user["id"],
+        "amount": round(rng.expovariate(1 / 250), 2),
+        "type": "expense",
+        "detail": "load test",
+        "tag": rng.choice(TAGS[:-1]),
+    }
+
+
+def _settings(user: dict, rng: random.Random) -> dict:
+    return {
+        "user_id": user["id"],
+        "daily_spending_limit": rng.choice([300, 500, 800]),
+        "monthly_income": 30000,
+        "notify_over_budget": True,
+        "notify_low_saving": rng.random() < 0.5,
+        "goal_description": "save for a trip",
+        "conclusion_routine": "weekly",
+    }
+
+
+async def list_transactions(http, user, rng):
+    return await http.get(f"/transactions/user/{user['id']}", params={"limit": 50})
+
+
+async def summary(http, user, rng):
+    return await http.get(f"/transactions/summary/{user['id']}", params={"period": "monthly"})
+
+
+async def sync(http, user, rng):
+    since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+    return await http.get(f"/transactions/sync/{user['id']}", params={"since": since.isoformat()})
+
+
+async def create_transaction(http, user, rng):
+    return await http.post("/transactions/", json=_transaction(user, rng))
+
+
+async def update_transaction(http, user, rng):
+    record_id = rng.choice(user["transaction_ids"])
+    return await http.put(
+        f"/transactions/{record_id}", json={"id": record_id, **_transaction(user, rng)}
+    )
+
+
+async def verify_user(http, user, rng):
+    password = user["password"] if rng.random() < 0.9 else "wrong"
+    return await http.post("/users/verify", json={"email": user["email"], "password": password})
+
+
+async def get_settings(http, user, rng):
+    return await http.get(f"/usersettings/{user['id']}")
+
+
+async def update_settings(http, user, rng):
+    return await http.put(f"/usersettings/{user['id']}", json=_settings(user, rng))
+
+
+async def ai_analyze(http, user, rng):
+    return await http.get("/ai/analyze-transaction", params={"user_id": user["id"]})
+
+
+async def ai_prompt(http, user, rng):
+    return await http.post("/ai/prompt", json={"prompt": "How can I save more?"})
+
+
+async def ai_prompt_stream(http, user, rng):
+    return await http.post("/ai/prompt/stream", json={"prompt": "How can I save more?"})
+
+
+async def ai_receipt(http, user, rng):
+    return await http.post(
+        "/ai/analyze-receipt",
+        files={"image": ("receipt.jpg", RECEIPT, "image/jpeg")},
+        data={"user_id": user["id"]},
+    )
+
+
+# endpoint -> (weight, request)
+WORKLOAD = {
+    "GET /transactions/user/{user_id}": (30, list_transactions),
+    "GET /transactions/summary/{user_id}": (8, summary),
+    "GET /transactions/sync/{user_id}": (5, sync),
+    "POST /transactions/": (12, create_transaction),
+    "PUT /transactions/{record_id}": (5, update_transaction),
+    "POST /users/verify": (10, verify_user),
+    "GET /usersettings/{user_id}": (10, get_settings),
+    "PUT /usersettings/{user_id}": (3, update_settings),
+    "GET /ai/analyze-transaction": (4, ai_analyze),
+    "POST /ai/prompt": (5, ai_prompt),
+    "POST /ai/prompt/stream": (3, ai_prompt_stream),
+    "POST /ai/analyze-receipt": (2, ai_receipt),
+}
+
+
+def percentile(ordered: list, pct: float) -> float:
+    """Linear interpolation between closest ranks of a sorted list."""
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = pct / 100 * (len(ordered) - 1)
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def endpoint_report(latencies: list, statuses: Counter, errors: int, wall: float) -> dict:
+    ordered = sorted(latencies)
+    report = {
+        "count": len(ordered),
+        "errors": errors,
+        "status": dict(sorted(statuses.items())),
+        "rps": round(len(ordered) / wall, 2),
+    }
+    if ordered:
+        report.update(
+            {
+                "p50_ms": round(percentile(ordered, 50), 2),
+                "p95_ms": round(percentile(ordered, 95), 2),
+                "p99_ms": round(percentile(ordered, 99), 2),
+                "max_ms": round(ordered[-1], 2),
+            }
+        )
+    return report
+
+
+async def run_workload(http, users: list, args) -> dict:
+    names = list(WORKLOAD)
+    weights = [WORKLOAD[name][0] for name in names]
+    latencies = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = Counter()
+    remaining = {"warmup": args.warmup, "measured": args.requests}
+
+    async def worker(index: int):
+        rng = random.Random(args.seed * 1000 + index)
+        while remaining["warmup"] + remaining["measured"] > 0:
+            measured = remaining["warmup"] == 0
+            remaining["measured" if measured else "warmup"] -= 1
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(
+                    WORKLOAD[name][1](http, rng.choice(users), rng),
+                    args.request_timeout,
+                )
+                status = response.status_code
+            except asyncio.TimeoutError:
+                logging.getLogger(__name__).warning(f"{name} timed out")
+                status = "timeout"
+            except Exception as e:
+                logging.getLogger(__name__).warning(f"{name} raised {e!r}")
+                status = "exception"
+            elapsed = (time.perf_counter() - start) * 1000
+            if not measured:
+                continue
+            latencies[name].append(elapsed)
+            statuses[name][str(status)] += 1
+            if isinstance(status, str) or status >= 500:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(i) for i in range(args.concurrency)])
+    wall = time.perf_counter() - start
+
+    total = sum(len(v) for v in latencies.values())
+    return {
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(total / wall, 2),
+        "errors": sum(errors.values()),
+        "timeouts": sum(s["timeout"] for s in statuses.values()),
+        "endpoints": {
+            name: endpoint_report(latencies[name], statuses[name], errors[name], wall)
+            for name in names
+            if latencies[name]
+        },
+    }
+
+
+async def run_scale(name: str, db_url: str, args) -> dict:
+    users, per_user = SCALES[name]
+    rng = random.Random(args.seed)
+    os.environ["DB_URL"] = db_url
+    await Tortoise.init(config=get_tortoise_config())
+    await Tortoise.generate_schemas(safe=True)
+    try:
+        if args.db_url:
+            await reset_tables()
+        start = time.perf_counter()
+        seeded = await seed(users, per_user, rng)
+        seed_s = time.perf_counter() - start
+
+        fake = FakeGemini(args.ai_latency, args.ai_jitter, args.ai_chunks, rng)
+        ai_module.client = fake
+        ai_module.receipt_cache.clear_memory()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=None
+        ) as http:
+            result = await run_workload(http, seeded["users"], args)
+        return {
+            "scale": name,
+            "users": users,
+            "transactions": users * per_user,
+            "seed_s": round(seed_s, 3),
+            "gemini_calls": fake.calls,
+            **result,
+        }
+    finally:
+        await Tortoise.close_connections()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    if args.db_url and not args.reset_db:
+        raise SystemExit("--db-url empties every table first; pass --reset-db to confirm")
+    # Console logging per request would dominate the timings.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    scales = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.scales.split(","):
+            db_url = args.db_url or f"sqlite://{os.path.join(tmp, name + '.sqlite3')}"
+            scales.append(await run_scale(name, db_url, args))
+
+    report = {
+        "benchmark": "load_test",
+        "commit": git_commit(),
+        "database": "sqlite" if not args.db_url else args.db_url.split(":", 1)[0],
+        "config": {
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "request_timeout_s": args.request_timeout,
+            "seed": args.seed,
+            "ai_latency_s": args.ai_latency,
+            "ai_jitter_s": args.ai_jitter,
+            "weights": {name: weight for name, (weight, _) in WORKLOAD.items()},
+        },
+        "scales": scales,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    if any(scale["timeouts"] for scale in scales):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scales", default="small,medium", help=f"comma-separated: {', '.join(SCALES)}")
+    parser.add_argument("--requests", type=int, default=2000, help="measured requests per scale")
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--request-timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--ai-latency", type=float, default=0.2)
+    parser.add_argument("--ai-jitter", type=float, default=0.05)
+    parser.add_argument("--ai-chunks", type=int, default=8)
+    parser.add_argument("--db-url", default=None, help="defaults to a temporary SQLite file")
+    parser.add_argument("--reset-db", action="store_true")
+    parser.add_argument("--output", default=None, help="also write the JSON report here")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""
+Analysis prompt size and build time as transaction history grows.
+
+Seeds one user with 100 .. 100k synthetic transactions (plus rollups) in
+SQLite and compares the old one-line-per-row prompt with the bounded digest.
+
+    python -m benchmarks.prompt_digest
+    python -m benchmarks.prompt_digest --sizes 100 1000 10000
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+
+from tortoise import Tortoise
+
+from server.db import rollup
+from server.db.main import MODELS_MODULES
+from server.db.models import Transactions
+from server.services.prompt_digest import estimate_tokens, load_digest, render_digest
+
+TAGS = ["food", "transportation", "groceries", "shopping", "bills", "salary"]
+MERCHANTS = [
+    "7-Eleven", "Grab", "Lotus's", "Big C", "MRT", "Starbucks", "ค่าไฟ", "Shopee"
+]
+
+
+async def seed(user_id: str, rows: int, rng: random.Random) -> None:
+    start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+    batch = []
+    for i in range(rows):
+        income = rng.random() < 0.1
+        amount = rng.uniform(20000, 40000) if income else rng.expovariate(1 / 250)
+        minutes = rng.randrange(0, 60 * 24 * 1000)
+        batch.append(
+            Transactions(
+                user_id=user_id,
+                amount=round(amount, 2),
+                type="income" if income else "expense",
+                detail="salary" if income else rng.choice(MERCHANTS),
+                tag="salary" if income else rng.choice(TAGS[:-1]),
+                created_at=start + datetime.timedelta(minutes=minutes),
+            )
+        )
+    await Transactions.bulk_create(batch, batch_size=5000)
+    await rollup.rebuild(user_id)
+
+
+def legacy_prompt(transactions) -> str:
+    return "\n".join(
+        f"{[t['amount']]}, {t['type']}, {t['detail']}, {t['tag']}, {t['created_at']}"
+        for t in transactions
+    )
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    rng = random.Random(42)
+    results = []
+    for size in args.sizes:
+        user_id = f"bench-{size}"
+        await seed(user_id, size, rng)
+
+        start = time.perf_counter()
+        rows = await Transactions.filter(user_id=user_id).values(
+            "amount", "type", "detail", "tag", "created_at"
+        )
+        legacy = legacy_prompt(rows)
+        legacy_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        digest = render_digest(await load_digest(user_id), args.budget)
+        digest_s = time.perf_counter() - start
+
+        results.append(
+            {
+                "rows": size,
+                "legacy": {
+                    "chars": len(legacy),
+                    "est_tokens": estimate_tokens(legacy),
+                    "build_ms": round(legacy_s * 1000, 2),
+                },
+                "digest": {
+                    "chars": len(digest),
+                    "est_tokens": estimate_tokens(digest),
+                    "build_ms": round(digest_s * 1000, 2),
+                },
+            }
+        )
+    await Tortoise.close_connections()
+    report = {"benchmark": "prompt_digest", "token_budget": args.budget}
+    print(json.dumps({**report, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000]
+    )
+    parser.add_argument("--budget", type=int, default=1500)
+    asyncio.run(main(parser.parse_args()))
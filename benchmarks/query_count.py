@@ -0,0 +1,173 @@
+"""
+Statements per request for the write endpoints, checked against a budget.
+
+Counts every statement Tortoise sends (its ``tortoise.db_client`` debug log,
+so BEGIN/COMMIT/SAVEPOINT are not included) while calling each endpoint
+once against in-process SQLite, and exits non-zero if any endpoint goes
+over its budget. On Postgres, PUT /transactions/{id} is one statement less
+(the old row is locked and returned by the UPDATE itself).
+
+    python -m benchmarks.query_count
+"""
+
+import asyncio
+import json
+import logging
+import sys
+
+import httpx
+from tortoise import Tortoise
+
+from server.db.main import MODELS_MODULES
+from server.index import app
+
+# endpoint -> maximum statements (SQLite)
+BUDGETS = {
+    "POST /users/": 1,
+    "POST /users/ (duplicate)": 2,
+    "POST /transactions/": 3,
+    "PUT /transactions/{id}": 4,
+    "PUT /transactions/{id} (missing)": 1,
+    "DELETE /transactions/{id}": 5,
+    "DELETE /transactions/{id} (missing)": 1,
+    "PUT /usersettings/{user_id}": 1,
+    "PUT /usersettings/{user_id} (missing)": 1,
+    "DELETE /usersettings/{user_id}": 1,
+    "DELETE /usersettings/{user_id} (missing)": 1,
+}
+
+MISSING_ID = "00000000-0000-0000-0000-000000000000"
+
+
+class StatementCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+
+async def main():
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    counter = StatementCounter()
+    db_log = logging.getLogger("tortoise.db_client")
+    db_log.addHandler(counter)
+    db_log.setLevel(logging.DEBUG)
+    db_log.propagate = False
+
+    settings = {
+        "user_id": "bench",
+        "daily_spending_limit": 500,
+        "monthly_income": 30000,
+        "notify_over_budget": True,
+        "notify_low_saving": False,
+        "goal_description": "save",
+        "conclusion_routine": "weekly",
+    }
+    record = {
+        "user_id": "bench",
+        "amount": 120,
+        "type": "expense",
+        "detail": "lunch",
+        "tag": "Food",
+    }
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+
+        async def measure(name, method, url, expect, **kwargs):
+            counter.count = 0
+            response = await http.request(method, url, **kwargs)
+            assert response.status_code == expect, (name, response.status_code)
+            results[name] = counter.count
+            return response
+
+        await measure(
+            "POST /users/",
+            "POST",
+            "/users/",
+            200,
+            json={"username": "bench", "email": "b@x", "password": "p"},
+        )
+        await measure(
+            "POST /users/ (duplicate)",
+            "POST",
+            "/users/",
+            400,
+            json={"username": "other", "email": "b@x", "password": "p"},
+        )
+        # Warm the rollup bucket so the measured create is the steady state.
+        await http.post("/transactions/", json=record)
+        created = await measure(
+            "POST /transactions/", "POST", "/transactions/", 200, json=record
+        )
+        record_id = created.json()["body"]["id"]
+        await measure(
+            "PUT /transactions/{id}",
+            "PUT",
+            f"/transactions/{record_id}",
+            200,
+            json={**record, "id": record_id, "amount": 80},
+        )
+        await measure(
+            "PUT /transactions/{id} (missing)",
+            "PUT",
+            f"/transactions/{MISSING_ID}",
+            404,
+            json={**record, "id": MISSING_ID},
+        )
+        await measure(
+            "DELETE /transactions/{id}", "DELETE", f"/transactions/{record_id}", 200
+        )
+        await measure(
+            "DELETE /transactions/{id} (missing)",
+            "DELETE",
+            f"/transactions/{MISSING_ID}",
+            404,
+        )
+        await http.post("/usersettings/", json=settings)
+        await measure(
+            "PUT /usersettings/{user_id}",
+            "PUT",
+            "/usersettings/bench",
+            200,
+            json={**settings, "monthly_income": 35000},
+        )
+        await measure(
+            "PUT /usersettings/{user_id} (missing)",
+            "PUT",
+            "/usersettings/nobody",
+            404,
+            json={**settings, "user_id": "nobody"},
+        )
+        await measure(
+            "DELETE /usersettings/{user_id}", "DELETE", "/usersettings/bench", 200
+        )
+        await measure(
+            "DELETE /usersettings/{user_id} (missing)",
+            "DELETE",
+            "/usersettings/bench",
+            404,
+        )
+    await Tortoise.close_connections()
+
+    over = {name: n for name, n in results.items() if n > BUDGETS[name]}
+    print(
+        json.dumps(
+            {
+                "benchmark": "query_count",
+                "statements": results,
+                "budgets": BUDGETS,
+                "over_budget": over,
+            },
+            indent=2,
+        )
+    )
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,149 @@
+"""
+Scheduled summary pass: statements and model calls per user, and resume.
+
+Seeds ``--users`` users on the weekly routine with two weeks of history in
+in-process SQLite, then:
+
+- ``per_user``: what on-demand summaries cost, one ``load_digest`` each;
+- ``batched``: ``run_routine`` for last week against ``FakeGemini``,
+  cancelled once about half the users are done and then resumed, reporting
+  model calls and stored summaries. Both must match the users with
+  activity: calls in flight at the cancel are finished and stored, so
+  ``repeated_calls`` is 0 (only a killed process repeats them).
+
+    python -m benchmarks.scheduled_summaries
+    python -m benchmarks.scheduled_summaries --users 1000 --ai-latency 0.05
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import random
+import time
+import uuid
+
+from tortoise import Tortoise
+
+from benchmarks.load_test import FakeGemini
+from benchmarks.query_count import StatementCounter
+from server.db import rollup
+from server.db.main import MODELS_MODULES
+from server.db.models import ScheduledSummary, Transactions, User, UsersSetting
+from server.services import summaries
+from server.services.prompt_digest import load_digest
+
+TAGS = ["food", "transportation", "groceries", "shopping", "bills", "salary"]
+
+
+async def seed(users: int, per_user: int, today: datetime.date, rng) -> list:
+    end = datetime.datetime.combine(today, datetime.time(), datetime.timezone.utc)
+    ids = [uuid.uuid4() for _ in range(users)]
+    await User.bulk_create(
+        [
+            User(id=i, username=f"sum-{n}", email=f"sum-{n}@example.com", password="pw")
+            for n, i in enumerate(ids)
+        ]
+    )
+    await UsersSetting.bulk_create(
+        [
+            UsersSetting(
+                user_id=str(i),
+                daily_spending_limit=500,
+                monthly_income=30000,
+                notify_over_budget=False,
+                notify_low_saving=False,
+                goal_description="เก็บเงินไปเที่ยว",
+                conclusion_routine=rng.choice(["weekly", "Weekly", "monthly"]),
+            )
+            for i in ids
+        ]
+    )
+    rows = []
+    for i in ids:
+        for _ in range(per_user):
+            income = rng.random() < 0.1
+            rows.append(
+                Transactions(
+                    user_id=str(i),
+                    amount=round(rng.expovariate(1 / (20000 if income else 250)), 2),
+                    type="income" if income else "expense",
+                    detail="seeded",
+                    tag="salary" if income else rng.choice(TAGS[:-1]),
+                    created_at=end - datetime.timedelta(seconds=rng.uniform(0, 14 * 86400)),
+                )
+            )
+    await Transactions.bulk_create(rows, batch_size=5000)
+    await rollup.rebuild()
+    return [str(i) for i in ids]
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    rng = random.Random(args.seed)
+    today = datetime.date(2026, 10, 19)  # a Monday: last week is complete
+    ids = await seed(args.users, args.per_user, today, rng)
+    due = await UsersSetting.filter(conclusion_routine__iexact="weekly").count()
+
+    counter = StatementCounter()
+    db_log = logging.getLogger("tortoise.db_client")
+    db_log.addHandler(counter)
+    db_log.setLevel(logging.DEBUG)
+    db_log.propagate = False
+
+    started = time.perf_counter()
+    for user_id in ids[: args.sample]:
+        await load_digest(user_id)
+    per_user = {
+        "users": args.sample,
+        "statements_per_user": round(counter.count / args.sample, 2),
+        "ms_per_user": round((time.perf_counter() - started) * 1000 / args.sample, 2),
+    }
+
+    fake = FakeGemini(args.ai_latency, args.ai_latency / 2, 1, rng)
+    counter.count = 0
+    started = time.perf_counter()
+    task = asyncio.create_task(summaries.run_routine("weekly", today, client=fake))
+    while fake.calls < due // 2:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    calls_before_kill = fake.calls
+    stored_before_kill = await ScheduledSummary.all().count()
+    resumed = await summaries.run_routine("weekly", today, client=fake)
+    elapsed = time.perf_counter() - started
+    stored = await ScheduledSummary.filter(routine="weekly").count()
+
+    report = {
+        "benchmark": "scheduled_summaries",
+        "users": args.users,
+        "due_weekly": due,
+        "batch_size": summaries.SUMMARY_BATCH_SIZE,
+        "concurrency": summaries.SUMMARY_CONCURRENCY,
+        "per_user": per_user,
+        "batched": {
+            "statements_per_user": round(counter.count / due, 2),
+            "seconds": round(elapsed, 3),
+            "users_per_s": round(due / elapsed, 1),
+            "calls_before_kill": calls_before_kill,
+            "stored_before_kill": stored_before_kill,
+            "resumed": resumed,
+            "model_calls": fake.calls,
+            "stored": stored,
+            "repeated_calls": fake.calls - stored,
+        },
+    }
+    print(json.dumps(report, indent=2, default=str))
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--per-user", type=int, default=60)
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--ai-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
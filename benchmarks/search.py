@@ -0,0 +1,155 @@
+"""
+Latency of /transactions/search as one user's history grows.
+
+Seeds ``--users`` users with ``--rows`` transactions in total (merchant
+names in English and Thai), creates the search indexes, then times each
+query in ``QUERIES`` ``--repeat`` times through the app and reports the
+median and p95 in milliseconds. Against Postgres it also prints the plan
+of the first query, which should be a bitmap scan of the
+``transactions_search_*`` indexes.
+
+SQLite (in-process, no search index) is used unless ``--db-url`` points at
+another database, whose tables are emptied first and so require
+``--reset-db``.
+
+    python -m benchmarks.search
+    python -m benchmarks.search --db-url postgres://... --reset-db --rows 2000000
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+from tortoise import Tortoise, connections
+
+from benchmarks.load_test import reset_tables
+from server.db.main import get_tortoise_config
+from server.db.models import Transactions
+from server.db.search import ensure_search_indexes
+from server.index import app
+
+MERCHANTS = [
+    "7-Eleven", "Grab", "GrabFood", "Lotus's", "Big C", "MRT", "BTS", "Starbucks",
+    "ค่าไฟ", "ค่าน้ำ", "ข้าวมันไก่", "ก๋วยเตี๋ยวเรือ", "Shopee", "Lazada", "Makro",
+]
+TAGS = ["food", "transportation", "groceries", "shopping", "bills"]
+# (label, query parameters)
+QUERIES = [
+    ("word", {"q": "grab"}),
+    ("brand", {"q": "7-eleven"}),
+    ("thai", {"q": "มันไก่"}),
+    ("typo", {"q": "starbuks"}),
+    ("filtered", {"q": "grab", "min_amount": 100, "start_date": "2026-01-01"}),
+    ("no_match", {"q": "zzzz"}),
+]
+SEED_CHUNK = 5000
+
+
+async def seed(users: int, rows: int, rng: random.Random) -> None:
+    end = datetime.datetime(2026, 10, 1, tzinfo=datetime.timezone.utc)
+    batch = []
+    for i in range(rows):
+        created = end - datetime.timedelta(seconds=rng.uniform(0, 3 * 365 * 86400))
+        batch.append(
+            Transactions(
+                user_id=f"search-{i % users}",
+                amount=round(rng.expovariate(1 / 250), 2),
+                type="expense",
+                detail=f"{rng.choice(MERCHANTS)} #{rng.randrange(1000)}",
+                tag=rng.choice(TAGS),
+                created_at=created,
+                lastest_edit=created,
+            )
+        )
+        if len(batch) >= SEED_CHUNK:
+            await Transactions.bulk_create(batch)
+            batch = []
+    if batch:
+        await Transactions.bulk_create(batch)
+
+
+async def explain(params: dict) -> list:
+    conn = connections.get("default")
+    if conn.capabilities.dialect != "postgres":
+        return []
+    rows = await conn.execute_query_dict(
+        "EXPLAIN (ANALYZE, COSTS OFF) "
+        "SELECT id FROM transactions WHERE user_id = $1 AND ("
+        "to_tsvector('simple'::regconfig, (detail || ' ' || tag)) "
+        "@@ websearch_to_tsquery('simple', $2) "
+        "OR lower((detail || ' ' || tag)) LIKE $3 "
+        "OR $2 <% lower((detail || ' ' || tag))) "
+        "ORDER BY created_at DESC, id DESC LIMIT 51",
+        ["search-0", params["q"], f"%{params['q']}%"],
+    )
+    return [row["QUERY PLAN"] for row in rows]
+
+
+async def run(db_url: str, args) -> dict:
+    os.environ["DB_URL"] = db_url
+    await Tortoise.init(config=get_tortoise_config())
+    await Tortoise.generate_schemas(safe=True)
+    if args.db_url:
+        await reset_tables()
+    await seed(args.users, args.rows, random.Random(args.seed))
+    await ensure_search_indexes()
+
+    report = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for label, params in QUERIES:
+            timings, found = [], 0
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = await http.get("/transactions/search/search-0", params=params)
+                timings.append((time.perf_counter() - started) * 1000)
+                response.raise_for_status()
+                found = len(response.json()["body"])
+            timings.sort()
+            report[label] = {
+                "page_rows": found,
+                "p50_ms": round(statistics.median(timings), 2),
+                "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 2),
+            }
+    plan = await explain(QUERIES[0][1])
+    await Tortoise.close_connections()
+    return {"queries": report, "plan": plan}
+
+
+async def main(args):
+    if args.db_url and not args.reset_db:
+        raise SystemExit("--db-url empties every table first; pass --reset-db to confirm")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = args.db_url or f"sqlite://{os.path.join(tmp, 'search.sqlite3')}"
+        result = await run(db_url, args)
+    print(
+        json.dumps(
+            {
+                "benchmark": "search",
+                "database": db_url.split(":", 1)[0],
+                "rows": args.rows,
+                "rows_per_user": args.rows // args.users,
+                **result,
+            },
+            indent=2,
+            ensure_ascii=False,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--db-url", default=None)
+    parser.add_argument("--reset-db", action="store_true")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
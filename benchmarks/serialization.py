@@ -0,0 +1,133 @@
+"""
+Serialization cost of transaction lists: model instances vs projections.
+
+"legacy" is what the list endpoints used to do: load full ``Transactions``
+model instances, walk them with ``jsonable_encoder`` and ``json.dumps``.
+"projected" is the current path: ``.values()`` rows of the dashboard
+columns, validated and dumped to JSON bytes by the ``PageData`` response
+model in pydantic-core. The end-to-end request time for
+``/transactions/user/{user_id}`` is reported as well.
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --rows 10000 --repeat 5
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from tortoise import Tortoise
+
+from server.db.main import MODELS_MODULES
+from server.db.models import Transactions
+from server.index import app
+from server.routers.transactionRoute import TRANSACTION_OUT_FIELDS
+from server.schemes import PageData, TransactionOut
+
+USER_ID = "bench-serialization"
+
+
+async def seed(rows: int):
+    await Transactions.bulk_create(
+        [
+            Transactions(
+                user_id=USER_ID,
+                amount=float(i % 977),
+                type="income" if i % 5 == 0 else "expense",
+                detail=f"merchant {i % 300} receipt line",
+                tag=("Food", "Transportation", "Shopping", "Salary")[i % 4],
+            )
+            for i in range(rows)
+        ],
+        batch_size=1000,
+    )
+
+
+def envelope(records):
+    return {"body": records, "message": "Records retrieved successfully", "success": True}
+
+
+async def timed(work, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = await work()
+        samples.append(time.perf_counter() - start)
+    return size, statistics.median(samples)
+
+
+async def main(args):
+    await Tortoise.init(db_url="sqlite://:memory:", modules=MODELS_MODULES)
+    await Tortoise.generate_schemas()
+    await seed(args.rows)
+    query = Transactions.filter(user_id=USER_ID).order_by("-created_at", "-id")
+    adapter = TypeAdapter(PageData[List[TransactionOut]])
+
+    models = await query
+    rows = await query.values(*TRANSACTION_OUT_FIELDS)
+
+    async def legacy_serialize():
+        return len(json.dumps(jsonable_encoder(envelope(models))).encode())
+
+    async def projected_serialize():
+        return len(adapter.dump_json(adapter.validate_python(envelope(rows))))
+
+    async def legacy_fetch():
+        return len(await query)
+
+    async def projected_fetch():
+        return len(await query.values(*TRANSACTION_OUT_FIELDS))
+
+    legacy_bytes, legacy_ser = await timed(legacy_serialize, args.repeat)
+    projected_bytes, projected_ser = await timed(projected_serialize, args.repeat)
+    _, legacy_db = await timed(legacy_fetch, args.repeat)
+    _, projected_db = await timed(projected_fetch, args.repeat)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+
+        async def request():
+            response = await http.get(f"/transactions/user/{USER_ID}")
+            response.raise_for_status()
+            return len(response.content)
+
+        _, request_s = await timed(request, args.repeat)
+    await Tortoise.close_connections()
+
+    per_10k = 10000 / args.rows
+    print(
+        json.dumps(
+            {
+                "benchmark": "serialization",
+                "rows": args.rows,
+                "ms_per_10k_rows": {
+                    "legacy": {
+                        "fetch": round(legacy_db * per_10k * 1000, 1),
+                        "serialize": round(legacy_ser * per_10k * 1000, 1),
+                        "bytes": legacy_bytes,
+                    },
+                    "projected": {
+                        "fetch": round(projected_db * per_10k * 1000, 1),
+                        "serialize": round(projected_ser * per_10k * 1000, 1),
+                        "bytes": projected_bytes,
+                    },
+                    "request_end_to_end": round(request_s * per_10k * 1000, 1),
+                },
+                "serialize_speedup": round(legacy_ser / projected_ser, 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,112 @@
+"""
+Cold-start cost of the API: import time and time to first response.
+
+Every run is a fresh interpreter that imports ``server.index``, runs the app
+lifespan and serves one request, against an already migrated SQLite file.
+``eager`` reproduces the old startup (google.genai, Pillow and the Gemini
+client loaded up front, schemas generated); ``fast_startup`` is
+``FAST_STARTUP=true``. Reports the median and minimum of each mode over
+``--runs``, and which heavy modules were loaded by the first response.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 10 --path /transactions/
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from tortoise import run_async
+
+from server.db.main import MODELS_MODULES
+from server.db.migrate import migrate
+
+HEAVY_MODULES = ["google.genai", "PIL"]
+
+# Runs in the child interpreter; prints one JSON line.
+CHILD = """
+import asyncio, json, sys, time
+
+start = time.perf_counter()
+if sys.argv[2] == "eager":
+    # What every cold start paid before these imports were made lazy.
+    import PIL.Image, PIL.ImageOps
+    from google import genai
+    genai.Client(api_key="bench")
+from server.index import app
+imported = time.perf_counter()
+
+import httpx
+
+async def first_response():
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            response = await http.get(sys.argv[1])
+            response.raise_for_status()
+
+asyncio.run(first_response())
+done = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_response_ms": (done - start) * 1000,
+    "loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once(db_url: str, fast: bool, path: str) -> dict:
+    env = dict(os.environ, DB_URL=db_url, FAST_STARTUP="true" if fast else "false")
+    env.pop("DB_GENERATE_SCHEMAS", None)
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, path, "lazy" if fast else "eager"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def summarize(runs: list) -> dict:
+    report = {}
+    for key in ("import_ms", "first_response_ms"):
+        values = [r[key] for r in runs]
+        report[key] = {
+            "median": round(statistics.median(values), 1),
+            "min": round(min(values), 1),
+        }
+    report["heavy_modules_loaded"] = runs[-1]["loaded"]
+    return report
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite://{os.path.join(tmp, 'startup.sqlite3')}"
+        run_async(
+            migrate(
+                {
+                    "connections": {"default": db_url},
+                    "apps": {
+                        label: {"models": modules, "default_connection": "default"}
+                        for label, modules in MODELS_MODULES.items()
+                    },
+                }
+            )
+        )
+        report = {"runs": args.runs, "path": args.path}
+        for mode, fast in (("eager", False), ("fast_startup", True)):
+            runs = [run_once(db_url, fast, args.path) for _ in range(args.runs)]
+            report[mode] = summarize(runs)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/health")
+    main(parser.parse_args())
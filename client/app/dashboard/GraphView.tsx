@@ -1,6 +1,6 @@
 "use client";
 
-import React, { useState, useMemo } from "react";
+import React, { useState, useMemo, useEffect } from "react";
 import {
   LineChart,
   Line,
@@ -14,16 +14,12 @@ import {
   Pie,
   Cell,
 } from "recharts";
-import {
-  format,
-  parseISO,
-  startOfWeek,
-  startOfMonth,
-  startOfYear,
-} from "date-fns";
-import { Transaction } from "@/lib/schema/transaction";
+import { api } from "../api";
+import { Transaction, TransactionSummary } from "@/lib/schema/transaction";
 
 interface GraphViewProps {
+  userId?: string;
+  // Refetch the summary whenever the dashboard's list changes.
   transactions: Transaction[];
 }
 
@@ -36,56 +32,52 @@ const COLORS = [
   "#82ca9d",
 ];
 
-export default function GraphView({ transactions }: GraphViewProps) {
+export default function GraphView({ userId, transactions }: GraphViewProps) {
   const [timeframe, setTimeframe] = useState("monthly"); // daily, weekly, monthly, yearly
   const [pieChartMode, setPieChartMode] = useState<"expense" | "income">(
     "expense"
   );
+  const [summary, setSummary] = useState<TransactionSummary | null>(null);
 
-  const lineChartData = useMemo(() => {
-    if (!transactions) return [];
-
-    const formatters: { [key: string]: (date: Date) => string } = {
-      daily: (date) => format(date, "yyyy-MM-dd"),
-      weekly: (date) => format(startOfWeek(date), "yyyy-MM-dd"),
-      monthly: (date) => format(startOfMonth(date), "yyyy-MM"),
-      yearly: (date) => format(startOfYear(date), "yyyy"),
+  // Totals are grouped by the server in the browser's time zone.
+  useEffect(() => {
+    if (!userId) return;
+    let cancelled = false;
+    api
+      .get(`/transactions/summary/${userId}`, {
+        period: timeframe,
+        tz: Intl.DateTimeFormat().resolvedOptions().timeZone,
+      })
+      .then((response) => {
+        if (!cancelled && response?.success) {
+          setSummary(response.body as TransactionSummary);
+        }
+      })
+      .catch(() => {
+        if (!cancelled) setSummary(null);
+      });
+    return () => {
+      cancelled = true;
     };
+  }, [userId, timeframe, transactions]);
 
-    const formatter = formatters[timeframe];
-
-    const grouped = transactions.reduce((acc, t) => {
-      if (!t.created_at) return acc;
-      const dateKey = formatter(parseISO(t.created_at));
-      if (!acc[dateKey]) {
-        acc[dateKey] = { date: dateKey, income: 0, expense: 0 };
-      }
-      if (t.type === "income") {
-        acc[dateKey].income += t.amount;
-      } else {
-        acc[dateKey].expense += t.amount;
-      }
-      return acc;
-    }, {} as { [key: string]: { date: string; income: number; expense: number } });
-
-    return Object.values(grouped).sort((a, b) => a.date.localeCompare(b.date));
-  }, [transactions, timeframe]);
-
-  const pieChartData = useMemo(() => {
-    const filtered = transactions.filter(
-      (t) => t.type === pieChartMode && t.tag
-    );
-    const grouped = filtered.reduce((acc, t) => {
-      const tag = t.tag || "Uncategorized";
-      if (!acc[tag]) {
-        acc[tag] = 0;
-      }
-      acc[tag] += t.amount;
-      return acc;
-    }, {} as { [key: string]: number });
+  const lineChartData = useMemo(
+    () =>
+      (summary?.buckets ?? []).map(({ date, income, expense }) => ({
+        date,
+        income,
+        expense,
+      })),
+    [summary]
+  );
 
-    return Object.entries(grouped).map(([name, value]) => ({ name, value }));
-  }, [transactions, pieChartMode]);
+  const pieChartData = useMemo(
+    () =>
+      (summary?.tags ?? [])
+        .filter((t) => t.tag && t[pieChartMode] > 0)
+        .map((t) => ({ name: t.tag, value: t[pieChartMode] })),
+    [summary, pieChartMode]
+  );
 
   return (
     <div className="space-y-6">
@@ -146,7 +146,7 @@ export default function Dashboard() {
           ) : (
             // Render Graph View
             <div className="lg:col-span-3">
-              <GraphView transactions={transactions} />
+              <GraphView userId={userId} transactions={transactions} />
             </div>
           )
         ) : (
@@ -31,3 +31,17 @@ export type Transaction = {
 };
 
 export type TransactionCreate = Omit<Transaction, "id" | "created_at">;
+
+// GET /transactions/summary/{user_id}
+export type SummaryTotals = {
+  income: number;
+  expense: number;
+  count: number;
+};
+
+export type TransactionSummary = {
+  period: "daily" | "weekly" | "monthly" | "yearly";
+  tz: string;
+  buckets: (SummaryTotals & { date: string })[];
+  tags: (SummaryTotals & { tag: string })[];
+};
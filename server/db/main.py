@@ -1,21 +1,43 @@
 import os
+from contextlib import asynccontextmanager
 from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
+from tortoise.backends.base.config_generator import expand_db_url
 from tortoise.contrib.fastapi import register_tortoise
 from fastapi import FastAPI
 import logging
 import traceback
 
+from server.db.pool import pool_profile, pool_settings
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def connect_to_db(app: FastAPI):
+MODELS_MODULES = {"models": ["server.db.models"]}
+
+# Fast-startup mode (default on Vercel) skips schema generation on every
+# cold start; run ``python -m server.db.migrate`` on deploy instead.
+FAST_STARTUP = (
+    os.getenv("FAST_STARTUP", "true" if os.getenv("VERCEL") else "false").lower()
+    == "true"
+)
+GENERATE_SCHEMAS = (
+    os.getenv("DB_GENERATE_SCHEMAS", "false" if FAST_STARTUP else "true").lower()
+    == "true"
+)
+
+
+def get_tortoise_db_url():
+    """Read DB_URL from the environment and convert it for Tortoise.
+
+    Returns None when the variable is missing or cannot be parsed.
+    """
     DB_URL = os.getenv("DB_URL")
 
     if not DB_URL:
         logger.error("CRITICAL: DB_URL is not set in environment variables.")
-        return
+        return None
 
     logger.info(f"Raw DB_URL received: {DB_URL[:50]}...")
 
@@ -35,7 +57,7 @@ def connect_to_db(app: FastAPI):
         # Define Tortoise ORM supported parameters
         tortoise_supported_params = {
             "ssl", "minsize", "maxsize", "max_queries",
-            "max_inactive_connection_lifetime", "schema",
+            "max_inactive_connection_lifetime", "statement_cache_size", "schema",
         }
 
         # Parameter mappings for Tortoise compatibility
@@ -63,15 +85,63 @@ def connect_to_db(app: FastAPI):
         logger.error(f"Error details: {e}")
         logger.error(traceback.format_exc())
         # Stop execution if parsing fails, as register_tortoise will fail anyway
+        return None
+
+    return tortoise_db_url
+
+
+def get_tortoise_config():
+    """Tortoise config for DB_URL, with explicit pool settings for Postgres.
+
+    Returns None when DB_URL is missing or invalid.
+    """
+    tortoise_db_url = get_tortoise_db_url()
+    if not tortoise_db_url:
+        return None
+
+    connection = expand_db_url(tortoise_db_url)
+    if connection["engine"] == "tortoise.backends.asyncpg":
+        credentials = connection["credentials"]
+        settings = pool_settings(credentials)
+        credentials.update(settings)
+        # Instrumented asyncpg client (acquire timing and timeout)
+        connection["engine"] = "server.db.pool"
+        logger.info(f"DB pool profile {pool_profile()}: {settings}")
+
+    return {
+        "connections": {"default": connection},
+        "apps": {
+            label: {"models": modules, "default_connection": "default"}
+            for label, modules in MODELS_MODULES.items()
+        },
+    }
+
+
+def connect_to_db(app: FastAPI):
+    config = get_tortoise_config()
+    if not config:
         return
 
+    if GENERATE_SCHEMAS:
+        app_lifespan = app.router.lifespan_context
+
+        @asynccontextmanager
+        async def schema_lifespan(app_instance: FastAPI):
+            # Runs once the ORM is up (register_tortoise wraps this) and
+            # before the app's own startup reads any model.
+            from server.db.migrate import upgrade_schema
+
+            await upgrade_schema()
+            async with app_lifespan(app_instance) as state:
+                yield state
+
+        app.router.lifespan_context = schema_lifespan
+
     try:
-        logger.info(f"Attempting to connect with Tortoise using URL: {tortoise_db_url[:50]}...")
+        logger.info("Attempting to connect with Tortoise...")
         register_tortoise(
             app=app,
-            db_url=tortoise_db_url,
-            modules={"models": ["server.db.models"]},
-            generate_schemas=True,
+            config=config,
             add_exception_handlers=True,
         )
         logger.info("Database connection successful")
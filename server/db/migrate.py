@@ -0,0 +1,140 @@
+"""
+Create missing tables and indexes for every model, plus the transaction
+search indexes (server.db.search).
+
+The API only generates schemas at startup when ``DB_GENERATE_SCHEMAS`` is on
+(the default outside ``FAST_STARTUP``); serverless deployments run this once
+per deploy instead of on every cold start:
+
+    python -m server.db.migrate
+
+Safe schema generation only creates tables that do not exist yet, so
+columns and indexes added to an existing table are applied explicitly by
+``upgrade_existing_tables`` first. Every statement is idempotent; on
+Postgres indexes are built ``CONCURRENTLY`` so writes are not blocked.
+
+``DailyRollup`` is backfilled from Transactions (``rollup.rebuild``) when it
+is empty but transactions exist, i.e. on the first upgrade of a database
+that predates it; balance, summary and budget reads trust it from then on.
+"""
+
+import logging
+
+from tortoise import Tortoise, connections, run_async
+from tortoise.exceptions import IntegrityError
+
+from server.db.models import DailyRollup, Transactions
+from server.db.rollup import rebuild
+from server.db.search import ensure_search_indexes
+
+logger = logging.getLogger(__name__)
+
+# Columns added to tables that predate them: table -> [(column, SQL type)]
+ADDED_COLUMNS = {
+    "transactions": [("import_hash", "VARCHAR(64)")],
+}
+# Indexes added to tables that predate them: (model, fields, unique)
+ADDED_INDEXES = [
+    (Transactions, ("user_id", "import_hash"), True),
+    # Keyset pagination of a user's history (newest first).
+    (Transactions, ("user_id", "created_at", "id"), False),
+    # Incremental sync: a user's rows changed since a cursor.
+    (Transactions, ("user_id", "lastest_edit"), False),
+]
+
+
+async def _table_columns(conn, table: str) -> set:
+    """Column names of ``table``, empty if it does not exist."""
+    if conn.capabilities.dialect == "sqlite":
+        rows = await conn.execute_query_dict(f'PRAGMA table_info("{table}")')
+        return {row["name"] for row in rows}
+    rows = await conn.execute_query_dict(
+        "SELECT column_name FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = $1",
+        [table],
+    )
+    return {row["column_name"] for row in rows}
+
+
+async def upgrade_existing_tables(conn=None) -> None:
+    conn = conn or connections.get("default")
+    postgres = conn.capabilities.dialect == "postgres"
+    existing = {}
+    for table, columns in ADDED_COLUMNS.items():
+        existing[table] = await _table_columns(conn, table)
+        if not existing[table]:
+            # New table: generate_schemas creates it complete.
+            continue
+        for column, sql_type in columns:
+            if postgres:
+                await conn.execute_script(
+                    f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{column}" {sql_type}'
+                )
+            elif column not in existing[table]:
+                await conn.execute_script(
+                    f'ALTER TABLE "{table}" ADD COLUMN "{column}" {sql_type}'
+                )
+            logger.info(f"Column {table}.{column} is present")
+
+    generator = conn.schema_generator(conn)
+    for model, fields, unique in ADDED_INDEXES:
+        table = model._meta.db_table
+        if table not in existing:
+            existing[table] = await _table_columns(conn, table)
+        if not existing[table]:
+            continue
+        # Tortoise's own names, so generate_schemas sees them as existing.
+        name = generator._get_index_name("uid" if unique else "idx", model, fields)
+        columns = ", ".join(f'"{field}"' for field in fields)
+        await conn.execute_script(
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX "
+            f"{'CONCURRENTLY ' if postgres else ''}IF NOT EXISTS "
+            f'"{name}" ON "{table}" ({columns})'
+        )
+        logger.info(f"Index {name} on {table} ({columns}) is present")
+
+
+async def backfill_rollups() -> None:
+    """Build DailyRollup from Transactions if it has never been populated."""
+    # Every transaction has a bucket, so an empty table means a new one.
+    if await DailyRollup.exists() or not await Transactions.exists():
+        return
+    logger.info("DailyRollup is empty; rebuilding it from transactions")
+    try:
+        await rebuild()
+    except IntegrityError:
+        # Another worker starting at the same time backfilled it first.
+        logger.info("DailyRollup was backfilled concurrently")
+
+
+async def upgrade_schema() -> None:
+    """Bring an initialised database up to the models; also run at API startup."""
+    await upgrade_existing_tables()
+    # safe=True only adds what is missing; existing tables are untouched.
+    await Tortoise.generate_schemas(safe=True)
+    await backfill_rollups()
+    # Expression/GIN indexes the ORM cannot declare.
+    await ensure_search_indexes()
+    logger.info("Database schema is up to date")
+
+
+async def migrate(config: dict) -> None:
+    await Tortoise.init(config=config)
+    try:
+        await upgrade_schema()
+    finally:
+        await Tortoise.close_connections()
+
+
+async def _main():
+    from server.db.main import get_tortoise_config
+
+    config = get_tortoise_config()
+    if not config:
+        raise SystemExit(1)
+    await migrate(config)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run_async(_main())
@@ -23,10 +23,105 @@ class Transactions(Model):
     tag = fields.CharField(max_length=255, description="tag")
     lastest_edit = fields.DatetimeField(auto_now=True, timestamptz=True)
     created_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+    import_hash = fields.CharField(
+        max_length=64, null=True, description="statement import dedupe key"
+    )
 
     class Meta:
         table = "transactions"
-        indexes = ("user_id", "created_at")
+        # (user_id, created_at, id) backs the keyset pagination on
+        # /transactions/user/{user_id}; id is the tie-breaker for equal timestamps.
+        # (user_id, lastest_edit) answers the count/max-edit fingerprint behind
+        # ETags and the analysis cache from the index alone.
+        indexes = (("user_id", "created_at", "id"), ("user_id", "lastest_edit"))
+        # Rows typed in by hand have no import_hash, and NULLs never collide.
+        unique_together = (("user_id", "import_hash"),)
+
+
+class DailyRollup(Model):
+    """Per-user, per-day, per-tag totals kept in step with Transactions."""
+
+    id = fields.IntField(pk=True)
+    user_id = fields.TextField(max_length=255, description="owner")
+    day = fields.DateField(description="local day (ROLLUP_TIMEZONE)")
+    tag = fields.CharField(max_length=255, description="tag")
+    income = fields.FloatField(default=0, description="income total")
+    expense = fields.FloatField(default=0, description="expense total")
+    income_count = fields.IntField(default=0, description="income rows")
+    expense_count = fields.IntField(default=0, description="expense rows")
+
+    class Meta:
+        table = "transactions_daily_rollup"
+        unique_together = (("user_id", "day", "tag"),)
+
+
+class TransactionTombstone(Model):
+    """A deleted transaction, kept for delta sync until compacted (server.services.sync)."""
+
+    id = fields.IntField(pk=True)
+    transaction_id = fields.UUIDField(description="deleted Transactions.id")
+    user_id = fields.TextField(max_length=255, description="owner")
+    deleted_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+
+    class Meta:
+        table = "transactions_tombstones"
+        indexes = (("user_id", "deleted_at"), ("deleted_at",))
+
+
+class BudgetAlert(Model):
+    """A budget threshold crossed by a user, at most once per kind and period."""
+
+    id = fields.IntField(pk=True)
+    user_id = fields.TextField(max_length=255, description="owner")
+    kind = fields.CharField(max_length=32, description="over_budget or low_saving")
+    period = fields.CharField(max_length=8, description="day or month")
+    period_start = fields.DateField(description="local day, or first day of month")
+    threshold = fields.FloatField(description="limit that was crossed")
+    amount = fields.FloatField(description="period expense when it was crossed")
+    created_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+
+    class Meta:
+        table = "budget_alerts"
+        # One alert per kind and period; id doubles as the SSE event id.
+        unique_together = (("user_id", "kind", "period_start"),)
+        indexes = (("user_id", "id"),)
+
+
+class ScheduledSummary(Model):
+    """AI summary of one user's finished day/week/month (server.services.summaries)."""
+
+    id = fields.IntField(pk=True)
+    user_id = fields.TextField(max_length=255, description="owner")
+    routine = fields.CharField(max_length=8, description="daily, weekly or monthly")
+    period_start = fields.DateField(description="first local day of the period")
+    period_end = fields.DateField(description="day after the period")
+    content = fields.TextField(description="generated markdown")
+    created_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+
+    class Meta:
+        table = "scheduled_summaries"
+        # One summary per period; also what a resumed run skips on.
+        unique_together = (("user_id", "routine", "period_start"),)
+
+
+class SummaryRun(Model):
+    """Checkpoint of the scheduled summary pass for one routine and period."""
+
+    id = fields.IntField(pk=True)
+    routine = fields.CharField(max_length=8, description="daily, weekly or monthly")
+    period_start = fields.DateField(description="first local day of the period")
+    status = fields.CharField(max_length=16, description="running or done")
+    cursor = fields.TextField(null=True, description="last user_id of a finished batch")
+    passes = fields.IntField(default=1, description="sweeps over the due users")
+    generated = fields.IntField(default=0, description="summaries stored")
+    failed = fields.IntField(default=0, description="failures in the current pass")
+    lease_until = fields.DatetimeField(null=True, timestamptz=True)
+    created_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+    updated_at = fields.DatetimeField(auto_now=True, timestamptz=True)
+
+    class Meta:
+        table = "summary_runs"
+        unique_together = (("routine", "period_start"),)
 
 
 class UsersSetting(Model):
@@ -50,3 +145,52 @@ class UsersSetting(Model):
     class Meta:
         table = "users_setting"
         indexes = ("user_id",)
+
+
+class ReceiptAnalysisCache(Model):
+    """Persistent tier of the receipt analysis cache (server.services.receipt_cache)."""
+
+    key = fields.CharField(max_length=64, pk=True, description="sha256 of images")
+    result = fields.JSONField(description="model output")
+    size_bytes = fields.IntField(description="serialized result size")
+    created_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+    last_used_at = fields.DatetimeField(timestamptz=True)
+
+    class Meta:
+        table = "receipt_analysis_cache"
+        indexes = ("last_used_at",)
+
+
+class Job(Model):
+    """Background job record shared by every worker (server.services.job_queue)."""
+
+    id = fields.UUIDField(pk=True)
+    queue = fields.CharField(max_length=64, description="queue name")
+    user_id = fields.TextField(max_length=255, description="owner")
+    status = fields.CharField(
+        max_length=16, description="queued, running, succeeded, dead"
+    )
+    attempts = fields.IntField(default=0)
+    max_attempts = fields.IntField(default=3)
+    payload = fields.JSONField(null=True, description="input (db backend only)")
+    result = fields.JSONField(null=True)
+    error = fields.TextField(null=True)
+    run_after = fields.DatetimeField(timestamptz=True)
+    created_at = fields.DatetimeField(auto_now_add=True, timestamptz=True)
+    updated_at = fields.DatetimeField(auto_now=True, timestamptz=True)
+
+    class Meta:
+        table = "jobs"
+        indexes = (("queue", "status", "run_after"),)
+
+
+class AnalysisCache(Model):
+    """Last AI financial analysis per user (server.services.analysis_cache)."""
+
+    user_id = fields.TextField(pk=True, description="owner")
+    fingerprint = fields.CharField(max_length=128, description="transaction set")
+    content = fields.TextField(description="generated markdown")
+    created_at = fields.DatetimeField(auto_now=True, timestamptz=True)
+
+    class Meta:
+        table = "ai_analysis_cache"
@@ -0,0 +1,215 @@
+"""
+Postgres connection pool settings and health metrics.
+
+Pool sizing comes from a deployment profile (``DB_POOL_PROFILE``), which can
+be overridden per setting through the environment or the ``DB_URL`` query:
+
+=================================  =========  ==========
+setting                            server     serverless
+=================================  =========  ==========
+DB_POOL_MIN_SIZE                   2          0
+DB_POOL_MAX_SIZE                   10         3
+DB_POOL_MAX_QUERIES                50000      50000
+DB_POOL_MAX_INACTIVE_LIFETIME (s)  300        30
+DB_STATEMENT_CACHE_SIZE            100        0
+DB_POOL_ACQUIRE_TIMEOUT (s)        10         5
+=================================  =========  ==========
+
+``serverless`` (the default when ``VERCEL`` is set) keeps few, short-lived
+connections and disables asyncpg's prepared statement cache, which breaks
+behind transaction-mode poolers such as PgBouncer or Supavisor.
+
+This module is also a Tortoise engine (``engine="server.db.pool"``): it
+wraps the asyncpg pool so every acquire is timed and bounded by the acquire
+timeout. ``pool_stats()`` reports in-use/idle connections, wait times and
+timeouts for ``/internal/db-pool``.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from tortoise import connections
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+POOL_PROFILES = {
+    "server": {
+        "minsize": 2,
+        "maxsize": 10,
+        "max_queries": 50000,
+        "max_inactive_connection_lifetime": 300.0,
+        "statement_cache_size": 100,
+        "acquire_timeout": 10.0,
+    },
+    "serverless": {
+        "minsize": 0,
+        "maxsize": 3,
+        "max_queries": 50000,
+        "max_inactive_connection_lifetime": 30.0,
+        "statement_cache_size": 0,
+        "acquire_timeout": 5.0,
+    },
+}
+
+# credential key -> (environment variable, type)
+POOL_ENV = {
+    "minsize": ("DB_POOL_MIN_SIZE", int),
+    "maxsize": ("DB_POOL_MAX_SIZE", int),
+    "max_queries": ("DB_POOL_MAX_QUERIES", int),
+    "max_inactive_connection_lifetime": ("DB_POOL_MAX_INACTIVE_LIFETIME", float),
+    "statement_cache_size": ("DB_STATEMENT_CACHE_SIZE", int),
+    "acquire_timeout": ("DB_POOL_ACQUIRE_TIMEOUT", float),
+}
+
+# Upper bounds (seconds) of the acquire wait histogram buckets.
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def pool_profile() -> str:
+    default = "serverless" if os.getenv("VERCEL") else "server"
+    profile = os.getenv("DB_POOL_PROFILE", default)
+    if profile not in POOL_PROFILES:
+        logger.error(f"Unknown DB_POOL_PROFILE {profile}, using {default}")
+        profile = default
+    return profile
+
+
+def pool_settings(url_params: Optional[dict] = None) -> dict:
+    """Profile defaults, then ``DB_URL`` query parameters, then environment."""
+    settings = dict(POOL_PROFILES[pool_profile()])
+    for key in POOL_ENV:
+        if url_params and key in url_params:
+            settings[key] = POOL_ENV[key][1](url_params[key])
+    for key, (env, cast) in POOL_ENV.items():
+        value = os.getenv(env)
+        if value:
+            settings[key] = cast(value)
+    return settings
+
+
+class PoolStats:
+    def __init__(self):
+        self.acquires = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record(self, wait: float) -> None:
+        self.acquires += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if wait <= bound:
+                self.wait_buckets[i] += 1
+                return
+        self.wait_buckets[-1] += 1
+
+
+class InstrumentedPool:
+    """asyncpg pool proxy that times ``acquire`` and applies a timeout."""
+
+    def __init__(self, pool, acquire_timeout: Optional[float]):
+        self._pool = pool
+        self.acquire_timeout = acquire_timeout
+        self.stats = PoolStats()
+
+    async def acquire(self, *, timeout: Optional[float] = None):
+        start = time.perf_counter()
+        try:
+            connection = await self._pool.acquire(timeout=timeout or self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            logger.error(
+                f"Timed out after {time.perf_counter() - start:.2f}s waiting for a "
+                f"DB connection ({self._pool.get_size()} open, "
+                f"max {self._pool.get_max_size()})"
+            )
+            raise
+        self.stats.record(time.perf_counter() - start)
+        return connection
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+_client_class = None
+
+
+def get_client_class(db_info: dict):
+    """Tortoise engine hook; asyncpg is only imported when Postgres is used."""
+    global _client_class
+    if _client_class is None:
+        from tortoise.backends.asyncpg import AsyncpgDBClient
+
+        class InstrumentedAsyncpgDBClient(AsyncpgDBClient):
+            def __init__(self, *args, **kwargs):
+                self.acquire_timeout = kwargs.pop("acquire_timeout", None)
+                super().__init__(*args, **kwargs)
+
+            async def create_pool(self, **kwargs):
+                pool = await super().create_pool(**kwargs)
+                return InstrumentedPool(pool, self.acquire_timeout)
+
+        _client_class = InstrumentedAsyncpgDBClient
+    return _client_class
+
+
+def _cumulative(counts: list) -> dict:
+    """Histogram counts as cumulative ``le_<seconds>`` buckets."""
+    buckets, running = {}, 0
+    for bound, count in zip(WAIT_BUCKETS + (float("inf"),), counts):
+        running += count
+        buckets[f"le_{bound}"] = running
+    return buckets
+
+
+def instrumented_pool(connection_name: str = "default") -> Optional[InstrumentedPool]:
+    """The open instrumented pool, or None (SQLite, not connected yet)."""
+    try:
+        pool = getattr(connections.get(connection_name), "_pool", None)
+    except Exception:
+        return None
+    return pool if isinstance(pool, InstrumentedPool) else None
+
+
+def pool_stats(connection_name: str = "default") -> dict:
+    try:
+        client = connections.get(connection_name)
+    except Exception:
+        return {"connected": False}
+    pool = instrumented_pool(connection_name)
+    stats = {
+        "connected": True,
+        "dialect": client.capabilities.dialect,
+        "profile": pool_profile(),
+    }
+    if pool is None:
+        # SQLite, or the pool has not been opened yet.
+        return stats
+    size, idle = pool.get_size(), pool.get_idle_size()
+    waits = pool.stats
+    stats.update(
+        {
+            "min_size": pool.get_min_size(),
+            "max_size": pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            "acquires": waits.acquires,
+            "acquire_timeouts": waits.timeouts,
+            "acquire_timeout_seconds": pool.acquire_timeout,
+            "acquire_wait_avg_ms": round(
+                waits.wait_total / waits.acquires * 1000 if waits.acquires else 0.0, 3
+            ),
+            "acquire_wait_max_ms": round(waits.wait_max * 1000, 3),
+            "acquire_wait_buckets": _cumulative(waits.wait_buckets),
+        }
+    )
+    return stats
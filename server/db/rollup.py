@@ -0,0 +1,263 @@
+"""
+Incrementally maintained daily rollup of Transactions.
+
+Every write path in transactionRoute.py calls ``apply_rollup`` inside the same
+DB transaction as the row change, so ``DailyRollup`` always matches the raw
+table. On a database that predates it, ``server.db.migrate`` (and startup
+with ``DB_GENERATE_SCHEMAS``) backfills it with ``rebuild`` before anything
+reads it. ``rebuild`` / ``verify`` recompute it from scratch:
+
+    python -m server.db.rollup verify [--user USER_ID]
+    python -m server.db.rollup rebuild [--user USER_ID]
+"""
+
+import argparse
+import datetime
+import logging
+import os
+from collections import defaultdict
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+from tortoise import Tortoise, connections, run_async
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from server.db.models import DailyRollup, Transactions
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Rollup days are cut on this zone's midnight.
+ROLLUP_TIMEZONE = os.getenv("ROLLUP_TIMEZONE", "UTC")
+_ROLLUP_ZONE = ZoneInfo(ROLLUP_TIMEZONE)
+
+
+def rollup_day(created_at: datetime.datetime) -> datetime.date:
+    """Local day a transaction is counted under."""
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+    return created_at.astimezone(_ROLLUP_ZONE).date()
+
+
+def _deltas(amount: float, type: str, sign: int) -> dict:
+    # Anything that is not "income" counts as an expense, same as the dashboard.
+    if type == "income":
+        return {"income": sign * amount, "income_count": sign}
+    return {"expense": sign * amount, "expense_count": sign}
+
+
+async def apply_rollup(record, sign: int, using_db=None):
+    """
+    Add (sign=1) or remove (sign=-1) one transaction from its rollup bucket.
+
+    Pass the connection of the surrounding ``in_transaction`` block so the
+    rollup change commits or rolls back together with the row change.
+    """
+    key = {
+        "user_id": record.user_id,
+        "day": rollup_day(record.created_at),
+        "tag": record.tag,
+    }
+    deltas = _deltas(float(record.amount or 0), record.type, sign)
+    await _apply_deltas(key, deltas, sign, using_db)
+
+
+async def apply_rollup_change(old, new, using_db=None):
+    """
+    Move an edited transaction from its ``old`` to its ``new`` state. When
+    the bucket is unchanged (the usual amount/detail edit) the net delta is
+    a single UPDATE.
+    """
+    old_key = (old.user_id, rollup_day(old.created_at), old.tag)
+    new_key = (new.user_id, rollup_day(new.created_at), new.tag)
+    if old_key != new_key:
+        await apply_rollup(old, -1, using_db)
+        await apply_rollup(new, 1, using_db)
+        return
+    deltas = defaultdict(float)
+    for field, value in _deltas(float(old.amount or 0), old.type, -1).items():
+        deltas[field] += value
+    for field, value in _deltas(float(new.amount or 0), new.type, 1).items():
+        deltas[field] += value
+    key = {"user_id": new.user_id, "day": new_key[1], "tag": new.tag}
+    await _apply_deltas(key, dict(deltas), 0, using_db)
+
+
+async def apply_rollup_batch(records, using_db=None):
+    """
+    Add many new transactions at once: deltas are summed per bucket first,
+    so a bulk insert costs one rollup write per (user, day, tag).
+    """
+    buckets = defaultdict(
+        lambda: {"income": 0.0, "expense": 0.0, "income_count": 0, "expense_count": 0}
+    )
+    for record in records:
+        key = (record.user_id, rollup_day(record.created_at), record.tag)
+        for field, value in _deltas(float(record.amount or 0), record.type, 1).items():
+            buckets[key][field] += value
+    for (user_id, day, tag), deltas in buckets.items():
+        key = {"user_id": user_id, "day": day, "tag": tag}
+        await _apply_deltas(key, deltas, 1, using_db)
+
+
+async def _apply_deltas(key: dict, deltas: dict, sign: int, using_db=None):
+    # sign 0 is a net in-place change: the row count of the bucket is unchanged.
+    updates = {field: F(field) + value for field, value in deltas.items()}
+
+    updated = await DailyRollup.filter(**key).using_db(using_db).update(**updates)
+    if not updated:
+        if sign <= 0:
+            logger.warning(f"Rollup bucket missing while updating {key}")
+            return
+        try:
+            # Savepoint, so a lost race does not abort the caller's transaction.
+            async with in_transaction() as savepoint:
+                await DailyRollup.create(**key, **deltas, using_db=savepoint)
+        except IntegrityError:
+            # Another writer created the bucket between our UPDATE and INSERT.
+            await DailyRollup.filter(**key).using_db(using_db).update(**updates)
+        return
+
+    if sign < 0:
+        await DailyRollup.filter(
+            **key, income_count__lte=0, expense_count__lte=0
+        ).using_db(using_db).delete()
+
+
+# Rebuild/verify aggregate in the database; only buckets reach Python.
+# Postgres groups by the local day directly. SQLite has no time zones, so it
+# groups by 15-minute UTC slot, which every zone's offset is a multiple of,
+# and each slot is mapped to its local day here.
+COMPUTE_ROLLUPS_SQL = {
+    "postgres": (
+        "SELECT user_id, (created_at AT TIME ZONE $1)::date AS slot, tag, "
+        "type = 'income' AS income, COALESCE(SUM(amount), 0) AS amount, "
+        "COUNT(*) AS count FROM transactions {where} GROUP BY 1, 2, 3, 4"
+    ),
+    "sqlite": (
+        "SELECT user_id, strftime('%Y-%m-%d %H:', created_at) || "
+        "printf('%02d', CAST(strftime('%M', created_at) AS INTEGER) / 15 * 15) "
+        "AS slot, tag, type = 'income' AS income, "
+        "COALESCE(SUM(amount), 0) AS amount, COUNT(*) AS count "
+        "FROM transactions {where} GROUP BY 1, 2, 3, 4"
+    ),
+}
+
+
+def _slot_day(slot) -> datetime.date:
+    if isinstance(slot, datetime.date):
+        return slot
+    utc = datetime.datetime.strptime(slot, "%Y-%m-%d %H:%M")
+    return rollup_day(utc.replace(tzinfo=datetime.timezone.utc))
+
+
+async def compute_rollups(user_id: str = None) -> dict:
+    """Recompute rollup buckets from raw Transactions."""
+    conn = connections.get("default")
+    postgres = conn.capabilities.dialect == "postgres"
+    params = [ROLLUP_TIMEZONE] if postgres else []
+    where = ""
+    if user_id:
+        params.append(user_id)
+        where = f"WHERE user_id = {f'${len(params)}' if postgres else '?'}"
+    sql = COMPUTE_ROLLUPS_SQL["postgres" if postgres else "sqlite"]
+
+    buckets = defaultdict(
+        lambda: {"income": 0.0, "expense": 0.0, "income_count": 0, "expense_count": 0}
+    )
+    for row in await conn.execute_query_dict(sql.format(where=where), params):
+        # Anything that is not "income" counts as an expense, as in _deltas.
+        kind = "income" if row["income"] else "expense"
+        bucket = buckets[(row["user_id"], _slot_day(row["slot"]), row["tag"])]
+        bucket[kind] += float(row["amount"])
+        bucket[f"{kind}_count"] += row["count"]
+    return buckets
+
+
+async def rebuild(user_id: str = None) -> int:
+    """Replace stored rollups with freshly computed ones."""
+    buckets = await compute_rollups(user_id)
+    async with in_transaction() as conn:
+        query = DailyRollup.all()
+        if user_id:
+            query = query.filter(user_id=user_id)
+        await query.using_db(conn).delete()
+        await DailyRollup.bulk_create(
+            [
+                DailyRollup(user_id=u, day=d, tag=t, **totals)
+                for (u, d, t), totals in buckets.items()
+            ],
+            batch_size=1000,
+            using_db=conn,
+        )
+    logger.info(f"Rebuilt {len(buckets)} rollup buckets")
+    return len(buckets)
+
+
+async def verify(user_id: str = None, tolerance: float = 1e-6) -> list:
+    """Return a list of (key, expected, stored) for every bucket that differs."""
+    expected = await compute_rollups(user_id)
+    query = DailyRollup.all()
+    if user_id:
+        query = query.filter(user_id=user_id)
+    stored = {
+        (r["user_id"], r["day"], r["tag"]): r
+        for r in await query.values(
+            "user_id",
+            "day",
+            "tag",
+            "income",
+            "expense",
+            "income_count",
+            "expense_count",
+        )
+    }
+
+    mismatches = []
+    for key in set(expected) | set(stored):
+        want = expected.get(key)
+        have = stored.get(key)
+        if want is None or have is None:
+            mismatches.append((key, want, have))
+            continue
+        if (
+            want["income_count"] != have["income_count"]
+            or want["expense_count"] != have["expense_count"]
+            or abs(want["income"] - have["income"]) > tolerance
+            or abs(want["expense"] - have["expense"]) > tolerance
+        ):
+            mismatches.append((key, want, have))
+    return mismatches
+
+
+async def _main(args):
+    from server.db.main import get_tortoise_config
+
+    config = get_tortoise_config()
+    if not config:
+        raise SystemExit(1)
+    await Tortoise.init(config=config)
+    await Tortoise.generate_schemas(safe=True)
+
+    if args.command == "rebuild":
+        count = await rebuild(args.user)
+        print(f"rebuilt {count} rollup buckets")
+        return
+
+    mismatches = await verify(args.user)
+    for key, want, have in mismatches:
+        print(f"MISMATCH {key}: expected={want} stored={have}")
+    print(f"{len(mismatches)} mismatched rollup buckets")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild or verify DailyRollup")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--user", default=None, help="limit to one user_id")
+    run_async(_main(parser.parse_args()))
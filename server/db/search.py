@@ -0,0 +1,168 @@
+"""
+Search over Transactions ``detail`` and ``tag``.
+
+On Postgres a row matches when its document (``detail || ' ' || tag``)
+
+- matches the words of the query as full text (``simple`` config, so no
+  stemming; ``websearch_to_tsquery`` syntax), or
+- contains the query as a substring, which is what finds Thai text: the
+  default text-search parser does not split Thai words, or
+- with ``fuzzy``, is word-similar to it (pg_trgm ``<%``), which tolerates
+  typos such as "grap" for "grab".
+
+Each test is backed by a GIN index that leads with ``user_id`` (btree_gin),
+so a search is a bitmap scan over one user's matching rows, not over the
+table. The indexes are created by ``ensure_search_indexes`` from
+``python -m server.db.migrate``; without btree_gin they fall back to plain
+GIN on the document. Other dialects (SQLite in development) run a
+case-insensitive substring filter with no index.
+
+Results are newest first and keyset-paginated on ``(created_at, id)``.
+"""
+
+import logging
+from typing import Optional
+
+from tortoise import connections
+from tortoise.expressions import Q
+
+from server.db.models import Transactions
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT = "(detail || ' ' || tag)"
+TSVECTOR = f"to_tsvector('simple'::regconfig, {DOCUMENT})"
+LOWER_DOCUMENT = f"lower({DOCUMENT})"
+
+EXTENSIONS = ("pg_trgm", "btree_gin")
+# index name -> (indexed expression, operator class)
+SEARCH_INDEXES = {
+    "transactions_search_fts": (TSVECTOR, ""),
+    "transactions_search_trgm": (LOWER_DOCUMENT, " gin_trgm_ops"),
+}
+
+# filter name -> (column, operator)
+FILTERS = {
+    "start_date": ("created_at", ">="),
+    "end_date": ("created_at", "<"),
+    "min_amount": ("amount", ">="),
+    "max_amount": ("amount", "<="),
+    "type": ("type", "="),
+    "tag": ("tag", "="),
+}
+PORTABLE_LOOKUPS = {">=": "__gte", "<": "__lt", "<=": "__lte", "=": ""}
+
+# Extensions installed in this database, looked up once per process.
+_extensions: Optional[set] = None
+
+
+async def installed_extensions(conn) -> set:
+    global _extensions
+    if _extensions is None:
+        rows = await conn.execute_query_dict(
+            "SELECT extname FROM pg_extension WHERE extname = ANY($1)",
+            [list(EXTENSIONS)],
+        )
+        _extensions = {row["extname"] for row in rows}
+    return _extensions
+
+
+async def ensure_search_indexes(conn=None) -> None:
+    """Create the search extensions and indexes if missing (Postgres only)."""
+    global _extensions
+    conn = conn or connections.get("default")
+    if conn.capabilities.dialect != "postgres":
+        return
+    for extension in EXTENSIONS:
+        try:
+            await conn.execute_script(f"CREATE EXTENSION IF NOT EXISTS {extension}")
+        except Exception as e:
+            logger.warning(f"Cannot create extension {extension}: {e}")
+    _extensions = None
+    extensions = await installed_extensions(conn)
+    for name, (expression, opclass) in SEARCH_INDEXES.items():
+        if opclass and "pg_trgm" not in extensions:
+            logger.warning(f"pg_trgm is not installed, skipping {name}")
+            continue
+        columns = f"({expression}){opclass}"
+        if "btree_gin" in extensions:
+            columns = f"user_id, {columns}"
+        # CONCURRENTLY, so building it over a large table does not block writes.
+        await conn.execute_script(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+            f"ON transactions USING gin ({columns})"
+        )
+    logger.info("Transaction search indexes are up to date")
+
+
+def _like_pattern(text: str) -> str:
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+async def search_transactions(
+    user_id: str,
+    q: str,
+    fields: tuple,
+    limit: int,
+    fuzzy: bool = True,
+    after: Optional[tuple] = None,
+    **filters,
+) -> list:
+    """
+    Up to ``limit`` matching rows as dicts of ``fields``, newest first.
+
+    ``after`` is the ``(created_at, id)`` of the previous page's last row.
+    ``filters`` are ``start_date``/``end_date`` (end exclusive),
+    ``min_amount``/``max_amount`` (inclusive), ``type`` and ``tag``; None
+    means no filter.
+    """
+    term = q.strip()
+    filters = {key: value for key, value in filters.items() if value is not None}
+    conn = connections.get("default")
+    if conn.capabilities.dialect != "postgres":
+        return await _search_portable(user_id, term, fields, limit, after, filters)
+
+    params = [user_id]
+
+    def param(value) -> str:
+        params.append(value)
+        return f"${len(params)}"
+
+    matches = [
+        f"{TSVECTOR} @@ websearch_to_tsquery('simple', {param(term)})",
+        f"{LOWER_DOCUMENT} LIKE {param(_like_pattern(term.lower()))}",
+    ]
+    if fuzzy and "pg_trgm" in await installed_extensions(conn):
+        matches.append(f"{param(term.lower())} <% {LOWER_DOCUMENT}")
+    where = ["user_id = $1", f"({' OR '.join(matches)})"]
+    for key, value in filters.items():
+        column, operator = FILTERS[key]
+        where.append(f"{column} {operator} {param(value)}")
+    if after is not None:
+        created_at, record_id = after
+        where.append(
+            f"(created_at, id) < ({param(created_at)}, {param(record_id)}::uuid)"
+        )
+
+    sql = (
+        f"SELECT {', '.join(fields)} FROM transactions "
+        f"WHERE {' AND '.join(where)} "
+        f"ORDER BY created_at DESC, id DESC LIMIT {param(limit)}"
+    )
+    return await conn.execute_query_dict(sql, params)
+
+
+async def _search_portable(user_id, term, fields, limit, after, filters) -> list:
+    query = Transactions.filter(
+        Q(detail__icontains=term) | Q(tag__icontains=term), user_id=user_id
+    )
+    for key, value in filters.items():
+        column, operator = FILTERS[key]
+        query = query.filter(**{f"{column}{PORTABLE_LOOKUPS[operator]}": value})
+    if after is not None:
+        created_at, record_id = after
+        query = query.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=record_id)
+        )
+    return await query.order_by("-created_at", "-id").limit(limit).values(*fields)
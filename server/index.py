@@ -1,20 +1,42 @@
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 import os
 import logging
 import traceback
+from contextlib import asynccontextmanager
 
 from server.db.main import connect_to_db
+from server.db.pool import pool_stats
+from server.services import metrics, summaries
 from dotenv import load_dotenv
 
 # Import routers
-from server.routers import ai_router, user_router, transaction_router, usersetting_router
+from server.routers import (
+    ai_router,
+    alert_router,
+    user_router,
+    transaction_router,
+    usersetting_router,
+)
+from server.routers.transactionRoute import receipt_jobs
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs inside the ORM lifespan registered by connect_to_db.
+    receipt_jobs.start()
+    try:
+        yield
+    finally:
+        await receipt_jobs.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 STARTUP_ERROR = None
 
 # CORS configuration
@@ -42,8 +64,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
+)
+
+# Compress JSON bodies above the threshold; SSE and already-gzipped
+# exports are excluded by the middleware itself.
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1000")),
+    compresslevel=int(os.getenv("GZIP_LEVEL", "6")),
 )
 
+# Outermost, so latency covers the other middleware and streamed bodies
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # db connect
 try:
     logger.info("Attempting to connect to the database during startup...")
@@ -60,10 +95,13 @@ def configure_routers(app: FastAPI):
     app.include_router(transaction_router, prefix="/transactions", tags=["Transactions"])
     app.include_router(usersetting_router, prefix="/usersettings", tags=["User Settings"])
     app.include_router(ai_router, prefix="/ai", tags=["AI"])
+    app.include_router(alert_router, prefix="/alerts", tags=["Alerts"])
     
-    logger.info(
-        f"routes configured : \n" + "\n".join([f"   {i}" for i in app.routes])
-    )
+    logger.info(f"{len(app.routes)} routes configured")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            f"routes configured : \n" + "\n".join([f"   {i}" for i in app.routes])
+        )
 
 configure_routers(app)
 
@@ -83,4 +121,35 @@ def root_head():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "version": "1.0.0"}
\ No newline at end of file
+    return {"status": "healthy", "version": "1.0.0"}
+
+def require_metrics_token(request: Request) -> None:
+    """Operational endpoints need ``Bearer <METRICS_TOKEN>`` when it is set."""
+    if metrics.METRICS_TOKEN and request.headers.get(
+        "authorization"
+    ) != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@app.get("/internal/db-pool", include_in_schema=False)
+def db_pool_health(request: Request):
+    """Connection pool gauges and acquire wait/timeout counters."""
+    require_metrics_token(request)
+    return pool_stats()
+
+if summaries.CRON_SECRET:
+
+    @app.get("/internal/summaries/run", include_in_schema=False)
+    async def run_scheduled_summaries(request: Request):
+        """Cron entry point: resume due summaries for up to SUMMARY_RUN_SECONDS."""
+        if request.headers.get("authorization") != f"Bearer {summaries.CRON_SECRET}":
+            raise HTTPException(status_code=401, detail="Unauthorized")
+        reports = await summaries.run_due(max_seconds=summaries.SUMMARY_RUN_SECONDS)
+        return {"message": "Scheduled summaries run", "body": reports, "success": True}
+
+if metrics.METRICS_ENABLED:
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint(request: Request):
+        """Prometheus scrape endpoint (this worker's metrics)."""
+        require_metrics_token(request)
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
@@ -9,5 +9,12 @@ from .ai import ai_router
 from .userRoute import user_router
 from .transactionRoute import transaction_router
 from .usersettingRoute import usersetting_router
+from .alertRoute import alert_router
 
-__all__ = ["ai_router", "user_router", "transaction_router", "usersetting_router"]
+__all__ = [
+    "ai_router",
+    "user_router",
+    "transaction_router",
+    "usersetting_router",
+    "alert_router",
+]
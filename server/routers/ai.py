@@ -1,13 +1,28 @@
-from google import genai
-from google.genai import types
 import os
-from fastapi import APIRouter, HTTPException, File, UploadFile, Form
+from fastapi import APIRouter, HTTPException, File, UploadFile, Form, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from server.db.models import Transactions, User
+from server.db.models import ScheduledSummary
+from server.schemes import PageData, ScheduledSummaryOut
 import json
+import asyncio
 import logging
 
+from server.services.ai_scheduler import ai_scheduler, SchedulerSaturated
+from server.services.metrics import timed_generate, timed_stream
+from server.services.receipt_cache import receipt_cache, receipt_cache_key
+from server.services.image_preprocess import preprocess_images, InvalidImage
+from server.services.analysis_cache import (
+    transactions_fingerprint,
+    get_cached_analysis,
+    store_analysis,
+)
+from server.services.prompt_digest import load_digest, render_digest
+from server.services.entity_cache import user_cache
+from server.services.summaries import ROUTINES
+from typing import List, Optional
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -19,23 +34,133 @@ ai_router = APIRouter(tags=["AI"])
 
 # Get API key
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    logger.info("GEMINI_API_KEY loaded successfully")
-    client = genai.Client(api_key=GEMINI_API_KEY)
-else:
+if not GEMINI_API_KEY:
     logger.error("ERR: GEMINI_API_KEY not found")
-    client = None
+
+# Built by get_client() on first use: importing google.genai and creating
+# the client costs about half a second, which cold starts should not pay
+# for requests that never reach the model.
+client = None
+
+
+def get_client():
+    """The shared Gemini client, or None when ``GEMINI_API_KEY`` is unset."""
+    global client
+    if client is None and GEMINI_API_KEY:
+        from google import genai
+
+        client = genai.Client(api_key=GEMINI_API_KEY)
+        logger.info("Gemini client created")
+    return client
 
 
 class PromptRequest(BaseModel):
     prompt: str
 
 
+async def generate_content(**kwargs):
+    """
+    Run one Gemini generation on the async client through ``ai_scheduler``.
+
+    Saturation is surfaced as 503 and deadline overruns as 504, so the
+    event loop stays free for every other request while the model works.
+    """
+    try:
+        return await ai_scheduler.run(
+            lambda: timed_generate(get_client(), **kwargs)
+        )
+    except SchedulerSaturated as e:
+        logger.warning(f"AI scheduler saturated: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    except asyncio.TimeoutError:
+        logger.error("AI call exceeded its deadline")
+        raise HTTPException(status_code=504, detail="AI service timed out")
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_response(
+    request: Request, on_complete=None, **kwargs
+) -> StreamingResponse:
+    """
+    Stream a Gemini generation to the client as server-sent events.
+
+    Emits ``token`` events with ``{"text": ...}``, then ``done`` (or
+    ``error``). The first chunk is awaited before the response starts so
+    saturation and upstream failures still map to real HTTP status codes.
+    When the client disconnects the upstream stream is closed, which stops
+    the generation we would otherwise keep paying for. ``on_complete(text)``
+    is awaited with the full text after a stream that ran to the end.
+    """
+    chunks = ai_scheduler.stream(
+        lambda: timed_stream(get_client(), **kwargs)
+    )
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except SchedulerSaturated as e:
+        logger.warning(f"AI scheduler saturated: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    except asyncio.TimeoutError:
+        logger.error("AI stream exceeded its deadline before the first token")
+        raise HTTPException(status_code=504, detail="AI service timed out")
+    except Exception as e:
+        logger.error(f"Error starting AI stream: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
+
+    async def events():
+        parts = []
+        try:
+            if first is not None:
+                if first.text:
+                    parts.append(first.text)
+                    yield _sse("token", {"text": first.text})
+                async for chunk in chunks:
+                    if await request.is_disconnected():
+                        logger.info("Client disconnected, cancelling AI stream")
+                        return
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield _sse("token", {"text": chunk.text})
+            if on_complete is not None:
+                await on_complete("".join(parts))
+            yield _sse("done", {})
+        except asyncio.TimeoutError:
+            logger.error("AI stream exceeded its deadline")
+            yield _sse("error", {"detail": "AI service timed out"})
+        except Exception as e:
+            logger.error(f"Error during AI stream: {str(e)}")
+            yield _sse("error", {"detail": f"AI processing error: {str(e)}"})
+        finally:
+            await chunks.aclose()
+
+    return _sse_response(events())
+
+
 async def analyze_transaction_from_image(image_data: list, user_id: str):
     """
     Analyzes an image of a receipt and returns transaction data as JSON.
     """
-    if not client:
+    if not get_client():
         raise HTTPException(status_code=500, detail="AI service not configured")
 
     # The prompt instructs the model on how to analyze the image and what JSON to return.
@@ -59,7 +184,7 @@ async def analyze_transaction_from_image(image_data: list, user_id: str):
     model_input = [prompt, *image_data]
 
     try:
-        response = client.models.generate_content(
+        response = await generate_content(
             model="gemini-2.5-flash", contents=model_input
         )
         # The response text should be a JSON string. To make it more robust,
@@ -76,49 +201,71 @@ async def analyze_transaction_from_image(image_data: list, user_id: str):
         # logger.info(f"AI analysis result: {transactions_data}")
         return transactions_data
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error during AI analysis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI analysis failed: {str(e)}")
 
 
-@ai_router.get("/analyze-transaction")
-async def ai_analyze(user_id: str):
+async def analyze_receipt_images(image_bytes: list, user_id: str):
     """
-    Analyzes text data and returns response from AI.
+    Preprocess raw uploads off the event loop, then run
+    ``analyze_transaction_from_image`` behind the receipt cache.
+
+    The cache key is built from the normalized bytes, so re-uploads of the
+    same photo hit even if the client re-encoded it with different metadata.
+    Raises ``InvalidImage`` if an upload cannot be decoded.
     """
-    transactions = (
-        await Transactions.all()
-        .filter(user_id=user_id)
-        .values("amount", "type", "detail", "tag", "created_at")
+    processed = await preprocess_images(image_bytes)
+    return await analyze_preprocessed_receipt(processed, user_id)
+
+
+async def analyze_preprocessed_receipt(processed: list, user_id: str):
+    """Cached analysis of ``(bytes, mime_type)`` pairs from ``preprocess_images``."""
+    from google.genai import types
+
+    key = receipt_cache_key(user_id, [data for data, _ in processed])
+    image_data = [
+        types.Part.from_bytes(data=data, mime_type=mime_type)
+        for data, mime_type in processed
+    ]
+    return await receipt_cache.get_or_compute(
+        key, lambda: analyze_transaction_from_image(image_data, user_id)
     )
 
-    user = await User.get(id=user_id)
-    logger.info(f"Successfully retrieved user {user_id}")
+
+# Plain dict so google.genai is not needed at import time
+NO_THINKING = {"thinking_config": {"thinking_budget": 0}}  # Disables thinking
+
+
+async def build_analysis_prompt(user_id: str) -> str:
+    """
+    Build the financial analysis prompt from a bounded digest of the user's
+    transactions, so its size does not grow with their history.
+
+    Raises 404 when the user or their transactions are missing.
+    """
+    user = await user_cache.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    logger.info(f"Successfully retrieved user {user_id}")
 
-    if not client:
+    if not get_client():
         raise HTTPException(status_code=500, detail="AI service not configured")
 
-    if not transactions:
+    digest = await load_digest(user_id)
+    if not digest["count"] and not digest["recent"]:
         raise HTTPException(
             status_code=404, detail="No transactions found for analysis"
         )
 
-    prompt = "\n".join(
-        [
-            f"{[t['amount']]}, {t['type']}, {t['detail']}, {t['tag']}, {t['created_at']}"
-            for t in transactions
-        ]
-    )
+    prompt = render_digest(digest)
 
-    try:
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=f"""
-            วิเคราะห์ข้อมูลการเงินของ {user.username} และให้คำแนะนำการบริหารการเงินแบบสั้น ๆ
+    return f"""
+            วิเคราะห์ข้อมูลการเงินของ {user['username']} และให้คำแนะนำการบริหารการเงินแบบสั้น ๆ
 
-ข้อมูลรายการธุรกรรม:
+สรุปข้อมูลรายการธุรกรรม:
 {prompt}
 
 กรุณาสรุปผลในรูปแบบ Markdown โดยใช้โครงสร้างดังนี้:
@@ -133,16 +280,46 @@ async def ai_analyze(user_id: str):
 - 3-5 คำแนะนำที่นำไปใช้ได้จริง
 
 เน้นความกระชับและเป็นมืออาชีพ ใช้อีโมจิน้อย ๆ มุ่งไปที่ข้อมูลที่สำคัญที่สุดเท่านั้น
-            """,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0
-                )  # Disables thinking
-            ),
+            """
+
+
+@ai_router.get("/analyze-transaction")
+async def ai_analyze(
+    user_id: str,
+    response: Response,
+    max_age: Optional[float] = None,
+    force_refresh: bool = False,
+):
+    """
+    Analyzes text data and returns response from AI.
+
+    The report is cached per user until their transactions change;
+    ``max_age`` (seconds) bounds how old a cached report may be and
+    ``force_refresh`` always regenerates it. ``X-Cache`` tells which happened.
+    """
+    fingerprint = await transactions_fingerprint(user_id)
+    if not force_refresh:
+        cached = await get_cached_analysis(user_id, fingerprint, max_age)
+        if cached is not None:
+            logger.info(f"Serving cached analysis for user {user_id}")
+            response.headers["X-Cache"] = "HIT"
+            return cached
+
+    contents = await build_analysis_prompt(user_id)
+
+    try:
+        result = await generate_content(
+            model="gemini-2.5-flash",
+            contents=contents,
+            config=NO_THINKING,
         )
-        logger.info(f"AI text analysis response: {response.text}")
-        return response.text
+        logger.info(f"AI text analysis response: {result.text}")
+        await store_analysis(user_id, fingerprint, result.text)
+        response.headers["X-Cache"] = "MISS"
+        return result.text
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error during AI text analysis: {str(e)}")
         raise HTTPException(
@@ -150,21 +327,91 @@ async def ai_analyze(user_id: str):
         )
 
 
+@ai_router.get("/analyze-transaction/stream")
+async def ai_analyze_stream(
+    user_id: str,
+    request: Request,
+    max_age: Optional[float] = None,
+    force_refresh: bool = False,
+):
+    """
+    Same analysis as ``/analyze-transaction``, streamed as server-sent events.
+    A cached report is sent as a single ``token`` event.
+    """
+    fingerprint = await transactions_fingerprint(user_id)
+    if not force_refresh:
+        cached = await get_cached_analysis(user_id, fingerprint, max_age)
+        if cached is not None:
+
+            async def cached_events():
+                yield _sse("token", {"text": cached})
+                yield _sse("done", {"cached": True})
+
+            return _sse_response(cached_events())
+
+    async def save(text: str):
+        await store_analysis(user_id, fingerprint, text)
+
+    contents = await build_analysis_prompt(user_id)
+    return await stream_response(
+        request,
+        on_complete=save,
+        model="gemini-2.5-flash",
+        contents=contents,
+        config=NO_THINKING,
+    )
+
+
+@ai_router.get(
+    "/summaries/{user_id}", response_model=PageData[List[ScheduledSummaryOut]]
+)
+async def get_scheduled_summaries(
+    user_id: str,
+    routine: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+    before: Optional[int] = None,
+):
+    """
+    Stored summaries from the user's ``conclusion_routine``, newest period
+    first. Never calls the model; pass ``next_cursor`` back as ``before``.
+    """
+    if routine is not None and routine not in ROUTINES:
+        raise HTTPException(status_code=400, detail=f"Unknown routine: {routine}")
+    try:
+        query = ScheduledSummary.filter(user_id=user_id)
+        if routine:
+            query = query.filter(routine=routine)
+        if before is not None:
+            query = query.filter(id__lt=before)
+        summaries = await query.order_by("-id").limit(limit + 1).values(
+            *ScheduledSummaryOut.model_fields
+        )
+        next_cursor = None
+        if len(summaries) > limit:
+            summaries = summaries[:limit]
+            next_cursor = str(summaries[-1]["id"])
+        return {
+            "body": summaries,
+            "next_cursor": next_cursor,
+            "message": "Summaries retrieved successfully",
+            "success": True,
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving summaries for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
 @ai_router.get("/")
 async def ai_root():
     """AI service root endpoint"""
-    if not client:
+    if not get_client():
         raise HTTPException(status_code=500, detail="AI service not configured")
 
     try:
-        response = client.models.generate_content(
+        response = await generate_content(
             model="gemini-2.5-flash",
             contents="I call u from my web-server api, so Say Hello To My users",
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0
-                )  # Disables thinking
-            ),
+            config=NO_THINKING,
         )
         logger.info(f"AI prompt processed successfully")
         return {
@@ -172,6 +419,8 @@ async def ai_root():
             "body": response.text,
             "success": True,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing AI: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
@@ -180,53 +429,75 @@ async def ai_root():
 @ai_router.post("/prompt")
 async def ai_prompt(request: PromptRequest):
     """Generate AI response using Gemini API"""
-    if not client:
+    if not get_client():
         raise HTTPException(status_code=500, detail="AI service not configured")
 
     try:
-        response = client.models.generate_content(
+        response = await generate_content(
             model="gemini-2.5-flash",
             contents=request.prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(
-                    thinking_budget=0
-                )  # Disables thinking
-            ),
+            config=NO_THINKING,
         )
         logger.info(f"AI prompt processed successfully")
         return {"message": response.text, "success": True}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing AI prompt: {str(e)}")
         raise HTTPException(status_code=500, detail=f"AI processing error: {str(e)}")
 
 
+@ai_router.post("/prompt/stream")
+async def ai_prompt_stream(prompt_request: PromptRequest, request: Request):
+    """Generate AI response using Gemini API, streamed as server-sent events"""
+    if not get_client():
+        raise HTTPException(status_code=500, detail="AI service not configured")
+
+    return await stream_response(
+        request,
+        model="gemini-2.5-flash",
+        contents=prompt_request.prompt,
+        config=NO_THINKING,
+    )
+
+
 @ai_router.post("/analyze-receipt")
 async def analyze_receipt(image: UploadFile = File(...), user_id: str = Form(...)):
     """
     Upload receipt image and extract transaction data using AI
     """
-    if not client:
+    if not get_client():
         raise HTTPException(status_code=500, detail="AI service not configured")
 
     try:
         # Read image file
         image_bytes = await image.read()
 
-        # Convert to base64 for Gemini API
-        image_data = [
-            types.Part.from_bytes(
-                data=image_bytes, mime_type=image.content_type or "image/jpeg"
-            )
-        ]
-
-        # Analyze using AI
-        transactions = await analyze_transaction_from_image(image_data, user_id)
+        # Normalize and analyze using AI
+        transactions = await analyze_receipt_images([image_bytes], user_id)
 
         logger.info(f"Successfully analyzed receipt for user {user_id}")
         return transactions
 
+    except HTTPException:
+        raise
+    except InvalidImage as e:
+        logger.error(f"Failed to process image {image.filename}: {e}")
+        raise HTTPException(
+            status_code=400, detail=f"Invalid image file: {image.filename}"
+        )
     except Exception as e:
         logger.error(f"Error analyzing receipt: {str(e)}")
         raise HTTPException(
             status_code=500, detail=f"Receipt analysis failed: {str(e)}"
         )
+
+
+@ai_router.get("/cache/stats")
+async def receipt_cache_stats():
+    """Hit/miss counters of the receipt analysis cache"""
+    return {
+        "message": "Receipt cache stats",
+        "body": receipt_cache.stats,
+        "success": True,
+    }
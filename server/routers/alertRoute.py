@@ -0,0 +1,97 @@
+from fastapi import HTTPException, APIRouter, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+
+from server.db.models import BudgetAlert
+from server.schemes import BudgetAlertOut, PageData
+from server.services.budget import alerts_after, wait_for_alert
+
+import datetime
+import json
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+alert_router = APIRouter(tags=["Alerts"])
+
+MAX_PAGE_SIZE = 200
+
+
+@alert_router.get("/{user_id}", response_model=PageData[List[BudgetAlertOut]])
+async def get_alerts(
+    user_id: str,
+    kind: Optional[str] = None,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    before: Optional[int] = None,
+):
+    """
+    A user's budget alerts, newest first. Pass ``next_cursor`` back as
+    ``before`` for the next page.
+    """
+    try:
+        query = BudgetAlert.filter(user_id=user_id)
+        if kind:
+            query = query.filter(kind=kind)
+        if start_date:
+            query = query.filter(created_at__gte=start_date)
+        if end_date:
+            query = query.filter(created_at__lt=end_date)
+        if before is not None:
+            query = query.filter(id__lt=before)
+        alerts = await query.order_by("-id").limit(limit + 1).values(
+            *BudgetAlertOut.model_fields
+        )
+        next_cursor = None
+        if len(alerts) > limit:
+            alerts = alerts[:limit]
+            next_cursor = str(alerts[-1]["id"])
+        return {
+            "body": alerts,
+            "next_cursor": next_cursor,
+            "message": "Alerts retrieved successfully",
+            "success": True,
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving alerts for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@alert_router.get("/{user_id}/events")
+async def stream_alerts(user_id: str, request: Request, after: Optional[int] = None):
+    """
+    Server-sent events: one ``alert`` event per new budget alert, with the
+    alert id as the event id. Reconnects resume from ``Last-Event-ID`` (or
+    ``after``); a fresh stream starts with alerts raised from now on.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    if last_event_id is not None:
+        try:
+            after = int(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    if after is None:
+        newest = await BudgetAlert.filter(user_id=user_id).order_by("-id").first()
+        after = newest.id if newest else 0
+
+    async def events():
+        cursor = after
+        while not await request.is_disconnected():
+            alerts = await alerts_after(user_id, cursor)
+            for alert in alerts:
+                cursor = alert["id"]
+                data = json.dumps(jsonable_encoder(alert))
+                yield f"id: {cursor}\nevent: alert\ndata: {data}\n\n"
+            if not alerts:
+                yield ": keep-alive\n\n"
+            # Local writes wake us immediately; other processes are polled.
+            await wait_for_alert(user_id)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,16 +1,69 @@
-from fastapi import HTTPException, APIRouter, File, UploadFile
-from server.db.models import Transactions
-from typing import List
-from server.schemes import TransactionBase, TransactionCreate, ResponseData
+from fastapi import HTTPException, APIRouter, File, UploadFile, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from server.db.models import Transactions, DailyRollup
+from typing import List, Optional
+from server.schemes import (
+    TransactionBase,
+    TransactionCreate,
+    TransactionBatchCreate,
+    TransactionOut,
+    TransactionSync,
+    ResponseData,
+    PageData,
+)
+from pydantic import ValidationError
+from tortoise.expressions import Q
+from tortoise import connections
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+from server.db.search import search_transactions
+from server.db.rollup import (
+    apply_rollup,
+    apply_rollup_batch,
+    apply_rollup_change,
+    ROLLUP_TIMEZONE,
+)
+from server.services.analysis_cache import invalidate_analysis, transactions_fingerprint
+from server.services.budget import (
+    budget_settings,
+    check_budget,
+    check_budget_change,
+    publish_alerts,
+)
+from server.services.conditional import etag_matches, make_etag, not_modified, set_etag
+from server.services.sync import load_changes, record_tombstone
+from server.services.transaction_export import EXPORT_FORMATS, export_transactions
+from server.services.statement_import import (
+    ImportReport,
+    StatementError,
+    detect_format,
+    drop_existing,
+    parse_csv,
+    parse_ofx,
+    statement_chunks,
+)
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 # from pydantic import BaseModel
 import logging
-import io
-import PIL.Image
+import os
+import json
+import base64
+import binascii
+import codecs
+import datetime
+import re
 
-# import datetime
-
-from server.routers.ai import analyze_transaction_from_image
+from server.routers.ai import analyze_receipt_images, analyze_preprocessed_receipt
+from server.services.image_preprocess import InvalidImage, preprocess_images
+from server.services.job_queue import (
+    JobQueue,
+    JobQueueFull,
+    TERMINAL_STATUSES,
+    job_status,
+)
+from dotenv import load_dotenv
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -18,67 +71,746 @@ logger = logging.getLogger(__name__)
 # Initialize router with tags for documentation
 transaction_router = APIRouter(tags=["Transactions"])
 
+load_dotenv()
+
+# Background receipt processing (POST /images/{user_id}?job=true)
+receipt_jobs = JobQueue(
+    "receipts",
+    backend=os.getenv("RECEIPT_JOB_BACKEND", "memory"),
+    workers=int(os.getenv("RECEIPT_JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("RECEIPT_JOB_MAX_ATTEMPTS", "3")),
+    retry_seconds=float(os.getenv("RECEIPT_JOB_RETRY_SECONDS", "5")),
+    max_pending=int(os.getenv("RECEIPT_JOB_MAX_PENDING", "100")),
+    retention=float(os.getenv("RECEIPT_JOB_RETENTION_DAYS", "7")) * 86400,
+)
+
+
+MAX_PAGE_SIZE = 500
+# Projection for list endpoints: plain dicts straight into TransactionOut.
+TRANSACTION_OUT_FIELDS = tuple(TransactionOut.model_fields)
+
+
+def encode_cursor(created_at: datetime.datetime, record_id) -> str:
+    """Opaque keyset cursor pointing at the last row of a page."""
+    raw = json.dumps({"c": created_at.isoformat(), "i": str(record_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor, raises 400 on anything we did not issue."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(data["c"]), str(data["i"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@transaction_router.get(
+    "/user/{user_id}", response_model=PageData[List[TransactionOut]]
+)
+async def get_records_by_user(
+    user_id: str,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    type: Optional[str] = None,
+    tag: Optional[str] = None,
+):
+    """
+    List a user's records, newest first.
+
+    Passing ``limit`` (or a ``cursor``) switches to keyset pagination on
+    ``(created_at, id)``: every page is a single index range scan, so page 500
+    costs the same as page 1. ``next_cursor`` is ``None`` on the last page.
+    Without ``limit`` the full (filtered) history is returned as before.
 
-@transaction_router.get("/user/{user_id}")
-async def get_records_by_user(user_id: str):
+    Responses carry an ETag built from the user's row count, newest
+    ``lastest_edit`` and the query string; a matching If-None-Match gets a
+    304 after one aggregate query.
+    """
     try:
         logger.info(f"Retrieving records for user {user_id}")
-        records = await Transactions.filter(user_id=user_id).all()
+        fingerprint = await transactions_fingerprint(user_id)
+        etag = make_etag(
+            "transactions", user_id, fingerprint, sorted(request.query_params.items())
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+
+        query = Transactions.filter(user_id=user_id)
+        if start_date:
+            query = query.filter(created_at__gte=start_date)
+        if end_date:
+            query = query.filter(created_at__lt=end_date)
+        if type:
+            query = query.filter(type=type)
+        if tag:
+            query = query.filter(tag=tag)
+
+        if limit is None and cursor is None:
+            records = await query.order_by("-created_at", "-id").values(
+                *TRANSACTION_OUT_FIELDS
+            )
+            logger.info(f"Successfully retrieved {len(records)} records from database")
+            return {
+                "body": records,
+                "message": "Records retrieved successfully",
+                "success": True,
+            }
+
+        if cursor:
+            last_created_at, last_id = decode_cursor(cursor)
+            query = query.filter(
+                Q(created_at__lt=last_created_at)
+                | Q(created_at=last_created_at, id__lt=last_id)
+            )
+        page_size = limit or MAX_PAGE_SIZE
+        # Fetch one extra row to learn whether another page exists.
+        records = (
+            await query.order_by("-created_at", "-id")
+            .limit(page_size + 1)
+            .values(*TRANSACTION_OUT_FIELDS)
+        )
+        next_cursor = None
+        if len(records) > page_size:
+            records = records[:page_size]
+            next_cursor = encode_cursor(records[-1]["created_at"], records[-1]["id"])
         logger.info(f"Successfully retrieved {len(records)} records from database")
         return {
             "body": records,
+            "next_cursor": next_cursor,
             "message": "Records retrieved successfully",
             "success": True,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving records for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@transaction_router.get(
+    "/sync/{user_id}", response_model=ResponseData[TransactionSync]
+)
+async def sync_records_by_user(
+    user_id: str,
+    since: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=5000),
+):
+    """
+    Changes since the client's last ``watermark``: edited/created rows plus
+    ids of deleted ones. Omit ``since`` for a full initial sync. If
+    ``cursor`` comes back, repeat the call with it (and the same ``since``);
+    store ``watermark`` from the last page for next time.
+    """
+    if since is not None and since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        page = await load_changes(
+            user_id, since, after, limit, TRANSACTION_OUT_FIELDS
+        )
+    except Exception as e:
+        logger.error(f"Error syncing records for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    logger.info(
+        f"Synced {len(page['changes'])} changes and {len(page['deleted'])} "
+        f"deletions for user {user_id}"
+    )
+    return {
+        "body": {
+            "changes": page["changes"],
+            "deleted": page["deleted"],
+            "watermark": page["watermark"],
+            "cursor": encode_cursor(*page["after"]) if page["after"] else None,
+            "reset": page["reset"],
+        },
+        "message": "Changes retrieved successfully",
+        "success": True,
+    }
+
+
+@transaction_router.get(
+    "/search/{user_id}", response_model=PageData[List[TransactionOut]]
+)
+async def search_records_by_user(
+    user_id: str,
+    q: str = Query(..., min_length=1, max_length=200),
+    fuzzy: bool = True,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    type: Optional[str] = None,
+    tag: Optional[str] = None,
+):
+    """
+    Search a user's records by ``detail`` and ``tag``, newest first.
+
+    ``q`` matches whole words, substrings (Thai included) and, with
+    ``fuzzy``, near misses; see server.db.search. Combine it with the date,
+    amount, ``type`` and ``tag`` filters, and pass ``next_cursor`` back as
+    ``cursor`` for the next page.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    after = decode_cursor(cursor) if cursor else None
+    try:
+        records = await search_transactions(
+            user_id,
+            q,
+            TRANSACTION_OUT_FIELDS,
+            limit + 1,
+            fuzzy=fuzzy,
+            after=after,
+            start_date=start_date,
+            end_date=end_date,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            type=type,
+            tag=tag,
+        )
+    except Exception as e:
+        logger.error(f"Error searching records for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1]["created_at"], records[-1]["id"])
+    logger.info(f"Found {len(records)} records matching search for user {user_id}")
+    return {
+        "body": records,
+        "next_cursor": next_cursor,
+        "message": "Records retrieved successfully",
+        "success": True,
+    }
+
+
+# period name -> (date_trunc unit, label format matching GraphView's keys)
+SUMMARY_PERIODS = {
+    "daily": ("day", "%Y-%m-%d"),
+    "weekly": ("week", "%Y-%m-%d"),
+    "monthly": ("month", "%Y-%m"),
+    "yearly": ("year", "%Y"),
+}
+
+# Anything that is not "income" counts as an expense, same as the dashboard.
+SUMMARY_BUCKET_SQL = """
+    SELECT date_trunc($1, created_at AT TIME ZONE $2) AS bucket,
+           SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS income,
+           SUM(CASE WHEN type = 'income' THEN 0 ELSE amount END) AS expense,
+           COUNT(*) AS count
+    FROM transactions
+    WHERE user_id = $3 AND created_at >= $4 AND created_at < $5
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+SUMMARY_TAG_SQL = """
+    SELECT tag,
+           SUM(CASE WHEN type = 'income' THEN amount ELSE 0 END) AS income,
+           SUM(CASE WHEN type = 'income' THEN 0 ELSE amount END) AS expense,
+           COUNT(*) AS count
+    FROM transactions
+    WHERE user_id = $1 AND created_at >= $2 AND created_at < $3
+    GROUP BY tag
+    ORDER BY tag
+"""
+
+# Same shapes, read from DailyRollup when the request lines up with its days.
+ROLLUP_BUCKET_SQL = """
+    SELECT date_trunc($1, day::timestamp) AS bucket,
+           SUM(income) AS income,
+           SUM(expense) AS expense,
+           SUM(income_count + expense_count) AS count
+    FROM transactions_daily_rollup
+    WHERE user_id = $2 AND day >= $3 AND day < $4
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+ROLLUP_TAG_SQL = """
+    SELECT tag,
+           SUM(income) AS income,
+           SUM(expense) AS expense,
+           SUM(income_count + expense_count) AS count
+    FROM transactions_daily_rollup
+    WHERE user_id = $1 AND day >= $2 AND day < $3
+    GROUP BY tag
+    ORDER BY tag
+"""
+
+
+def _rollup_day_bound(value: Optional[datetime.datetime], zone: ZoneInfo, default):
+    """Day boundary for a rollup read, or None if ``value`` is not local midnight."""
+    if value is None:
+        return default
+    local = value.astimezone(zone) if value.tzinfo else value
+    if local.time() != datetime.time(0):
+        return None
+    return local.date()
+
+
+def _period_start(day: datetime.date, unit: str) -> datetime.date:
+    """``date_trunc`` for a local day."""
+    if unit == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if unit == "month":
+        return day.replace(day=1)
+    if unit == "year":
+        return day.replace(month=1, day=1)
+    return day
+
+
+async def _summary_portable(user_id, unit, zone, start, end, day_start, day_end):
+    """Bucket and tag rows of the summary for databases without date_trunc."""
+    if day_start and day_end:
+        rows = await DailyRollup.filter(
+            user_id=user_id, day__gte=day_start, day__lt=day_end
+        ).values_list("day", "tag", "income", "expense", "income_count", "expense_count")
+        rows = [(day, tag, i, e, ic + ec) for day, tag, i, e, ic, ec in rows]
+    else:
+        raw = await Transactions.filter(
+            user_id=user_id, created_at__gte=start, created_at__lt=end
+        ).values_list("created_at", "tag", "type", "amount")
+        rows = [
+            (
+                created_at.astimezone(zone).date(),
+                tag,
+                amount if type == "income" else 0,
+                0 if type == "income" else amount,
+                1,
+            )
+            for created_at, tag, type, amount in raw
+        ]
+
+    buckets, tags = {}, {}
+    for day, tag, income, expense, count in rows:
+        for totals, key in (
+            (buckets, _period_start(day, unit)),
+            (tags, tag),
+        ):
+            row = totals.setdefault(key, {"income": 0.0, "expense": 0.0, "count": 0})
+            row["income"] += income or 0
+            row["expense"] += expense or 0
+            row["count"] += count
+    return (
+        [{"bucket": key, **totals} for key, totals in sorted(buckets.items())],
+        [{"tag": key, **totals} for key, totals in sorted(tags.items())],
+    )
+
+
+def _as_aware(value: Optional[datetime.datetime], tz: ZoneInfo, default):
+    if value is None:
+        return default
+    if value.tzinfo is None:
+        return value.replace(tzinfo=tz)
+    return value
+
+
+@transaction_router.get("/summary/{user_id}")
+async def get_summary_by_user(
+    user_id: str,
+    period: str = "monthly",
+    tz: str = "UTC",
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+):
+    """
+    Income/expense totals per time bucket and per tag, grouped in SQL.
+
+    Buckets are cut on local ``tz`` boundaries (weeks start on Monday);
+    naive ``start_date``/``end_date`` are read in that zone as well. Other
+    dialects (SQLite in development) total the same rows in Python.
+    """
+    if period not in SUMMARY_PERIODS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"period must be one of {', '.join(SUMMARY_PERIODS)}",
+        )
+    try:
+        zone = ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+
+    unit, label_format = SUMMARY_PERIODS[period]
+    start = _as_aware(
+        start_date, zone, datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+    )
+    end = _as_aware(
+        end_date, zone, datetime.datetime.max.replace(tzinfo=datetime.timezone.utc)
+    )
+
+    day_start = day_end = None
+    if tz == ROLLUP_TIMEZONE:
+        day_start = _rollup_day_bound(start_date, zone, datetime.date.min)
+        day_end = _rollup_day_bound(end_date, zone, datetime.date.max)
+
+    try:
+        conn = connections.get("default")
+        if conn.capabilities.dialect != "postgres":
+            bucket_rows, tag_rows = await _summary_portable(
+                user_id, unit, zone, start, end, day_start, day_end
+            )
+        elif day_start and day_end:
+            # O(days) read from the rollup table instead of scanning raw rows
+            bucket_rows = await conn.execute_query_dict(
+                ROLLUP_BUCKET_SQL, [unit, user_id, day_start, day_end]
+            )
+            tag_rows = await conn.execute_query_dict(
+                ROLLUP_TAG_SQL, [user_id, day_start, day_end]
+            )
+        else:
+            bucket_rows = await conn.execute_query_dict(
+                SUMMARY_BUCKET_SQL, [unit, tz, user_id, start, end]
+            )
+            tag_rows = await conn.execute_query_dict(
+                SUMMARY_TAG_SQL, [user_id, start, end]
+            )
+        logger.info(
+            f"Summarised {len(bucket_rows)} {period} buckets for user {user_id}"
+        )
+        return {
+            "body": {
+                "period": period,
+                "tz": tz,
+                "buckets": [
+                    {
+                        "date": row["bucket"].strftime(label_format),
+                        "income": row["income"] or 0,
+                        "expense": row["expense"] or 0,
+                        "count": row["count"],
+                    }
+                    for row in bucket_rows
+                ],
+                "tags": [
+                    {
+                        "tag": row["tag"],
+                        "income": row["income"] or 0,
+                        "expense": row["expense"] or 0,
+                        "count": row["count"],
+                    }
+                    for row in tag_rows
+                ],
+            },
+            "message": "Summary retrieved successfully",
+            "success": True,
+        }
+    except Exception as e:
+        logger.error(f"Error summarising records for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@transaction_router.get("/balance/{user_id}")
+async def get_balance_by_user(user_id: str):
+    """Lifetime income, expense and balance, summed from DailyRollup."""
+    try:
+        rows = await DailyRollup.filter(user_id=user_id).values_list(
+            "income", "expense", "income_count", "expense_count"
+        )
+        income = sum(r[0] for r in rows)
+        expense = sum(r[1] for r in rows)
+        return {
+            "body": {
+                "income": income,
+                "expense": expense,
+                "balance": income - expense,
+                "count": sum(r[2] + r[3] for r in rows),
+            },
+            "message": "Balance retrieved successfully",
+            "success": True,
+        }
+    except Exception as e:
+        logger.error(f"Error retrieving balance for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+
+@transaction_router.get("/export/{user_id}")
+async def export_records_by_user(
+    user_id: str,
+    format: str = "csv",
+    gzip: bool = False,
+    start_date: Optional[datetime.datetime] = None,
+    end_date: Optional[datetime.datetime] = None,
+    type: Optional[str] = None,
+    tag: Optional[str] = None,
+):
+    """
+    Download a user's full (filtered) history as CSV or NDJSON, oldest first.
+
+    Rows are streamed in fixed-size chunks, so memory use does not grow with
+    the number of transactions. ``gzip=true`` compresses the stream.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format must be one of {', '.join(EXPORT_FORMATS)}",
+        )
+    filters = {}
+    if start_date:
+        filters["created_at__gte"] = start_date
+    if end_date:
+        filters["created_at__lt"] = end_date
+    if type:
+        filters["type"] = type
+    if tag:
+        filters["tag"] = tag
+
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"transactions-{user_id}.{extension}"
+    if gzip:
+        media_type, filename = "application/gzip", f"{filename}.gz"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    async def body():
+        try:
+            async for chunk in export_transactions(user_id, format, gzip, **filters):
+                yield chunk
+        except Exception as e:
+            # Headers are already sent; all we can do is cut the stream short.
+            logger.error(f"Error exporting records for user {user_id}: {str(e)}")
+            raise
+        logger.info(f"Exported records for user {user_id} as {format}")
+
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+
+# Rows per INSERT statement for batch writes
+BATCH_CHUNK_SIZE = int(os.getenv("TRANSACTION_BATCH_CHUNK_SIZE", "1000"))
+MAX_BATCH_ITEMS = int(os.getenv("TRANSACTION_BATCH_MAX_ITEMS", "50000"))
+
+
+def validate_transaction_items(items: list):
+    """Split raw items into valid ``TransactionCreate`` objects and per-item errors."""
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, TransactionCreate.model_validate(item)))
+        except ValidationError as e:
+            errors.append(
+                {
+                    "index": index,
+                    "errors": [
+                        {"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()
+                    ],
+                }
+            )
+    return valid, errors
+
+
+async def bulk_insert_transactions(items: List[TransactionCreate]) -> list:
+    """
+    Insert many records with chunked multi-row INSERTs, their rollup deltas
+    and cache invalidation, all inside one DB transaction.
+    """
+    records = [Transactions(**item.model_dump()) for item in items]
+    return await insert_transaction_records(records)
+
+
+async def insert_transaction_records(records: List[Transactions]) -> list:
+    """``bulk_insert_transactions`` for already-built (unsaved) model instances."""
+    if not records:
+        return records
+    settings = await budget_settings(record.user_id for record in records)
+    async with in_transaction() as conn:
+        await Transactions.bulk_create(
+            records, batch_size=BATCH_CHUNK_SIZE, using_db=conn
+        )
+        await apply_rollup_batch(records, using_db=conn)
+        alerts = await check_budget(records, settings, using_db=conn)
+        for owner in {record.user_id for record in records}:
+            await invalidate_analysis(owner, using_db=conn)
+    publish_alerts(alerts)
+    return records
+
+
+async def save_ai_records(transaction_data: list, user_id: str) -> list:
+    """Insert AI-extracted records; items the model got wrong are logged and skipped."""
+    valid, errors = validate_transaction_items(
+        [{**item, "user_id": user_id} for item in transaction_data]
+    )
+    for error in errors:
+        logger.error(f"Skipping invalid AI record {error}")
+    records = await bulk_insert_transactions([item for _, item in valid])
+    logger.info(f"Created {len(records)} records from AI data")
+    return records
+
+
+@transaction_router.post("/import/{user_id}")
+async def import_statement(
+    user_id: str,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    tag: str = "",
+    tz: str = ROLLUP_TIMEZONE,
+    encoding: str = "utf-8-sig",
+    date_format: Optional[str] = None,
+    date_column: Optional[str] = None,
+    amount_column: Optional[str] = None,
+    debit_column: Optional[str] = None,
+    credit_column: Optional[str] = None,
+    detail_column: Optional[str] = None,
+):
+    """
+    Import a bank statement (CSV or OFX/QFX) as transactions.
+
+    The file is parsed incrementally and inserted in chunks. Rows already
+    imported before (same date, amount and description) are skipped, so the
+    same statement, or overlapping ones, can be uploaded again safely. CSV
+    columns are matched by common English/Thai header names unless the
+    ``*_column`` parameters name them; negative amounts or debits become
+    expenses.
+    """
+    head = await file.read(512)
+    await file.seek(0)
+    format = format or detect_format(file.filename, head)
+    if format not in ("csv", "ofx"):
+        raise HTTPException(status_code=400, detail="format must be one of csv, ofx")
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=400, detail=f"Unknown encoding: {encoding}")
+
+    report = ImportReport()
+    if format == "ofx":
+        rows = parse_ofx(file, encoding, report)
+    else:
+        columns = {
+            "date": date_column,
+            "amount": amount_column,
+            "debit": debit_column,
+            "credit": credit_column,
+            "detail": detail_column,
+        }
+        rows = parse_csv(file, encoding, date_format, columns, report)
+
+    try:
+        async for chunk in statement_chunks(user_id, rows, tag=tag, tz=tz):
+            report.rows += len(chunk)
+            fresh = await drop_existing(user_id, chunk)
+            try:
+                await insert_transaction_records(fresh)
+            except IntegrityError:
+                # A concurrent import of the same statement won the race.
+                fresh = await drop_existing(user_id, fresh)
+                await insert_transaction_records(fresh)
+            report.imported += len(fresh)
+            report.duplicates += len(chunk) - len(fresh)
+    except StatementError as e:
+        logger.error(f"Rejected statement for user {user_id}: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error importing statement for user {user_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    logger.info(
+        f"Imported {report.imported} records for user {user_id} "
+        f"({report.duplicates} duplicates, {report.rejected} rejected)"
+    )
+    return {
+        "body": {
+            "rows": report.rows + report.rejected,
+            "imported": report.imported,
+            "duplicates": report.duplicates,
+            "rejected": report.rejected,
+            "errors": report.errors,
+        },
+        "message": f"Imported {report.imported} records",
+        "success": not report.rejected,
+    }
+
+
+async def process_receipt_job(user_id: str, payload: dict) -> list:
+    processed = [
+        (base64.b64decode(image["data"]), image["mime_type"])
+        for image in payload["images"]
+    ]
+    transaction_data = await analyze_preprocessed_receipt(processed, user_id)
+    logger.info(f"AI analysis result: {transaction_data}")
+    records = await save_ai_records(transaction_data, user_id)
+    return jsonable_encoder(records)
+
+
+receipt_jobs.set_handler(process_receipt_job)
+
+
 @transaction_router.post("/images/{user_id}")
 async def create_record_with_image(
     user_id: str,
+    response: Response,
     images: List[UploadFile] = File(..., media_type="image"),
+    job: bool = False,
 ):
     """
     Accepts images, sends them to an AI for analysis, and creates a
     transaction record from the AI's JSON response.
+
+    With ``job=true`` the images are only validated and queued; the response
+    (202) carries a ``job_id`` to poll at ``/jobs/{job_id}`` or follow over
+    SSE at ``/jobs/{job_id}/events``.
     """
     if not images:
         raise HTTPException(status_code=400, detail="No images were uploaded.")
 
-    # Prepare images for the AI model by reading their content
-    image_parts = []
-    for image_file in images:
-        # Read image contents into memory
-        contents = await image_file.read()
-        # Use Pillow to open the image from bytes, which is what the
-        # google-generativeai library expects.
-        try:
-            img = PIL.Image.open(io.BytesIO(contents))
-            image_parts.append(img)
-        except Exception as e:
-            logger.error(f"Failed to process image {image_file.filename}: {e}")
-            raise HTTPException(
-                status_code=400, detail=f"Invalid image file: {image_file.filename}"
-            )
+    # Read every upload; decoding and downscaling happen off the event loop
+    image_bytes = [await image_file.read() for image_file in images]
 
-    # Call the AI service to analyze the images and get structured data
     try:
-        transaction_data = await analyze_transaction_from_image(image_parts, user_id)
+        if job:
+            processed = await preprocess_images(image_bytes)
+            queued = await receipt_jobs.enqueue(
+                user_id,
+                {
+                    "images": [
+                        {"mime_type": mime_type, "data": base64.b64encode(data).decode()}
+                        for data, mime_type in processed
+                    ]
+                },
+            )
+            response.status_code = 202
+            return {
+                "body": job_status(queued),
+                "message": "Receipt queued for processing",
+                "success": True,
+            }
+
+        # Call the AI service to analyze the images and get structured data
+        transaction_data = await analyze_receipt_images(image_bytes, user_id)
         logger.info(f"AI analysis result: {transaction_data}")
         # Create the record in the database using the data from the AI
-        records = []
-        for item in transaction_data:
-            item["user_id"] = user_id
-            record = await Transactions.create(**item)
-            records.append(record)
-            logger.info(f"Record created successfully from AI data: {record.id}")
+        records = await save_ai_records(transaction_data, user_id)
         return {
             "body": records,
             "message": "Records created successfully",
             "success": True,
         }
+    except HTTPException:
+        raise
+    except InvalidImage as e:
+        filename = images[e.index].filename if e.index is not None else ""
+        logger.error(f"Failed to process image {filename}: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {filename}")
+    except JobQueueFull as e:
+        logger.warning(f"Receipt job queue full: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="Too many receipts queued, please retry shortly",
+            headers={"Retry-After": "5"},
+        )
     except Exception as e:
         # This will catch errors from both the AI call and the database creation
         logger.error(f"Error creating record from image: {str(e)}")
@@ -87,10 +819,57 @@ async def create_record_with_image(
         )
 
 
-@transaction_router.get("/")
+@transaction_router.get("/jobs/{job_id}")
+async def get_receipt_job(job_id: str):
+    """Current status of a queued receipt; ``result`` holds the created records."""
+    try:
+        queued = await receipt_jobs.get(job_id)
+    except Exception as e:
+        logger.error(f"Error retrieving job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    if not queued:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "body": job_status(queued),
+        "message": "Job retrieved successfully",
+        "success": True,
+    }
+
+
+@transaction_router.get("/jobs/{job_id}/events")
+async def stream_receipt_job(job_id: str, request: Request):
+    """Server-sent events: one ``status`` event per change until the job ends."""
+    if not await receipt_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last = None
+        while not await request.is_disconnected():
+            queued = await receipt_jobs.get(job_id)
+            state = job_status(queued)
+            marker = (state["status"], state["attempts"])
+            if marker != last:
+                last = marker
+                data = json.dumps(jsonable_encoder(state))
+                yield f"event: status\ndata: {data}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if state["status"] in TERMINAL_STATUSES:
+                return
+            # Local workers wake us immediately; other processes are polled.
+            await receipt_jobs.wait_for_change(job_id, timeout=2.0)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@transaction_router.get("/", response_model=ResponseData[List[TransactionOut]])
 async def get_records():
     try:
-        records = await Transactions.all()
+        records = await Transactions.all().values(*TRANSACTION_OUT_FIELDS)
         logger.info(f"Successfully retrieved {len(records)} records from database")
         return {
             "body": records,
@@ -105,13 +884,20 @@ async def get_records():
 @transaction_router.post("/")
 async def create_record(record_data: TransactionCreate):
     try:
-        record = await Transactions.create(
-            user_id=record_data.user_id,
-            amount=record_data.amount,
-            type=record_data.type,
-            detail=record_data.detail,
-            tag=record_data.tag,
-        )
+        settings = await budget_settings([record_data.user_id])
+        async with in_transaction() as conn:
+            record = await Transactions.create(
+                user_id=record_data.user_id,
+                amount=record_data.amount,
+                type=record_data.type,
+                detail=record_data.detail,
+                tag=record_data.tag,
+                using_db=conn,
+            )
+            await apply_rollup(record, 1, using_db=conn)
+            alerts = await check_budget([record], settings, using_db=conn)
+            await invalidate_analysis(record.user_id, using_db=conn)
+        publish_alerts(alerts)
         logger.info(f"Record created successfully: {record}")
         return {
             "body": record,
@@ -123,6 +909,41 @@ async def create_record(record_data: TransactionCreate):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+@transaction_router.post("/batch")
+async def create_records_batch(batch: TransactionBatchCreate):
+    """
+    Create many records in one request and one DB transaction.
+
+    Every item is validated on its own: valid items are inserted, invalid
+    ones come back in ``errors`` with their index. ``created`` lists the new
+    ids in the order of the valid items.
+    """
+    if len(batch.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {MAX_BATCH_ITEMS} items per batch",
+        )
+    valid, errors = validate_transaction_items(batch.items)
+    try:
+        records = await bulk_insert_transactions([item for _, item in valid])
+    except Exception as e:
+        logger.error(f"Error creating batch of {len(valid)} records: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+    logger.info(f"Batch created {len(records)} records, rejected {len(errors)}")
+    return {
+        "body": {
+            "created": [
+                {"index": index, "id": str(record.id)}
+                for (index, _), record in zip(valid, records)
+            ],
+            "errors": errors,
+        },
+        "message": f"Created {len(records)} records, {len(errors)} rejected",
+        "success": not errors,
+    }
+
+
 @transaction_router.get("/{record_id}")
 async def get_record(record_id: str):
     try:
@@ -141,26 +962,96 @@ async def get_record(record_id: str):
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 
+# Single-statement writes. Postgres locks the old row and returns it next to
+# the new one; other dialects read it first inside the same transaction.
+UPDATE_RECORD_SQL = """
+    UPDATE transactions AS t
+    SET user_id = $2, amount = $3, type = $4, detail = $5, tag = $6,
+        lastest_edit = $7
+    FROM (
+        SELECT id, user_id, amount, type, tag
+        FROM transactions WHERE id = $1 FOR UPDATE
+    ) AS old
+    WHERE t.id = old.id
+    RETURNING t.*, old.user_id AS old_user_id, old.amount AS old_amount,
+              old.type AS old_type, old.tag AS old_tag
+"""
+
+UPDATE_RECORD_PLAIN_SQL = """
+    UPDATE transactions
+    SET user_id = $2, amount = $3, type = $4, detail = $5, tag = $6,
+        lastest_edit = $7
+    WHERE id = $1
+    RETURNING *
+"""
+
+DELETE_RECORD_SQL = "DELETE FROM transactions WHERE id = $1 RETURNING *"
+
+
+def _dialect_sql(conn, sql: str) -> str:
+    """Queries here are written with $n; SQLite spells them ?n."""
+    if conn.capabilities.dialect == "postgres":
+        return sql
+    return re.sub(r"\$(\d+)", r"?\1", sql)
+
+
 @transaction_router.put("/{record_id}")
 async def update_record(record_id: str, record_data: TransactionBase):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    values = [
+        record_id,
+        record_data.user_id,
+        record_data.amount,
+        record_data.type,
+        record_data.detail,
+        record_data.tag,
+        now,
+    ]
     try:
-        record = await Transactions.get(id=record_id)
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
+        settings = await budget_settings([record_data.user_id])
+        async with in_transaction() as conn:
+            if conn.capabilities.dialect == "postgres":
+                rows = await conn.execute_query_dict(UPDATE_RECORD_SQL, values)
+                if not rows:
+                    raise HTTPException(status_code=404, detail="Record not found")
+                record = Transactions._init_from_db(**rows[0])
+                old = Transactions(
+                    user_id=rows[0]["old_user_id"],
+                    amount=rows[0]["old_amount"],
+                    type=rows[0]["old_type"],
+                    tag=rows[0]["old_tag"],
+                    created_at=record.created_at,
+                )
+            else:
+                old = (
+                    await Transactions.filter(id=record_id)
+                    .using_db(conn)
+                    .only("user_id", "amount", "type", "tag", "created_at")
+                    .first()
+                )
+                if not old:
+                    raise HTTPException(status_code=404, detail="Record not found")
+                rows = await conn.execute_query_dict(
+                    _dialect_sql(conn, UPDATE_RECORD_PLAIN_SQL), values
+                )
+                record = Transactions._init_from_db(**rows[0])
 
-        await record.update_or_create(
-            user_id=record_data.user_id,
-            amount=record_data.amount,
-            type=record_data.type,
-            detail=record_data.detail,
-            tag=record_data.tag,
-        )
+            await apply_rollup_change(old, record, using_db=conn)
+            alerts = await check_budget_change(old, record, settings, using_db=conn)
+            if old.user_id != record.user_id:
+                # Gone from the old owner's point of view.
+                await record_tombstone(record.id, old.user_id, using_db=conn)
+                await invalidate_analysis(old.user_id, using_db=conn)
+            await invalidate_analysis(record.user_id, using_db=conn)
+        publish_alerts(alerts)
         logger.info(f"Successfully updated record {record_id}")
         return {
             "body": record,
             "message": "Record created successfully",
             "success": True,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating record {record_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -169,13 +1060,21 @@ async def update_record(record_id: str, record_data: TransactionBase):
 @transaction_router.delete("/{record_id}")
 async def delete_record(record_id: str):
     try:
-        record = await Transactions.get(id=record_id)
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
+        async with in_transaction() as conn:
+            rows = await conn.execute_query_dict(
+                _dialect_sql(conn, DELETE_RECORD_SQL), [record_id]
+            )
+            if not rows:
+                raise HTTPException(status_code=404, detail="Record not found")
+            record = Transactions._init_from_db(**rows[0])
 
-        await record.delete()
+            await record_tombstone(record.id, record.user_id, using_db=conn)
+            await apply_rollup(record, -1, using_db=conn)
+            await invalidate_analysis(record.user_id, using_db=conn)
         logger.info(f"Successfully deleted record {record_id}")
         return {"message": "Record deleted successfully", "success": True, "body": None}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting record {record_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -1,9 +1,12 @@
 from fastapi import HTTPException, APIRouter
+from typing import List
 from server.db.models import User
+from tortoise.exceptions import IntegrityError
 from pydantic import BaseModel
 import logging
 
-from server.schemes import UserBase, UserCreate
+from server.schemes import UserBase, UserCreate, UserOut
+from server.services.entity_cache import user_cache
 
 
 class VerifyCredentials(BaseModel):
@@ -18,11 +21,11 @@ logger = logging.getLogger(__name__)
 user_router = APIRouter(tags=["Users"])
 
 
-@user_router.get("/")
+@user_router.get("/", response_model=List[UserOut])
 async def get_users():
-    """Get all users from the database"""
+    """Get all users from the database (password hashes are never returned)"""
     try:
-        users = await User.all()
+        users = await User.all().values(*UserOut.model_fields)
         logger.info(f"Successfully retrieved {len(users)} users from database")
         return users
     except Exception as e:
@@ -34,12 +37,14 @@ async def get_users():
 async def get_user(user_id: str):
     """Get a specific user by ID"""
     try:
-        user = await User.get(id=user_id)
+        user = await user_cache.get(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         logger.info(f"Successfully retrieved user {user_id}")
         return user
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error retrieving user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -49,35 +54,28 @@ async def get_user(user_id: str):
 async def create_user(user_data: UserCreate):
     """Create a new user"""
     try:
-        # Check if user already exists
-        existing_user = await User.filter(email=user_data.email).first()
-        if existing_user:
-            raise HTTPException(
-                status_code=400, detail="User with this email already exists"
-            )
-
-        existing_username = await User.filter(username=user_data.username).first()
-        if existing_username:
-            raise HTTPException(
-                status_code=400, detail="User with this username already exists"
-            )
-
-        # Create new user
+        # Insert first; the unique indexes decide, so no existence SELECTs.
         user = await User.create(
             username=user_data.username,
             email=user_data.email,
             password=user_data.password,  # In production, hash this password
             # created_at=User.created_at.default(),
         )
-
-        logger.info(f"Successfully created user {user.username}")
-        return user
-    except HTTPException:
-        raise
+    except IntegrityError:
+        if await User.filter(email=user_data.email).exists():
+            raise HTTPException(
+                status_code=400, detail="User with this email already exists"
+            )
+        raise HTTPException(
+            status_code=400, detail="User with this username already exists"
+        )
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
+    logger.info(f"Successfully created user {user.username}")
+    return user
+
 
 # to verify users
 @user_router.post("/verify")
@@ -1,7 +1,10 @@
-from fastapi import HTTPException, APIRouter
+from fastapi import HTTPException, APIRouter, Request, Response
 from server.db.models import UsersSetting
 from server.schemes import UserSettingBase
+from server.services.conditional import etag_matches, make_etag, not_modified, set_etag
+from server.services.entity_cache import settings_cache
 
+import datetime
 import logging
 
 usersetting_router = APIRouter(tags=["Usersetting"])
@@ -21,6 +24,8 @@ async def create_financial_settings(financial_data: UserSettingBase):
             goal_description=financial_data.goal_description,
             conclusion_routine=financial_data.conclusion_routine,
         )
+        # Drops a cached "no settings" entry.
+        await settings_cache.invalidate(financial_data.user_id)
         logger.info(
             f"Successfully created financial settings for user {financial_data.user_id}"
         )
@@ -33,9 +38,9 @@ async def create_financial_settings(financial_data: UserSettingBase):
 
 
 @usersetting_router.get("/{user_id}")
-async def get_financial_settings(user_id: str):
+async def get_financial_settings(user_id: str, request: Request, response: Response):
     try:
-        record = await UsersSetting.all().filter(user_id=user_id).first()
+        record = await settings_cache.get(user_id)
         if not record:
             return {
                 "message": "Financial settings not found",
@@ -44,6 +49,11 @@ async def get_financial_settings(user_id: str):
                 ),
                 "success": False,
             }
+        # One row by primary key; its update_at is the whole fingerprint.
+        etag = make_etag("usersettings", user_id, record["update_at"].isoformat())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
         logger.info(f"Successfully retrieved financial settings for user {user_id}")
         return {
             "message": "Financial settings retrieved successfully",
@@ -64,11 +74,11 @@ async def get_financial_settings(user_id: str):
 @usersetting_router.put("/{user_id}")
 async def update_financial_settings(user_id: str, financial_data: UserSettingBase):
     try:
-        record = await UsersSetting.get(user_id=user_id)
-        if not record:
-            raise HTTPException(status_code=404, detail="Financial settings not found")
-        logger.info(f"Updating financial settings for user : {record.user_id}")
-        await record.select_for_update().update(
+        logger.info(f"Updating financial settings for user : {user_id}")
+        # One conditional UPDATE; QuerySet.update skips auto_now, so bump
+        # update_at (the ETag) here.
+        updated = await UsersSetting.filter(user_id=user_id).update(
+            update_at=datetime.datetime.now(datetime.timezone.utc),
             daily_spending_limit=financial_data.daily_spending_limit,
             monthly_income=financial_data.monthly_income,
             notify_over_budget=financial_data.notify_over_budget,
@@ -76,8 +86,13 @@ async def update_financial_settings(user_id: str, financial_data: UserSettingBas
             goal_description=financial_data.goal_description,
             conclusion_routine=financial_data.conclusion_routine,
         )
+        if not updated:
+            raise HTTPException(status_code=404, detail="Financial settings not found")
+        await settings_cache.invalidate(user_id)
         logger.info(f"Successfully updated financial settings for user {user_id}")
         return {"message": "Financial settings updated successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating financial settings for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -86,13 +101,15 @@ async def update_financial_settings(user_id: str, financial_data: UserSettingBas
 @usersetting_router.delete("/{user_id}")
 async def delete_financial_settings(user_id: str):
     try:
-        record = await UsersSetting.get(user_id=user_id)
-        if not record:
+        deleted = await UsersSetting.filter(user_id=user_id).delete()
+        if not deleted:
             raise HTTPException(status_code=404, detail="Financial settings not found")
+        await settings_cache.invalidate(user_id)
 
-        await record.delete()
         logger.info(f"Successfully deleted financial settings for user {user_id}")
         return {"message": "Financial settings deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting financial settings for user {user_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
@@ -1,6 +1,9 @@
-from typing import Any
+import datetime
+import uuid
+from typing import Any, Generic, List, Optional, TypeVar
 from pydantic import BaseModel
-from typing import Any
+
+T = TypeVar("T")
 
 
 class UserBase(BaseModel):
@@ -33,6 +36,60 @@ class TransactionCreate(BaseModel):
     tag: str
 
 
+class TransactionOut(BaseModel):
+    # Columns the dashboard reads; list endpoints project exactly these.
+    id: uuid.UUID
+    user_id: str
+    amount: float
+    type: str
+    detail: str
+    tag: str
+    created_at: datetime.datetime
+
+
+class TransactionSync(BaseModel):
+    changes: List[TransactionOut]
+    deleted: List[uuid.UUID]
+    watermark: datetime.datetime
+    # Set when more changes remain: call again with the same ``since``.
+    cursor: Optional[str] = None
+    # The watermark was too old to sync from; replace the local copy.
+    reset: bool = False
+
+
+class UserOut(BaseModel):
+    id: uuid.UUID
+    username: str
+    email: str
+    created_at: datetime.datetime
+
+
+class BudgetAlertOut(BaseModel):
+    id: int
+    user_id: str
+    kind: str  # over_budget, low_saving
+    period: str  # day, month
+    period_start: datetime.date
+    threshold: float
+    amount: float
+    created_at: datetime.datetime
+
+
+class ScheduledSummaryOut(BaseModel):
+    id: int
+    user_id: str
+    routine: str  # daily, weekly, monthly
+    period_start: datetime.date
+    period_end: datetime.date  # exclusive
+    content: str
+    created_at: datetime.datetime
+
+
+class TransactionBatchCreate(BaseModel):
+    # Items are validated one by one so a bad row is reported, not fatal.
+    items: List[Any]
+
+
 class UserSettingBase(BaseModel):
     user_id: str
     daily_spending_limit: float
@@ -43,12 +100,16 @@ class UserSettingBase(BaseModel):
     conclusion_routine: str
 
 
-class ResponseData(BaseModel):
-    body: Any
+class ResponseData(BaseModel, Generic[T]):
+    body: T
     message: str
     success: bool
 
 
+class PageData(ResponseData[T], Generic[T]):
+    next_cursor: Optional[str] = None
+
+
 #   export type ResponseData = {
 #   body: JSON;
 #   message: string;
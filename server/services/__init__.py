@@ -0,0 +1,6 @@
+"""
+Services package for FastAPI application.
+
+Shared, router-independent building blocks (schedulers, caches, workers)
+used by the routers in server/routers.
+"""
@@ -0,0 +1,137 @@
+"""
+Bounded concurrency scheduler for model calls.
+
+All Gemini requests go through a single ``AIScheduler`` so one worker never
+has more than ``max_concurrency`` calls in flight. Up to ``max_queue`` callers
+may wait for a slot; anything beyond that is rejected immediately with
+``SchedulerSaturated`` instead of piling up behind slow generations.
+"""
+
+import asyncio
+import logging
+import os
+from typing import AsyncIterator, Awaitable, Callable, Optional, TypeVar
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+T = TypeVar("T")
+
+
+class SchedulerSaturated(Exception):
+    """Raised when every slot is busy and the wait queue is full."""
+
+
+class AIScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        # admitted = running + waiting; counted synchronously so a burst of
+        # callers in the same loop tick cannot all slip past the queue bound.
+        self._admitted = 0
+        self._running = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "running": self._running,
+            "waiting": self._admitted - self._running,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None,
+    ) -> T:
+        """
+        Await ``call()`` once a slot is free.
+
+        ``timeout`` (default: the scheduler's) covers queue wait plus the call
+        itself and raises ``asyncio.TimeoutError`` when exceeded.
+        """
+        self._admit()
+        try:
+            return await asyncio.wait_for(
+                self._run(call), timeout if timeout is not None else self.timeout
+            )
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self._admitted -= 1
+
+    async def stream(
+        self,
+        call: Callable[[], Awaitable[AsyncIterator[T]]],
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[T]:
+        """
+        Yield the chunks of a streaming call while holding one slot.
+
+        The deadline covers the whole stream. Closing the generator early
+        (e.g. the client went away) closes the upstream stream as well and
+        frees the slot immediately.
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout if timeout is not None else self.timeout)
+        acquired = False
+        iterator = None
+        try:
+            await asyncio.wait_for(self._slots.acquire(), deadline - loop.time())
+            acquired = True
+            self._running += 1
+            iterator = await asyncio.wait_for(call(), deadline - loop.time())
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        iterator.__anext__(), deadline - loop.time()
+                    )
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            if iterator is not None and hasattr(iterator, "aclose"):
+                await iterator.aclose()
+            if acquired:
+                self._running -= 1
+                self._slots.release()
+            self._admitted -= 1
+
+    def _admit(self) -> None:
+        if self._admitted >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            raise SchedulerSaturated(
+                f"{self._running} AI calls running and "
+                f"{self._admitted - self._running} queued"
+            )
+        self._admitted += 1
+
+    async def _run(self, call: Callable[[], Awaitable[T]]) -> T:
+        async with self._slots:
+            self._running += 1
+            try:
+                return await call()
+            finally:
+                self._running -= 1
+
+
+ai_scheduler = AIScheduler(
+    max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "4")),
+    max_queue=int(os.getenv("AI_MAX_QUEUE", "16")),
+    timeout=float(os.getenv("AI_TIMEOUT_SECONDS", "60")),
+)
@@ -0,0 +1,57 @@
+"""
+Per-user cache for the AI financial analysis.
+
+An entry is valid while the user's transaction set is unchanged, detected
+by a fingerprint of row count plus the newest ``lastest_edit`` (one
+aggregate query instead of loading every row). Writes in transactionRoute.py
+also drop the entry explicitly, inside their own DB transaction.
+"""
+
+import datetime
+import logging
+from typing import Optional
+
+from tortoise.functions import Count, Max
+
+from server.db.models import AnalysisCache, Transactions
+
+logger = logging.getLogger(__name__)
+
+
+async def transactions_fingerprint(user_id: str) -> str:
+    row = (
+        await Transactions.filter(user_id=user_id)
+        .annotate(count=Count("id"), last_edit=Max("lastest_edit"))
+        .values("count", "last_edit")
+    )[0]
+    last_edit = row["last_edit"].isoformat() if row["last_edit"] else "-"
+    return f"{row['count']}:{last_edit}"
+
+
+async def get_cached_analysis(
+    user_id: str, fingerprint: str, max_age: Optional[float] = None
+) -> Optional[str]:
+    """Cached markdown if it matches ``fingerprint`` and is younger than ``max_age`` s."""
+    entry = await AnalysisCache.get_or_none(user_id=user_id)
+    if entry is None or entry.fingerprint != fingerprint:
+        return None
+    if max_age is not None:
+        age = datetime.datetime.now(datetime.timezone.utc) - entry.created_at
+        if age.total_seconds() > max_age:
+            return None
+    return entry.content
+
+
+async def store_analysis(user_id: str, fingerprint: str, content: str) -> None:
+    try:
+        await AnalysisCache.update_or_create(
+            user_id=user_id,
+            defaults={"fingerprint": fingerprint, "content": content},
+        )
+    except Exception as e:
+        # A failed cache write must never fail the request that produced it.
+        logger.error(f"Failed to cache analysis for user {user_id}: {e}")
+
+
+async def invalidate_analysis(user_id: str, using_db=None) -> None:
+    await AnalysisCache.filter(user_id=user_id).using_db(using_db).delete()
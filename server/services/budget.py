@@ -0,0 +1,212 @@
+"""
+Budget alerts for ``notify_over_budget`` / ``notify_low_saving``.
+
+Spend is read from ``DailyRollup``, which every transaction write already
+updates in its own DB transaction; the write then calls ``check_budget``
+on the same connection, with settings loaded by ``budget_settings`` before
+that transaction was opened. When it raised the expense of the user's
+current local day or month (``ROLLUP_TIMEZONE``) that period's total is
+checked against the user's settings:
+
+- ``over_budget``: today's expense goes above ``daily_spending_limit``;
+- ``low_saving``: this month's expense goes above ``monthly_income`` minus
+  ``BUDGET_MIN_SAVING_RATE`` of it.
+
+Spend is not kept in a running counter. The check is one SUM over the
+user's buckets for the current month, an index range on DailyRollup's
+``(user_id, day, tag)`` key of at most 31 days x tags rows. It only runs
+for writes that add expense to the current day or month of a user with an
+alert enabled. A counter would be a second copy of the rollup that every
+write path, rebuild and backfill has to keep in step.
+
+An alert is stored in ``BudgetAlert`` only by the write that crosses the
+threshold (``before <= threshold < after``), and the table's unique key
+keeps it to one per kind and period even if concurrent writes race.
+Alerts are read from ``/alerts/{user_id}`` or streamed from
+``/alerts/{user_id}/events``; writers wake the local stream after commit
+and other workers are polled.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.functions import Sum
+from tortoise.transactions import in_transaction
+
+from server.db.models import BudgetAlert, DailyRollup, UsersSetting
+from server.db.rollup import rollup_day
+from server.services.entity_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+BUDGET_MIN_SAVING_RATE = float(os.getenv("BUDGET_MIN_SAVING_RATE", "0.2"))
+# Cross-worker fallback: how often an alert stream re-reads the table.
+ALERT_POLL_SECONDS = float(os.getenv("BUDGET_ALERT_POLL_SECONDS", "5"))
+
+DAY, MONTH = "day", "month"
+OVER_BUDGET, LOW_SAVING = "over_budget", "low_saving"
+
+
+def _added_expense(records, sign: int, added=None) -> Dict[str, Dict]:
+    """Expense added per user and local day, ``{user_id: {day: amount}}``."""
+    if added is None:
+        added = defaultdict(lambda: defaultdict(float))
+    for record in records:
+        if record.type != "income":
+            day = rollup_day(record.created_at)
+            added[record.user_id][day] += sign * float(record.amount or 0)
+    return added
+
+
+async def budget_settings(user_ids: Iterable[str]) -> Dict[str, Optional[dict]]:
+    """
+    Settings for ``check_budget``, from the shared cache. Call before the
+    write's ``in_transaction``: a cache miss may wait on another request's
+    load, which itself waits for that transaction's lock (SQLite) or for a
+    second pool connection (Postgres).
+    """
+    return {user_id: await settings_cache.get(user_id) for user_id in set(user_ids)}
+
+
+async def check_budget(records, settings: dict, using_db=None) -> List[BudgetAlert]:
+    """
+    Alerts raised by newly written ``records``. Call inside the write's
+    ``in_transaction`` after its rollup update, with ``budget_settings``
+    for the records' owners, and pass the result to ``publish_alerts`` once
+    it commits.
+    """
+    return await _check(_added_expense(records, 1), settings, using_db)
+
+
+async def check_budget_change(
+    old, new, settings: dict, using_db=None
+) -> List[BudgetAlert]:
+    """``check_budget`` for an edited transaction, on its net change."""
+    added = _added_expense([old], -1)
+    return await _check(_added_expense([new], 1, added), settings, using_db)
+
+
+async def _check(added: dict, settings: dict, using_db) -> List[BudgetAlert]:
+    alerts = []
+    for user_id, by_day in added.items():
+        alerts += await _evaluate(user_id, by_day, settings, using_db)
+    return alerts
+
+
+async def _evaluate(
+    user_id, by_day: dict, settings: dict, using_db
+) -> List[BudgetAlert]:
+    today = rollup_day(datetime.datetime.now(datetime.timezone.utc))
+    starts = {DAY: today, MONTH: today.replace(day=1)}
+    month_end = (starts[MONTH] + datetime.timedelta(days=32)).replace(day=1)
+    added = {
+        DAY: by_day.get(today, 0.0),
+        MONTH: sum(v for day, v in by_day.items() if starts[MONTH] <= day < month_end),
+    }
+    if added[MONTH] <= 0 and added[DAY] <= 0:
+        # Back-dated writes (imports, old edits) and refunds cannot cross.
+        return []
+    if user_id in settings:
+        settings = settings[user_id]
+    else:
+        # Owner not known before the write: read on its own connection.
+        settings = (
+            await UsersSetting.filter(user_id=user_id)
+            .using_db(using_db)
+            .first()
+            .values()
+        )
+    if not settings:
+        return []
+
+    rules = []
+    if settings["notify_over_budget"] and settings["daily_spending_limit"] > 0:
+        rules.append((OVER_BUDGET, DAY, settings["daily_spending_limit"]))
+    if settings["notify_low_saving"] and settings["monthly_income"] > 0:
+        limit = settings["monthly_income"] * (1 - BUDGET_MIN_SAVING_RATE)
+        rules.append((LOW_SAVING, MONTH, limit))
+    rules = [rule for rule in rules if added[rule[1]] > 0]
+    if not rules:
+        return []
+
+    # One aggregate over the month's buckets, including this write's change.
+    row = (
+        await DailyRollup.filter(
+            user_id=user_id, day__gte=starts[MONTH], day__lt=month_end
+        )
+        .using_db(using_db)
+        .annotate(
+            month=Sum("expense"), today=Sum("expense", _filter=Q(day=today))
+        )
+        .values("month", "today")
+    )[0]
+    totals = {DAY: row["today"] or 0.0, MONTH: row["month"] or 0.0}
+    alerts = []
+    for kind, period, threshold in rules:
+        after = totals[period]
+        if not after - added[period] <= threshold < after:
+            continue
+        try:
+            async with in_transaction() as savepoint:
+                alert = await BudgetAlert.create(
+                    user_id=user_id,
+                    kind=kind,
+                    period=period,
+                    period_start=starts[period],
+                    threshold=threshold,
+                    amount=after,
+                    using_db=savepoint,
+                )
+        except IntegrityError:
+            # Already alerted this period (spend dipped and crossed again).
+            continue
+        logger.info(f"Budget alert {kind} for user {user_id}: {after} > {threshold}")
+        alerts.append(alert)
+    return alerts
+
+
+# --- Delivery ---------------------------------------------------------------
+
+_watchers: Dict[str, List[asyncio.Event]] = {}
+
+
+def publish_alerts(alerts: List[BudgetAlert]) -> None:
+    """Wake this process's alert streams; call after the write commits."""
+    for user_id in {alert.user_id for alert in alerts}:
+        for event in _watchers.get(user_id, []):
+            event.set()
+
+
+async def wait_for_alert(user_id: str, timeout: float = ALERT_POLL_SECONDS) -> None:
+    """Sleep until a local write raises an alert for ``user_id`` or ``timeout``."""
+    event = asyncio.Event()
+    _watchers.setdefault(user_id, []).append(event)
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        watchers = _watchers.get(user_id, [])
+        if event in watchers:
+            watchers.remove(event)
+        if not watchers:
+            _watchers.pop(user_id, None)
+
+
+async def alerts_after(user_id: str, after_id: int, limit: int = 100) -> list:
+    return (
+        await BudgetAlert.filter(user_id=user_id, id__gt=after_id)
+        .order_by("id")
+        .limit(limit)
+        .values()
+    )
+
@@ -0,0 +1,44 @@
+"""
+Conditional GET helpers (ETag / If-None-Match).
+
+ETags are weak (``W/"..."``): the same data may go out gzip-compressed or
+not, and only semantic equality matters for a dashboard re-fetch. Callers
+derive the tag from a cheap fingerprint (row count plus newest edit time)
+so an unchanged resource is answered with 304 without loading its rows.
+"""
+
+import hashlib
+
+from fastapi import Request, Response
+
+# Clients must revalidate every time, but may keep the body to do so.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison against every tag listed in If-None-Match."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque for candidate in header.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
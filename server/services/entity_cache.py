@@ -0,0 +1,236 @@
+"""
+Read-through cache for ``User`` and ``UsersSetting`` rows.
+
+``user_cache`` and ``settings_cache`` keep each row's fields as a plain dict
+in an in-process LRU (``ENTITY_CACHE_MAX_ENTRIES``) for at most
+``ENTITY_CACHE_TTL_SECONDS``. Missing rows are cached as ``None`` as well:
+budget checks look settings up on every transaction write, and most users
+have none. Concurrent misses for one key share a single query.
+
+Writers call ``invalidate`` once their change is committed. It drops the
+local entry and, on Postgres, sends ``NOTIFY entity_cache`` so every other
+worker drops it too; each worker LISTENs on one dedicated connection. While
+that connection is down the cache is bypassed, and it is emptied whenever
+the listener (re)connects, so a worker that may have missed a notification
+never answers from memory. SQLite has no channel and is single-process.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from tortoise import connections
+from tortoise.exceptions import ValidationError
+
+from server.db.models import User, UsersSetting
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+ENTITY_CACHE_ENABLED = os.getenv("ENTITY_CACHE_ENABLED", "true").lower() == "true"
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv("ENTITY_CACHE_TTL_SECONDS", "60"))
+ENTITY_CACHE_MAX_ENTRIES = int(os.getenv("ENTITY_CACHE_MAX_ENTRIES", "10000"))
+NOTIFY_CHANNEL = "entity_cache"
+LISTEN_RETRY_SECONDS = 5.0
+
+
+def _dialect() -> Optional[str]:
+    try:
+        return connections.get("default").capabilities.dialect
+    except Exception:
+        return None
+
+
+class InvalidationChannel:
+    """Postgres LISTEN/NOTIFY fan-out of cache invalidations between workers."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._caches: Dict[str, "EntityCache"] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._connected = False
+
+    def register(self, cache: "EntityCache") -> None:
+        self._caches[cache.name] = cache
+
+    def ready(self) -> bool:
+        """Whether cached entries can be trusted; starts the listener if needed."""
+        dialect = _dialect()
+        if dialect is None:
+            return False
+        if dialect != "postgres":
+            return True
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen(), name="entity-cache-listen")
+        return self._connected
+
+    async def publish(self, name: str, key: str) -> None:
+        if _dialect() != "postgres":
+            return
+        try:
+            await connections.get("default").execute_query(
+                "SELECT pg_notify($1, $2)", [self.channel, f"{name}:{key}"]
+            )
+        except Exception as e:
+            # Other workers fall back on the TTL for this key.
+            logger.error(f"Failed to publish cache invalidation {name}:{key}: {e}")
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:
+        name, _, key = payload.partition(":")
+        cache = self._caches.get(name)
+        if cache is not None:
+            cache.drop(key)
+
+    def _on_lost(self, connection) -> None:
+        self._connected = False
+
+    async def _listen(self) -> None:
+        import asyncpg
+
+        while True:
+            connection = None
+            try:
+                client = connections.get("default")
+                connection = await asyncpg.connect(
+                    host=client.host,
+                    port=client.port,
+                    user=client.user,
+                    password=client.password,
+                    database=client.database,
+                    ssl=client.extra.get("ssl"),
+                    server_settings=client.server_settings,
+                )
+                connection.add_termination_listener(self._on_lost)
+                await connection.add_listener(self.channel, self._on_notify)
+                # Anything cached before now may have missed a notification.
+                for cache in self._caches.values():
+                    cache.clear()
+                self._connected = True
+                logger.info(f"Listening for cache invalidations on {self.channel}")
+                while self._connected and not connection.is_closed():
+                    await asyncio.sleep(LISTEN_RETRY_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed: {e}")
+            finally:
+                self._connected = False
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(LISTEN_RETRY_SECONDS)
+
+
+invalidation_channel = InvalidationChannel(NOTIFY_CHANNEL)
+
+
+class EntityCache:
+    def __init__(self, name: str, model, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Optional[dict]]]" = OrderedDict()
+        self._inflight: "dict[str, asyncio.Future]" = {}
+        # Bumped by every drop, so a load that raced one is not stored.
+        self._generation = 0
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "bypassed": 0,
+            "invalidated": 0,
+        }
+        invalidation_channel.register(self)
+
+    @property
+    def stats(self) -> dict:
+        return {**self.counters, "size": len(self._entries)}
+
+    async def get(self, key) -> Optional[dict]:
+        """The row's fields by primary key, or None if there is no such row."""
+        key = str(key)
+        if not ENTITY_CACHE_ENABLED or not invalidation_channel.ready():
+            self.counters["bypassed"] += 1
+            return await self._load(key)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return dict(value) if value is not None else None
+            del self._entries[key]
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.counters["coalesced"] += 1
+            try:
+                value = await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                if pending.cancelled():
+                    # The leading lookup went away; do our own.
+                    return await self.get(key)
+                raise
+            return dict(value) if value is not None else None
+
+        self.counters["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            value = await self._load(key)
+            if generation == self._generation:
+                self._put(key, value)
+            future.set_result(value)
+            return dict(value) if value is not None else None
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody else awaited is not logged.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def invalidate(self, key) -> None:
+        """Drop ``key`` here and in every other worker; call after the write commits."""
+        self.drop(str(key))
+        self.counters["invalidated"] += 1
+        await invalidation_channel.publish(self.name, str(key))
+
+    def drop(self, key: str) -> None:
+        self._generation += 1
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    async def _load(self, key: str) -> Optional[dict]:
+        try:
+            return await self.model.filter(pk=key).first().values()
+        except (ValueError, ValidationError):
+            # Not a valid primary key (e.g. a malformed UUID): no such row.
+            return None
+
+    def _put(self, key: str, value: Optional[dict]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+user_cache = EntityCache(
+    "user", User, ENTITY_CACHE_MAX_ENTRIES, ENTITY_CACHE_TTL_SECONDS
+)
+settings_cache = EntityCache(
+    "settings", UsersSetting, ENTITY_CACHE_MAX_ENTRIES, ENTITY_CACHE_TTL_SECONDS
+)
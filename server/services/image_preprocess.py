@@ -0,0 +1,109 @@
+"""
+Receipt image preprocessing, run off the event loop.
+
+Phone photos arrive as multi-megabyte, often sideways JPEGs. Before they are
+sent to the model each upload is:
+
+1. rotated according to its EXIF orientation,
+2. converted to grayscale (``RECEIPT_IMAGE_GRAYSCALE``, on by default),
+3. downscaled so the longest side is at most ``RECEIPT_IMAGE_MAX_DIMENSION``,
+4. re-encoded as ``RECEIPT_IMAGE_FORMAT`` (JPEG or WEBP) at
+   ``RECEIPT_IMAGE_QUALITY``.
+
+Decoding and encoding happen in a thread pool (or a process pool when
+``RECEIPT_IMAGE_EXECUTOR=process``) so the worker keeps serving requests.
+Pillow is imported on the first upload rather than at startup.
+"""
+
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+MAX_DIMENSION = int(os.getenv("RECEIPT_IMAGE_MAX_DIMENSION", "1600"))
+GRAYSCALE = os.getenv("RECEIPT_IMAGE_GRAYSCALE", "true").lower() == "true"
+OUTPUT_FORMAT = os.getenv("RECEIPT_IMAGE_FORMAT", "JPEG").upper()
+QUALITY = int(os.getenv("RECEIPT_IMAGE_QUALITY", "80"))
+EXECUTOR_KIND = os.getenv("RECEIPT_IMAGE_EXECUTOR", "thread").lower()
+WORKERS = int(os.getenv("RECEIPT_IMAGE_WORKERS", "2"))
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload cannot be decoded; ``index`` is its position."""
+
+    index: Optional[int] = None
+
+
+def preprocess_image(
+    data: bytes,
+    max_dimension: int = MAX_DIMENSION,
+    grayscale: bool = GRAYSCALE,
+    output_format: str = OUTPUT_FORMAT,
+    quality: int = QUALITY,
+) -> Tuple[bytes, str]:
+    """Normalize one upload and return ``(encoded_bytes, mime_type)``."""
+    if output_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    import PIL.Image
+    import PIL.ImageOps
+
+    try:
+        img = PIL.Image.open(io.BytesIO(data))
+        # Lets the JPEG decoder scale down by 1/2..1/8 while decoding.
+        img.draft("L" if grayscale else "RGB", (max_dimension, max_dimension))
+        img = PIL.ImageOps.exif_transpose(img)
+        img = img.convert("L" if grayscale else "RGB")
+    except Exception as e:
+        raise InvalidImage(str(e)) from e
+
+    # thumbnail keeps the aspect ratio and never upscales
+    img.thumbnail((max_dimension, max_dimension), PIL.Image.LANCZOS)
+
+    out = io.BytesIO()
+    img.save(out, format=output_format, quality=quality, optimize=True)
+    return out.getvalue(), MIME_TYPES[output_format]
+
+
+_executor: Optional[Executor] = None
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if EXECUTOR_KIND == "process":
+            _executor = ProcessPoolExecutor(max_workers=WORKERS)
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=WORKERS, thread_name_prefix="receipt-image"
+            )
+    return _executor
+
+
+async def preprocess_images(images: List[bytes]) -> List[Tuple[bytes, str]]:
+    """Run ``preprocess_image`` for every upload in the pool, in parallel."""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    results = await asyncio.gather(
+        *[loop.run_in_executor(executor, preprocess_image, data) for data in images],
+        return_exceptions=True,
+    )
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            if isinstance(result, InvalidImage):
+                result.index = index
+            raise result
+    logger.info(
+        f"Preprocessed {len(images)} image(s): "
+        f"{sum(len(d) for d in images)} -> {sum(len(r[0]) for r in results)} bytes"
+    )
+    return list(results)
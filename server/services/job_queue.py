@@ -0,0 +1,305 @@
+"""
+Bounded background job queue with retries and dead-lettering.
+
+Job state always lives in the ``jobs`` table, so any worker can answer a
+status poll. How jobs reach a worker depends on the backend:
+
+- ``memory``: payloads sit in an in-process ``asyncio.Queue`` (bounded by
+  ``max_pending``). Simple, but a job only runs in the process that
+  accepted it.
+- ``db``: payloads are stored on the row and workers claim them with
+  ``SELECT ... FOR UPDATE SKIP LOCKED``. Every process sharing the
+  database drains the same queue.
+
+Failed jobs are retried with exponential backoff up to ``max_attempts``,
+then marked ``dead`` with the last error kept for inspection. A job's
+payload is dropped once it succeeds or dies; only status, result and
+error are kept, and those for ``retention`` seconds.
+
+The app lifespan calls ``start`` and ``stop``. Besides the workers, each
+queue runs a maintenance task that, on start and every
+``maintenance_interval``, deletes expired finished jobs and recovers jobs
+with no update for ``visibility_timeout``: ``db`` jobs whose worker died
+are requeued, while ``memory`` jobs lost with their process (the payload
+was only in memory) are marked dead.
+"""
+
+import asyncio
+import datetime
+import logging
+import traceback
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from tortoise.transactions import in_transaction
+
+from server.db.models import Job
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "dead")
+LOST_JOB_ERROR = "Job was lost when its worker process stopped"
+
+
+class JobQueueFull(Exception):
+    """Raised when the in-process queue has no room for another job."""
+
+
+class PermanentJobError(Exception):
+    """Raise from a handler to dead-letter a job without retrying it."""
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def job_status(job: Job) -> dict:
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+    }
+
+
+class JobQueue:
+    def __init__(
+        self,
+        name: str,
+        backend: str = "memory",
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_seconds: float = 5.0,
+        max_pending: int = 100,
+        poll_interval: float = 1.0,
+        visibility_timeout: float = 300.0,
+        maintenance_interval: float = 60.0,
+        retention: float = 7 * 86400.0,
+    ):
+        if backend not in ("memory", "db"):
+            raise ValueError(f"Unknown job queue backend: {backend}")
+        self.name = name
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.maintenance_interval = maintenance_interval
+        self.retention = retention
+        self._handler: Optional[Callable[[str, Any], Awaitable[Any]]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._watchers: Dict[str, List[asyncio.Event]] = {}
+
+    def set_handler(self, handler: Callable[[str, Any], Awaitable[Any]]) -> None:
+        """``handler(user_id, payload)`` does the work and returns a JSON result."""
+        self._handler = handler
+
+    def start(self) -> None:
+        """Start the worker and maintenance tasks on the running loop (idempotent)."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._wakeup = asyncio.Event()
+        worker = self._memory_worker if self.backend == "memory" else self._db_worker
+        self._tasks = [
+            asyncio.create_task(worker(), name=f"{self.name}-worker-{i}")
+            for i in range(self.workers)
+        ]
+        self._tasks.append(
+            asyncio.create_task(self._maintain(), name=f"{self.name}-maintenance")
+        )
+        logger.info(
+            f"Started {self.workers} {self.backend} workers for job queue {self.name}"
+        )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, user_id: str, payload: Any) -> Job:
+        self.start()
+        if self.backend == "memory" and self._queue.full():
+            raise JobQueueFull(f"{self.name} has {self._queue.qsize()} pending jobs")
+        job = await Job.create(
+            queue=self.name,
+            user_id=user_id,
+            status="queued",
+            max_attempts=self.max_attempts,
+            payload=payload if self.backend == "db" else None,
+            run_after=_utcnow(),
+        )
+        if self.backend == "memory":
+            self._queue.put_nowait((job.id, user_id, payload))
+        else:
+            self._wakeup.set()
+        logger.info(f"Enqueued job {job.id} on {self.name}")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        return await Job.get_or_none(id=job_id, queue=self.name)
+
+    async def wait_for_change(self, job_id: str, timeout: float) -> None:
+        """Sleep until this process updates ``job_id`` or ``timeout`` passes."""
+        event = asyncio.Event()
+        self._watchers.setdefault(str(job_id), []).append(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            watchers = self._watchers.get(str(job_id), [])
+            if event in watchers:
+                watchers.remove(event)
+            if not watchers:
+                self._watchers.pop(str(job_id), None)
+
+    def _notify(self, job_id) -> None:
+        for event in self._watchers.get(str(job_id), []):
+            event.set()
+
+    async def _set_status(self, job_id, **fields) -> None:
+        await Job.filter(id=job_id).update(**fields, updated_at=_utcnow())
+        self._notify(job_id)
+
+    async def _execute(self, job_id, user_id: str, payload: Any, attempts: int):
+        """Run the handler once and record success, retry or dead-letter."""
+        try:
+            result = await self._handler(user_id, payload)
+        except Exception as e:
+            permanent = isinstance(e, PermanentJobError)
+            logger.error(f"Job {job_id} attempt {attempts} failed: {e}")
+            error = "".join(traceback.format_exception_only(type(e), e)).strip()
+            if permanent or attempts >= self.max_attempts:
+                await self._set_status(job_id, status="dead", error=error, payload=None)
+                logger.error(f"Job {job_id} moved to dead letter after {attempts} attempts")
+                return None
+            delay = self.retry_seconds * 2 ** (attempts - 1)
+            await self._set_status(
+                job_id,
+                status="queued",
+                error=error,
+                run_after=_utcnow() + datetime.timedelta(seconds=delay),
+            )
+            return delay
+        await self._set_status(
+            job_id, status="succeeded", result=result, error=None, payload=None
+        )
+        logger.info(f"Job {job_id} succeeded")
+        return None
+
+    async def _memory_worker(self) -> None:
+        while True:
+            job_id, user_id, payload = await self._queue.get()
+            try:
+                job = await Job.get(id=job_id)
+                if job.status != "queued":
+                    # Marked dead by _fail_lost while it waited here.
+                    continue
+                attempts = job.attempts + 1
+                await self._set_status(job_id, status="running", attempts=attempts)
+                delay = await self._execute(job_id, user_id, payload, attempts)
+                if delay is not None:
+                    asyncio.get_running_loop().call_later(
+                        delay, self._requeue, (job_id, user_id, payload)
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue {self.name} worker error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _requeue(self, item) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            asyncio.get_running_loop().call_later(self.retry_seconds, self._requeue, item)
+
+    async def _claim(self) -> Optional[Job]:
+        async with in_transaction() as conn:
+            job = (
+                await Job.filter(
+                    queue=self.name, status="queued", run_after__lte=_utcnow()
+                )
+                .order_by("run_after")
+                .select_for_update(skip_locked=True)
+                .using_db(conn)
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = "running"
+            job.attempts += 1
+            await job.save(using_db=conn, update_fields=["status", "attempts", "updated_at"])
+        self._notify(job.id)
+        return job
+
+    async def _reclaim_stale(self) -> None:
+        """Requeue jobs whose worker died while running them."""
+        cutoff = _utcnow() - datetime.timedelta(seconds=self.visibility_timeout)
+        reclaimed = await Job.filter(
+            queue=self.name, status="running", updated_at__lt=cutoff
+        ).update(status="queued", run_after=_utcnow())
+        if reclaimed:
+            logger.warning(f"Requeued {reclaimed} stale jobs on {self.name}")
+            self._wakeup.set()
+
+    async def _fail_lost(self) -> None:
+        """Mark dead the memory jobs whose process went away before finishing."""
+        cutoff = _utcnow() - datetime.timedelta(seconds=self.visibility_timeout)
+        lost = await Job.filter(
+            queue=self.name, status__in=("queued", "running"), updated_at__lt=cutoff
+        ).update(status="dead", error=LOST_JOB_ERROR, updated_at=_utcnow())
+        if lost:
+            logger.warning(f"Marked {lost} lost jobs dead on {self.name}")
+
+    async def prune(self) -> int:
+        """Delete finished jobs last updated more than ``retention`` seconds ago."""
+        cutoff = _utcnow() - datetime.timedelta(seconds=self.retention)
+        deleted = await Job.filter(
+            queue=self.name, status__in=TERMINAL_STATUSES, updated_at__lt=cutoff
+        ).delete()
+        if deleted:
+            logger.info(f"Pruned {deleted} finished jobs on {self.name}")
+        return deleted
+
+    async def _maintain(self) -> None:
+        while True:
+            try:
+                await self.prune()
+                if self.backend == "db":
+                    await self._reclaim_stale()
+                else:
+                    await self._fail_lost()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue {self.name} maintenance failed: {e}")
+            await asyncio.sleep(self.maintenance_interval)
+
+    async def _db_worker(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._execute(job.id, job.user_id, job.payload, job.attempts)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job queue {self.name} worker error: {e}")
+                await asyncio.sleep(self.poll_interval)
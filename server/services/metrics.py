@@ -0,0 +1,452 @@
+"""
+In-process request metrics in the Prometheus text format.
+
+``MetricsMiddleware`` (added in ``server/index.py``) records, per route
+template:
+
+- ``http_request_duration_seconds``: time until the last body chunk is sent,
+- ``http_requests_in_flight``,
+- ``http_request_db_queries`` / ``http_request_db_seconds``: statements sent
+  through Tortoise while serving the request and the time spent in them.
+
+Tortoise has no query hook, so ``instrument_tortoise`` wraps the
+``execute_*`` methods of its loaded client classes once. ``ai.py`` reports
+Gemini latency and token usage through ``observe_gemini``. Pool and AI
+scheduler gauges are read when ``/metrics`` is scraped.
+
+Recording is a dict lookup and a bisect on the event loop, cheap enough to
+leave on; ``METRICS_ENABLED=false`` removes the middleware and endpoint.
+Values are per worker process, like the other in-memory stats.
+"""
+
+import bisect
+import contextvars
+import functools
+import logging
+import os
+import time
+from typing import Callable, List, Optional
+
+from dotenv import load_dotenv
+
+from server.db.pool import WAIT_BUCKETS, instrumented_pool
+from server.services.ai_scheduler import ai_scheduler
+from server.services.entity_cache import settings_cache, user_cache
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# When set, /metrics and /internal/db-pool require
+# ``Authorization: Bearer <METRICS_TOKEN>``.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+GEMINI_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_registry: List["_Metric"] = []
+# Called before rendering to refresh gauges that mirror stats kept elsewhere.
+_scrape_hooks: List[Callable[[], None]] = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} "
+                f"{_format_value(value)}"
+            )
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def load(self, labels: tuple, value: float) -> None:
+        """Mirror a running total kept elsewhere."""
+        self._values[labels] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, labels: tuple = (), value: float = 0) -> None:
+        self._values[labels] = value
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self.inc(labels, -amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels: tuple, value: float) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            # per-bucket (non-cumulative) counts, +Inf last; sum; count
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def load(self, labels: tuple, counts: list, total: float) -> None:
+        """Replace one series with counts kept elsewhere (same bucket bounds)."""
+        self._values[labels] = [list(counts), total, sum(counts)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} "
+                    f"{running}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served"
+)
+HTTP_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route template",
+    ("method", "route", "status"),
+)
+HTTP_DB_QUERIES = Histogram(
+    "http_request_db_queries",
+    "Database statements sent while serving a request",
+    ("method", "route"),
+    QUERY_COUNT_BUCKETS,
+)
+HTTP_DB_SECONDS = Histogram(
+    "http_request_db_seconds",
+    "Time spent in database statements while serving a request",
+    ("method", "route"),
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Database statement latency, including connection acquire",
+    ("operation",),
+)
+GEMINI_DURATION = Histogram(
+    "gemini_request_duration_seconds",
+    "Gemini call latency (for streams, until the last chunk)",
+    ("model", "call", "outcome"),
+    GEMINI_BUCKETS,
+)
+GEMINI_TOKENS = Counter(
+    "gemini_tokens_total", "Gemini tokens reported in usage metadata", ("model", "kind")
+)
+
+
+def render() -> str:
+    for hook in _scrape_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.error(f"Metrics scrape hook {hook.__name__} failed: {e}")
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def on_scrape(hook: Callable[[], None]) -> Callable[[], None]:
+    _scrape_hooks.append(hook)
+    return hook
+
+
+# --- Database ---------------------------------------------------------------
+
+DB_POOL_CONNECTIONS = Gauge(
+    "db_pool_connections", "Open pool connections by state", ("state",)
+)
+DB_POOL_ACQUIRE_TIMEOUTS = Counter(
+    "db_pool_acquire_timeouts_total", "Pool acquires that hit the acquire timeout"
+)
+DB_POOL_ACQUIRE_WAIT = Histogram(
+    "db_pool_acquire_wait_seconds", "Time waiting for a pool connection", (), WAIT_BUCKETS
+)
+
+
+@on_scrape
+def _refresh_pool() -> None:
+    pool = instrumented_pool()
+    if pool is None:
+        return
+    size, idle = pool.get_size(), pool.get_idle_size()
+    DB_POOL_CONNECTIONS.set(("in_use",), size - idle)
+    DB_POOL_CONNECTIONS.set(("idle",), idle)
+    DB_POOL_ACQUIRE_TIMEOUTS.load((), pool.stats.timeouts)
+    DB_POOL_ACQUIRE_WAIT.load((), pool.stats.wait_buckets, pool.stats.wait_total)
+
+
+ENTITY_CACHE_LOOKUPS = Counter(
+    "entity_cache_lookups_total",
+    "User/UsersSetting cache lookups by result",
+    ("cache", "result"),
+)
+ENTITY_CACHE_ENTRIES = Gauge(
+    "entity_cache_entries", "Rows held by the entity cache", ("cache",)
+)
+
+
+@on_scrape
+def _refresh_entity_cache() -> None:
+    for cache in (user_cache, settings_cache):
+        for result in ("hits", "misses", "coalesced", "bypassed"):
+            ENTITY_CACHE_LOOKUPS.load((cache.name, result), cache.counters[result])
+        ENTITY_CACHE_ENTRIES.set((cache.name,), len(cache._entries))
+
+
+QUERY_METHODS = (
+    "execute_insert",
+    "execute_many",
+    "execute_query",
+    "execute_query_dict",
+    "execute_script",
+)
+
+# [statements, seconds] of the request being served, set by the middleware
+_request_db: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "request_db", default=None
+)
+# Set while a wrapped call runs so nested execute_* calls count once
+_in_query: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "in_query", default=False
+)
+_tortoise_instrumented = False
+
+
+def _timed_query(method, operation: str):
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if _in_query.get():
+            return await method(self, *args, **kwargs)
+        token = _in_query.set(True)
+        start = time.perf_counter()
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _in_query.reset(token)
+            DB_QUERY_DURATION.observe((operation,), elapsed)
+            stats = _request_db.get()
+            if stats is not None:
+                stats[0] += 1
+                stats[1] += elapsed
+
+    wrapper._metrics_wrapped = True
+    return wrapper
+
+
+def instrument_tortoise() -> None:
+    """Wrap ``execute_*`` on every loaded Tortoise client class, once."""
+    global _tortoise_instrumented
+    if _tortoise_instrumented:
+        return
+    from tortoise.backends.base.client import BaseDBAsyncClient
+
+    classes, pending = [], list(BaseDBAsyncClient.__subclasses__())
+    while pending:
+        cls = pending.pop()
+        classes.append(cls)
+        pending.extend(cls.__subclasses__())
+    for cls in classes:
+        for name in QUERY_METHODS:
+            method = cls.__dict__.get(name)
+            if method is not None and not getattr(method, "_metrics_wrapped", False):
+                setattr(cls, name, _timed_query(method, name[len("execute_"):]))
+    # Client modules are imported by Tortoise.init; retry until one is.
+    _tortoise_instrumented = bool(classes)
+
+
+# --- Gemini -----------------------------------------------------------------
+
+AI_SCHEDULER_CALLS = Gauge(
+    "ai_scheduler_calls", "Gemini calls running or queued in the scheduler", ("state",)
+)
+AI_SCHEDULER_REJECTED = Counter(
+    "ai_scheduler_rejected_total", "Gemini calls rejected because the queue was full"
+)
+AI_SCHEDULER_TIMED_OUT = Counter(
+    "ai_scheduler_timed_out_total", "Gemini calls that exceeded the scheduler deadline"
+)
+
+
+@on_scrape
+def _refresh_scheduler() -> None:
+    stats = ai_scheduler.stats
+    AI_SCHEDULER_CALLS.set(("running",), stats["running"])
+    AI_SCHEDULER_CALLS.set(("waiting",), stats["waiting"])
+    AI_SCHEDULER_REJECTED.load((), stats["rejected"])
+    AI_SCHEDULER_TIMED_OUT.load((), stats["timed_out"])
+
+
+USAGE_FIELDS = {
+    "prompt": "prompt_token_count",
+    "output": "candidates_token_count",
+    "thoughts": "thoughts_token_count",
+    "cached": "cached_content_token_count",
+}
+
+
+def observe_gemini(model, call: str, seconds: float, outcome: str, usage=None) -> None:
+    model = model or "unknown"
+    GEMINI_DURATION.observe((model, call, outcome), seconds)
+    if usage is None:
+        return
+    for kind, field in USAGE_FIELDS.items():
+        count = getattr(usage, field, None)
+        if count:
+            GEMINI_TOKENS.inc((model, kind), count)
+
+
+def _outcome(exc: BaseException) -> str:
+    # Scheduler deadlines and client disconnects cancel the call.
+    return "error" if isinstance(exc, Exception) else "cancelled"
+
+
+async def timed_generate(client, **kwargs):
+    """``client.aio.models.generate_content`` with latency and token metrics."""
+    start = time.perf_counter()
+    try:
+        response = await client.aio.models.generate_content(**kwargs)
+    except BaseException as e:
+        observe_gemini(kwargs.get("model"), "generate", time.perf_counter() - start, _outcome(e))
+        raise
+    observe_gemini(
+        kwargs.get("model"),
+        "generate",
+        time.perf_counter() - start,
+        "ok",
+        getattr(response, "usage_metadata", None),
+    )
+    return response
+
+
+async def timed_stream(client, **kwargs):
+    """Like ``timed_generate`` for ``generate_content_stream``; usage comes
+    from the last chunk that carries it."""
+    start = time.perf_counter()
+    try:
+        stream = await client.aio.models.generate_content_stream(**kwargs)
+    except BaseException as e:
+        observe_gemini(kwargs.get("model"), "stream", time.perf_counter() - start, _outcome(e))
+        raise
+    return _track_stream(stream, kwargs.get("model"), start)
+
+
+async def _track_stream(stream, model, start: float):
+    usage, outcome = None, "ok"
+    try:
+        async for chunk in stream:
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            yield chunk
+    except BaseException as e:
+        outcome = _outcome(e)
+        raise
+    finally:
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        observe_gemini(model, "stream", time.perf_counter() - start, outcome, usage)
+
+
+# --- Middleware -------------------------------------------------------------
+
+
+def route_template(scope) -> str:
+    """
+    Path template of the matched route, e.g. ``/transactions/user/{user_id}``.
+
+    Templates keep label cardinality bounded; raw paths (ids, 404 probes)
+    would not. ``scope["route"]`` of an included router's route lacks the
+    prefix, so FastAPI's effective route context is preferred.
+    """
+    context = scope.get("fastapi", {}).get("effective_route_context")
+    route = context if context is not None else scope.get("route")
+    return getattr(route, "path_format", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed to the end."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        instrument_tortoise()
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        db = [0, 0.0]
+        token = _request_db.set(db)
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            _request_db.reset(token)
+            method = scope["method"]
+            route = route_template(scope)
+            HTTP_DURATION.observe((method, route, str(status)), elapsed)
+            HTTP_DB_QUERIES.observe((method, route), db[0])
+            HTTP_DB_SECONDS.observe((method, route), db[1])
@@ -0,0 +1,235 @@
+"""
+Bounded statistical digest of a user's transactions for AI prompts.
+
+Instead of one line per transaction, the analysis prompt gets:
+
+- overall totals and the date range,
+- per-tag totals, grouped over DailyRollup in SQL,
+- per-month totals for the last ``MONTHS`` months of DailyRollup,
+- the biggest merchants by spend, grouped on ``detail`` in SQL,
+- outliers (expenses well above the user's average),
+- a small sample of the most recent rows.
+
+Merchants and outliers read raw rows, so they only look at the last
+``AI_DIGEST_WINDOW_DAYS`` up to the user's latest activity. Every query is
+bounded by a window or grouped to a few rows, so load time stays flat as
+history grows.
+
+``render_digest`` trims the sections until the text fits the token budget
+(``AI_PROMPT_TOKEN_BUDGET``), so prompt size stays flat as history grows.
+"""
+
+import datetime
+import logging
+import os
+from collections import defaultdict
+
+from dotenv import load_dotenv
+from tortoise.functions import Count, Max, Min, Sum
+
+from server.db.models import DailyRollup, Transactions
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "1500"))
+TOP_MERCHANTS = 10
+OUTLIERS = 5
+OUTLIER_FACTOR = 3.0
+MONTHS = 12
+RECENT_ROWS = 10
+WINDOW_DAYS = int(os.getenv("AI_DIGEST_WINDOW_DAYS", "90"))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate: ~4 ASCII characters per token, and one token per
+    non-ASCII character (Thai script tokenizes far less densely).
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+async def load_digest(user_id: str) -> dict:
+    """Collect digest inputs with a handful of aggregate queries."""
+    tag_rows = await (
+        DailyRollup.filter(user_id=user_id)
+        .annotate(
+            income_total=Sum("income"),
+            expense_total=Sum("expense"),
+            income_rows=Sum("income_count"),
+            expense_rows=Sum("expense_count"),
+            first_day=Min("day"),
+            last_day=Max("day"),
+        )
+        .group_by("tag")
+        .values(
+            "tag",
+            "income_total",
+            "expense_total",
+            "income_rows",
+            "expense_rows",
+            "first_day",
+            "last_day",
+        )
+    )
+    tags = {
+        row["tag"]: {
+            "income": row["income_total"] or 0.0,
+            "expense": row["expense_total"] or 0.0,
+            "count": (row["income_rows"] or 0) + (row["expense_rows"] or 0),
+        }
+        for row in tag_rows
+    }
+    expense_count = sum(row["expense_rows"] or 0 for row in tag_rows)
+    total_expense = sum(t["expense"] for t in tags.values())
+    average_expense = total_expense / expense_count if expense_count else 0.0
+    first_day = min((row["first_day"] for row in tag_rows), default=None)
+    last_day = max((row["last_day"] for row in tag_rows), default=None)
+
+    # Only the months the digest can show are read.
+    months = defaultdict(lambda: {"income": 0.0, "expense": 0.0, "count": 0})
+    since = None
+    if last_day:
+        month_start = last_day.replace(day=1)
+        for _ in range(MONTHS - 1):
+            month_start = (month_start - datetime.timedelta(days=1)).replace(day=1)
+        rows = await DailyRollup.filter(
+            user_id=user_id, day__gte=month_start
+        ).values_list("day", "income", "expense", "income_count", "expense_count")
+        for day, income, expense, income_rows, expense_rows in rows:
+            bucket = months[day.strftime("%Y-%m")]
+            bucket["income"] += income
+            bucket["expense"] += expense
+            bucket["count"] += income_rows + expense_rows
+        since = last_day - datetime.timedelta(days=WINDOW_DAYS - 1)
+
+    expenses = Transactions.filter(user_id=user_id).exclude(type="income")
+    if since:
+        expenses = expenses.filter(
+            created_at__gte=datetime.datetime.combine(
+                since, datetime.time(), datetime.timezone.utc
+            )
+        )
+    merchants = (
+        await expenses.annotate(total=Sum("amount"), count=Count("id"))
+        .group_by("detail")
+        .order_by("-total")
+        .limit(TOP_MERCHANTS)
+        .values("detail", "total", "count")
+    )
+    outliers = (
+        await expenses.filter(amount__gt=average_expense * OUTLIER_FACTOR)
+        .order_by("-amount")
+        .limit(OUTLIERS)
+        .values("amount", "detail", "tag", "created_at")
+        if average_expense
+        else []
+    )
+    recent = (
+        await Transactions.filter(user_id=user_id)
+        .order_by("-created_at")
+        .limit(RECENT_ROWS)
+        .values("amount", "type", "detail", "tag", "created_at")
+    )
+
+    return {
+        "count": sum(t["count"] for t in tags.values()),
+        "income": sum(t["income"] for t in tags.values()),
+        "expense": total_expense,
+        "average_expense": average_expense,
+        "first_day": first_day,
+        "last_day": last_day,
+        "tags": tags,
+        "months": dict(months),
+        "window_start": since,
+        "merchants": merchants,
+        "outliers": outliers,
+        "recent": recent,
+    }
+
+
+def _money(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+def _render(digest: dict, limits: dict) -> str:
+    lines = [
+        f"Transactions: {digest['count']} "
+        f"({digest['first_day']} to {digest['last_day']})",
+        f"Total income: {_money(digest['income'])}, "
+        f"total expense: {_money(digest['expense'])}, "
+        f"average expense: {_money(digest['average_expense'])}",
+    ]
+
+    tags = sorted(
+        digest["tags"].items(),
+        key=lambda item: item[1]["income"] + item[1]["expense"],
+        reverse=True,
+    )
+    if tags and limits["tags"]:
+        lines.append("\nBy tag (tag: income / expense / count):")
+        for tag, t in tags[: limits["tags"]]:
+            lines.append(
+                f"- {tag}: {_money(t['income'])} / {_money(t['expense'])} / {t['count']}"
+            )
+        if len(tags) > limits["tags"]:
+            lines.append(f"- ... {len(tags) - limits['tags']} smaller tags")
+
+    months = sorted(digest["months"].items())
+    if months and limits["months"]:
+        lines.append("\nBy month (month: income / expense / count):")
+        for month, m in months[-limits["months"] :]:
+            lines.append(
+                f"- {month}: {_money(m['income'])} / {_money(m['expense'])} / {m['count']}"
+            )
+
+    window = f" since {digest['window_start']}" if digest.get("window_start") else ""
+    if digest["merchants"] and limits["merchants"]:
+        lines.append(f"\nTop merchants by spend{window} (detail: total / count):")
+        for m in digest["merchants"][: limits["merchants"]]:
+            total = _money(m["total"] or 0)
+            lines.append(f"- {m['detail'][:60]}: {total} / {m['count']}")
+
+    if digest["outliers"] and limits["outliers"]:
+        lines.append(f"\nUnusually large expenses{window}:")
+        for o in digest["outliers"][: limits["outliers"]]:
+            lines.append(
+                f"- {_money(o['amount'])}, {o['detail'][:60]}, {o['tag']}, "
+                f"{o['created_at']:%Y-%m-%d}"
+            )
+
+    if digest["recent"] and limits["recent"]:
+        lines.append("\nMost recent transactions (amount, type, detail, tag, date):")
+        for r in digest["recent"][: limits["recent"]]:
+            lines.append(
+                f"- {r['amount']}, {r['type']}, {r['detail'][:60]}, {r['tag']}, "
+                f"{r['created_at']:%Y-%m-%d}"
+            )
+
+    return "\n".join(lines)
+
+
+# Sections are halved round-robin, in this order, until the digest fits.
+_SHRINK_ORDER = ("recent", "merchants", "outliers", "months", "tags")
+
+
+def render_digest(digest: dict, token_budget: int = TOKEN_BUDGET) -> str:
+    """Render ``digest`` as prompt text no larger than ``token_budget`` tokens."""
+    limits = {
+        "tags": 15,
+        "months": MONTHS,
+        "merchants": TOP_MERCHANTS,
+        "outliers": OUTLIERS,
+        "recent": RECENT_ROWS,
+    }
+    text = _render(digest, limits)
+    turn = 0
+    while estimate_tokens(text) > token_budget and any(limits.values()):
+        section = _SHRINK_ORDER[turn % len(_SHRINK_ORDER)]
+        turn += 1
+        if limits[section]:
+            limits[section] //= 2
+            text = _render(digest, limits)
+    return text
@@ -0,0 +1,206 @@
+"""
+Content-addressed cache for receipt analysis results.
+
+Two tiers sit in front of the model:
+
+- an in-process LRU (``RECEIPT_CACHE_MEMORY_ENTRIES``) for repeat uploads
+  hitting the same worker, and
+- the ``receipt_analysis_cache`` table, shared by all workers, with a TTL
+  (``RECEIPT_CACHE_TTL_SECONDS``) and a row cap (``RECEIPT_CACHE_DB_ENTRIES``).
+
+Concurrent lookups of the same key are coalesced so only one model call runs.
+Failures are never cached.
+"""
+
+import asyncio
+import copy
+import datetime
+import hashlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable
+
+from dotenv import load_dotenv
+
+from server.db.models import ReceiptAnalysisCache
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+
+def receipt_cache_key(user_id: str, images: Iterable[bytes]) -> str:
+    """SHA-256 over the owner and every image, length-prefixed so splits can't collide."""
+    digest = hashlib.sha256()
+    digest.update(user_id.encode())
+    for data in images:
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class ReceiptCache:
+    def __init__(
+        self,
+        memory_entries: int,
+        db_entries: int,
+        ttl_seconds: float,
+        evict_every: int = 50,
+    ):
+        self.memory_entries = memory_entries
+        self.db_entries = db_entries
+        self.ttl = datetime.timedelta(seconds=ttl_seconds)
+        self.evict_every = evict_every
+        self._memory: "OrderedDict[str, tuple[datetime.datetime, Any]]" = OrderedDict()
+        self._inflight: "dict[str, asyncio.Future]" = {}
+        self._writes_since_evict = 0
+        self.counters = {
+            "memory_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evicted": 0,
+            "db_errors": 0,
+        }
+
+    @property
+    def stats(self) -> dict:
+        lookups = (
+            self.counters["memory_hits"]
+            + self.counters["db_hits"]
+            + self.counters["misses"]
+            + self.counters["coalesced"]
+        )
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "memory_size": len(self._memory),
+            "inflight": len(self._inflight),
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]):
+        """Return the cached result for ``key`` or run ``compute()`` once to fill it."""
+        cached = self._memory_get(key)
+        if cached is not None:
+            self.counters["memory_hits"] += 1
+            return copy.deepcopy(cached)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.counters["coalesced"] += 1
+            try:
+                return copy.deepcopy(await asyncio.shield(pending))
+            except asyncio.CancelledError:
+                if pending.cancelled():
+                    # The leading request went away; take over the computation.
+                    return await self.get_or_compute(key, compute)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._db_get(key)
+            if result is not None:
+                self.counters["db_hits"] += 1
+            else:
+                self.counters["misses"] += 1
+                result = await compute()
+                await self._db_put(key, result)
+            self._memory_put(key, result)
+            future.set_result(result)
+            return copy.deepcopy(result)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an exception nobody else awaited is not logged.
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _memory_get(self, key: str):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        stored_at, result = entry
+        if _utcnow() - stored_at > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return result
+
+    def _memory_put(self, key: str, result) -> None:
+        self._memory[key] = (_utcnow(), result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    async def _db_get(self, key: str):
+        try:
+            row = await ReceiptAnalysisCache.get_or_none(key=key)
+            if row is None:
+                return None
+            now = _utcnow()
+            if now - row.created_at > self.ttl:
+                await ReceiptAnalysisCache.filter(key=key).delete()
+                return None
+            await ReceiptAnalysisCache.filter(key=key).update(last_used_at=now)
+            return row.result
+        except Exception as e:
+            self.counters["db_errors"] += 1
+            logger.error(f"Receipt cache read failed, falling back to model: {e}")
+            return None
+
+    async def _db_put(self, key: str, result) -> None:
+        try:
+            now = _utcnow()
+            await ReceiptAnalysisCache.update_or_create(
+                key=key,
+                defaults={
+                    "result": result,
+                    "size_bytes": len(json.dumps(result, default=str)),
+                    "last_used_at": now,
+                },
+            )
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= self.evict_every:
+                self._writes_since_evict = 0
+                await self.evict()
+        except Exception as e:
+            self.counters["db_errors"] += 1
+            logger.error(f"Receipt cache write failed: {e}")
+
+    async def evict(self) -> int:
+        """Drop expired rows, then the least recently used ones beyond the cap."""
+        removed = await ReceiptAnalysisCache.filter(
+            created_at__lt=_utcnow() - self.ttl
+        ).delete()
+        overflow = await ReceiptAnalysisCache.all().count() - self.db_entries
+        if overflow > 0:
+            stale = await ReceiptAnalysisCache.all().order_by("last_used_at").limit(
+                overflow
+            ).values_list("key", flat=True)
+            removed += await ReceiptAnalysisCache.filter(key__in=list(stale)).delete()
+        self.counters["evicted"] += removed
+        if removed:
+            logger.info(f"Evicted {removed} receipt cache rows")
+        return removed
+
+    def clear_memory(self) -> None:
+        self._memory.clear()
+
+
+receipt_cache = ReceiptCache(
+    memory_entries=int(os.getenv("RECEIPT_CACHE_MEMORY_ENTRIES", "256")),
+    db_entries=int(os.getenv("RECEIPT_CACHE_DB_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("RECEIPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+)
@@ -0,0 +1,353 @@
+"""
+Incremental bank-statement import (CSV and OFX).
+
+The upload is read and decoded block by block, parsed into ``StatementRow``s
+and handed out in fixed-size chunks, so neither the file nor the parsed
+rows are ever held in memory at once.
+
+Every row gets an ``import_hash``: a SHA-256 of (date, signed amount,
+normalised detail, occurrence). The occurrence number keeps two identical
+coffees on the same day apart, while importing the same statement again
+produces the same hashes, which the unique ``(user_id, import_hash)`` index
+turns into an indexed lookup per chunk.
+"""
+
+import codecs
+import csv
+import datetime
+import hashlib
+import io
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+from zoneinfo import ZoneInfo
+
+from dotenv import load_dotenv
+
+from server.db.models import Transactions
+
+load_dotenv()
+
+IMPORT_CHUNK_SIZE = int(os.getenv("STATEMENT_IMPORT_CHUNK_SIZE", "1000"))
+MAX_IMPORT_ROWS = int(os.getenv("STATEMENT_IMPORT_MAX_ROWS", "200000"))
+READ_BLOCK_SIZE = 64 * 1024
+# Bank exports often start with account details before the header row.
+MAX_PREAMBLE_ROWS = 50
+MAX_REPORTED_ERRORS = 100
+
+# Column name aliases (lower-cased), English and Thai bank exports.
+COLUMN_ALIASES = {
+    "date": (
+        "date",
+        "transaction date",
+        "posting date",
+        "posted date",
+        "value date",
+        "วันที่",
+        "วันที่ทำรายการ",
+    ),
+    "amount": ("amount", "transaction amount", "จำนวนเงิน", "จำนวน"),
+    "debit": ("debit", "withdrawal", "withdrawals", "money out", "ถอน", "ถอนเงิน", "เดบิต"),
+    "credit": ("credit", "deposit", "deposits", "money in", "ฝาก", "ฝากเงิน", "เครดิต"),
+    "detail": (
+        "description",
+        "detail",
+        "details",
+        "memo",
+        "narrative",
+        "payee",
+        "name",
+        "รายละเอียด",
+        "รายการ",
+    ),
+}
+
+DATE_FORMATS = (
+    "%Y-%m-%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%Y/%m/%d",
+    "%d/%m/%y",
+    "%d %b %Y",
+    "%Y%m%d",
+)
+
+
+class StatementError(ValueError):
+    """The upload cannot be imported at all (unknown layout, too many rows)."""
+
+
+@dataclass
+class StatementRow:
+    line: int
+    day: datetime.date
+    amount: float  # signed: negative is money out
+    detail: str
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    rejected: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def reject(self, line: int, error: Exception) -> None:
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": str(error)})
+
+
+def parse_amount(text: str) -> float:
+    value = text.strip().replace(",", "").replace(" ", "")
+    value = value.lstrip("฿$€£").rstrip("฿")
+    negative = False
+    if value.startswith("(") and value.endswith(")"):
+        value, negative = value[1:-1], True
+    if value.endswith("-"):
+        value, negative = value[:-1], True
+    amount = float(value)
+    return -amount if negative else amount
+
+
+def parse_day(text: str, date_format: Optional[str] = None) -> datetime.date:
+    text = text.strip()
+    # Drop a trailing time of day ("2024-01-31 13:45", "31/01/2024 13:45:00").
+    text = text.split(" ")[0] if re.search(r"\d\s+\d{1,2}:\d{2}", text) else text
+    formats = (date_format,) if date_format else DATE_FORMATS
+    for fmt in formats:
+        try:
+            day = datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+        if day.year > 2400:
+            # Buddhist calendar year, as printed by Thai banks.
+            day = day.replace(year=day.year - 543)
+        return day
+    raise ValueError(f"Unrecognised date: {text!r}")
+
+
+def _row_key(row: StatementRow) -> str:
+    detail = " ".join(row.detail.split()).lower()
+    return f"{row.day.isoformat()}|{row.amount:.2f}|{detail}"
+
+
+def import_hash(user_id: str, row: StatementRow, occurrence: int) -> str:
+    raw = f"{user_id}|{_row_key(row)}|{occurrence}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def _read_text(upload, encoding: str) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    while True:
+        block = await upload.read(READ_BLOCK_SIZE)
+        if not block:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(block)
+
+
+def _record_boundary(text: str) -> int:
+    """Offset just past the last newline that is outside a quoted CSV field."""
+    in_quotes = False
+    boundary = 0
+    for i, ch in enumerate(text):
+        if ch == '"':
+            in_quotes = not in_quotes
+        elif ch == "\n" and not in_quotes:
+            boundary = i + 1
+    return boundary
+
+
+async def _csv_rows(upload, encoding: str) -> AsyncIterator[list]:
+    pending = ""
+    async for text in _read_text(upload, encoding):
+        pending += text
+        cut = _record_boundary(pending)
+        if cut:
+            for row in csv.reader(io.StringIO(pending[:cut])):
+                yield row
+            pending = pending[cut:]
+    if pending.strip():
+        for row in csv.reader(io.StringIO(pending)):
+            yield row
+
+
+def _find_columns(header: list, overrides: Dict[str, Optional[str]]) -> Optional[dict]:
+    names = [cell.strip().lower() for cell in header]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        wanted = overrides.get(field)
+        candidates = (wanted.strip().lower(),) if wanted else aliases
+        for candidate in candidates:
+            if candidate in names:
+                columns[field] = names.index(candidate)
+                break
+    if "date" not in columns or "detail" not in columns:
+        return None
+    if "amount" not in columns and not ("debit" in columns or "credit" in columns):
+        return None
+    return columns
+
+
+def _cell(row: list, index: Optional[int]) -> str:
+    if index is None or index >= len(row):
+        return ""
+    return row[index].strip()
+
+
+async def parse_csv(
+    upload,
+    encoding: str = "utf-8-sig",
+    date_format: Optional[str] = None,
+    columns: Optional[Dict[str, Optional[str]]] = None,
+    report: Optional[ImportReport] = None,
+) -> AsyncIterator[StatementRow]:
+    """
+    Yield rows of a CSV statement. ``columns`` maps date/amount/debit/credit/
+    detail to header names when the aliases above do not match.
+    """
+    mapping = None
+    line = 0
+    async for row in _csv_rows(upload, encoding):
+        line += 1
+        if not any(cell.strip() for cell in row):
+            continue
+        if mapping is None:
+            mapping = _find_columns(row, columns or {})
+            if mapping is None and line >= MAX_PREAMBLE_ROWS:
+                break
+            continue
+        try:
+            if "amount" in mapping:
+                amount = parse_amount(_cell(row, mapping["amount"]))
+            else:
+                debit = _cell(row, mapping.get("debit"))
+                credit = _cell(row, mapping.get("credit"))
+                if not debit and not credit:
+                    raise ValueError("Missing debit/credit amount")
+                amount = (parse_amount(credit) if credit else 0.0) - (
+                    abs(parse_amount(debit)) if debit else 0.0
+                )
+            parsed = StatementRow(
+                line=line,
+                day=parse_day(_cell(row, mapping["date"]), date_format),
+                amount=amount,
+                detail=_cell(row, mapping["detail"]),
+            )
+        except ValueError as e:
+            if report is not None:
+                report.reject(line, e)
+            continue
+        yield parsed
+    if mapping is None:
+        raise StatementError(
+            "Could not find date, amount and description columns in the CSV header"
+        )
+
+
+_OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.DOTALL | re.IGNORECASE)
+_OFX_FIELD = re.compile(r"<(\w+)>([^<\r\n]*)")
+
+
+async def parse_ofx(
+    upload, encoding: str = "utf-8-sig", report: Optional[ImportReport] = None
+) -> AsyncIterator[StatementRow]:
+    """Yield the ``<STMTTRN>`` entries of an OFX/QFX file (SGML or XML flavour)."""
+    pending = ""
+    number = 0
+    async for text in _read_text(upload, encoding):
+        pending += text
+        end = 0
+        for match in _OFX_TRANSACTION.finditer(pending):
+            end = match.end()
+            number += 1
+            fields = {
+                name.upper(): value.strip()
+                for name, value in _OFX_FIELD.findall(match.group(1))
+            }
+            detail = " ".join(
+                part for part in (fields.get("NAME"), fields.get("MEMO")) if part
+            )
+            try:
+                parsed = StatementRow(
+                    line=number,
+                    day=parse_day(fields.get("DTPOSTED", "")[:8], "%Y%m%d"),
+                    amount=parse_amount(fields.get("TRNAMT", "")),
+                    detail=detail,
+                )
+            except ValueError as e:
+                if report is not None:
+                    report.reject(number, e)
+                continue
+            yield parsed
+        if end:
+            pending = pending[end:]
+    if number == 0:
+        raise StatementError("No <STMTTRN> transactions found in the OFX file")
+
+
+def detect_format(filename: Optional[str], head: bytes) -> str:
+    name = (filename or "").lower()
+    if name.endswith((".ofx", ".qfx")):
+        return "ofx"
+    start = head.lstrip()[:64].upper()
+    if start.startswith((b"OFXHEADER", b"<?XML", b"<OFX")):
+        return "ofx"
+    return "csv"
+
+
+async def statement_chunks(
+    user_id: str,
+    rows: AsyncIterator[StatementRow],
+    tag: str = "",
+    tz: str = "UTC",
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+) -> AsyncIterator[List[Transactions]]:
+    """
+    Group parsed rows into chunks of unsaved ``Transactions``. Each row is
+    dated at local midnight in ``tz`` so it lands on the statement day.
+    """
+    zone = ZoneInfo(tz)
+    occurrences = Counter()
+    chunk = []
+    total = 0
+    async for row in rows:
+        total += 1
+        if total > MAX_IMPORT_ROWS:
+            raise StatementError(f"Statements are limited to {MAX_IMPORT_ROWS} rows")
+        key = hashlib.sha256(_row_key(row).encode()).digest()
+        occurrences[key] += 1
+        chunk.append(
+            Transactions(
+                user_id=user_id,
+                amount=abs(row.amount),
+                type="income" if row.amount > 0 else "expense",
+                detail=row.detail,
+                tag=tag,
+                created_at=datetime.datetime.combine(row.day, datetime.time(0), zone),
+                import_hash=import_hash(user_id, row, occurrences[key]),
+            )
+        )
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def drop_existing(user_id: str, records: List[Transactions]) -> List[Transactions]:
+    """Remove records whose import_hash is already stored for this user."""
+    if not records:
+        return records
+    existing = set(
+        await Transactions.filter(
+            user_id=user_id, import_hash__in=[r.import_hash for r in records]
+        ).values_list("import_hash", flat=True)
+    )
+    return [r for r in records if r.import_hash not in existing]
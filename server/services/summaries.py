@@ -0,0 +1,554 @@
+"""
+Scheduled AI summaries driven by ``UsersSetting.conclusion_routine``.
+
+Once a day, week or month has ended, every user whose routine is
+``daily``, ``weekly`` or ``monthly`` gets a summary of it, stored in
+``ScheduledSummary`` and served from ``/ai/summaries/{user_id}`` without
+touching the model. A pass walks the due users in ``user_id`` order, in
+batches of ``SUMMARY_BATCH_SIZE``:
+
+- one query pages the due settings, one skips users already summarized,
+  and two grouped DailyRollup queries plus one User query build every
+  digest in the batch, instead of ``load_digest`` per user;
+- the model calls fan out at most ``SUMMARY_CONCURRENCY`` at a time, and
+  through ``ai_scheduler``, so interactive requests keep their share;
+- each summary is stored as soon as it is generated, and the batch's last
+  ``user_id`` is checkpointed in ``SummaryRun``.
+
+A restarted or timed-out run resumes after the checkpoint, and users inside
+the interrupted batch that already have a summary are skipped. A run that
+is cancelled lets its model calls in flight finish and stores them before
+it stops, so resuming repeats no call. Only a process killed outright
+(SIGKILL, a serverless hard timeout) loses the calls it had in flight,
+and those users are called again on resume: delivery is at-least-once for
+calls in flight at a hard kill. Failed users are retried by up to
+``SUMMARY_MAX_PASSES`` sweeps. A lease on the run row keeps two workers
+off the same routine and period; it is renewed before every model call
+(including saturation retries), and a worker that finds it taken over
+stops. Each user is also checked for a stored summary right before the
+call.
+
+Run from cron, or let Vercel Cron call ``/internal/summaries/run``:
+
+    python -m server.services.summaries run [--routine weekly] [--date 2026-10-19]
+    python -m server.services.summaries status
+"""
+
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from tortoise import Tortoise, run_async
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.functions import Sum
+
+from server.db.models import (
+    DailyRollup,
+    ScheduledSummary,
+    SummaryRun,
+    User,
+    UsersSetting,
+)
+from server.db.rollup import rollup_day
+from server.services.ai_scheduler import SchedulerSaturated, ai_scheduler
+from server.services.metrics import timed_generate
+from server.services.prompt_digest import render_digest
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+SUMMARY_BATCH_SIZE = int(os.getenv("SUMMARY_BATCH_SIZE", "50"))
+# Below AI_MAX_CONCURRENCY, so scheduled work never fills every slot.
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+SUMMARY_MAX_PASSES = int(os.getenv("SUMMARY_MAX_PASSES", "3"))
+SUMMARY_LEASE_SECONDS = float(os.getenv("SUMMARY_LEASE_SECONDS", "300"))
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", "800"))
+SUMMARY_MODEL = "gemini-2.5-flash"
+# Time budget of one /internal/summaries/run call (serverless timeout).
+SUMMARY_RUN_SECONDS = float(os.getenv("SUMMARY_RUN_SECONDS", "50"))
+# Bearer token for /internal/summaries/run (Vercel Cron sends CRON_SECRET).
+CRON_SECRET = os.getenv("CRON_SECRET")
+
+ROUTINES = ("daily", "weekly", "monthly")
+ROUTINE_LABELS = {"daily": "รายวัน", "weekly": "รายสัปดาห์", "monthly": "รายเดือน"}
+SATURATED_RETRIES = 5
+
+
+class LeaseLost(Exception):
+    """Another worker took over the run after our lease lapsed."""
+
+
+def period_bounds(routine: str, today: datetime.date) -> tuple:
+    """``(start, end)`` of the last whole period before ``today``; end is exclusive."""
+    if routine == "daily":
+        return today - datetime.timedelta(days=1), today
+    if routine == "weekly":
+        monday = today - datetime.timedelta(days=today.weekday())
+        return monday - datetime.timedelta(days=7), monday
+    if routine == "monthly":
+        first = today.replace(day=1)
+        return (first - datetime.timedelta(days=1)).replace(day=1), first
+    raise ValueError(f"Unknown routine: {routine}")
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _money(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+# --- Batch digests ----------------------------------------------------------
+
+
+def _period_totals(query):
+    return query.annotate(
+        income_total=Sum("income"),
+        expense_total=Sum("expense"),
+        income_rows=Sum("income_count"),
+        expense_rows=Sum("expense_count"),
+    )
+
+
+async def load_batch_digests(user_ids: List[str], start, end, previous_start) -> dict:
+    """
+    ``render_digest`` inputs for every user in ``user_ids`` over
+    ``[start, end)``, from one grouped DailyRollup query, plus each user's
+    totals for ``[previous_start, start)`` under ``"previous"``. Users with
+    no transactions in the period are left out.
+    """
+    rows = await (
+        _period_totals(
+            DailyRollup.filter(user_id__in=user_ids, day__gte=start, day__lt=end)
+        )
+        .group_by("user_id", "tag")
+        .values(
+            "user_id",
+            "tag",
+            "income_total",
+            "expense_total",
+            "income_rows",
+            "expense_rows",
+        )
+    )
+    previous = await (
+        _period_totals(
+            DailyRollup.filter(
+                user_id__in=user_ids, day__gte=previous_start, day__lt=start
+            )
+        )
+        .group_by("user_id")
+        .values("user_id", "income_total", "expense_total")
+    )
+
+    digests = {}
+    for row in rows:
+        digest = digests.setdefault(
+            row["user_id"],
+            {
+                "count": 0,
+                "income": 0.0,
+                "expense": 0.0,
+                "expense_count": 0,
+                "first_day": start,
+                "last_day": end - datetime.timedelta(days=1),
+                "tags": {},
+                "months": {},
+                "merchants": [],
+                "outliers": [],
+                "recent": [],
+            },
+        )
+        income, expense = row["income_total"] or 0.0, row["expense_total"] or 0.0
+        count = (row["income_rows"] or 0) + (row["expense_rows"] or 0)
+        digest["tags"][row["tag"]] = {"income": income, "expense": expense, "count": count}
+        digest["count"] += count
+        digest["income"] += income
+        digest["expense"] += expense
+        digest["expense_count"] += row["expense_rows"] or 0
+    for digest in digests.values():
+        expense_count = digest.pop("expense_count")
+        digest["average_expense"] = digest["expense"] / expense_count if expense_count else 0.0
+    for row in previous:
+        if row["user_id"] in digests:
+            digests[row["user_id"]]["previous"] = {
+                "income": row["income_total"] or 0.0,
+                "expense": row["expense_total"] or 0.0,
+            }
+    return digests
+
+
+async def _usernames(user_ids: List[str]) -> Dict[str, str]:
+    ids = []
+    for user_id in user_ids:
+        try:
+            ids.append(uuid.UUID(user_id))
+        except ValueError:
+            continue
+    if not ids:
+        return {}
+    rows = await User.filter(id__in=ids).values_list("id", "username")
+    return {str(user_id): username for user_id, username in rows}
+
+
+def build_summary_prompt(
+    routine: str, username: str, goal: str, settings: dict, digest: dict
+) -> str:
+    lines = [render_digest(digest, SUMMARY_TOKEN_BUDGET)]
+    previous = digest.get("previous")
+    if previous:
+        lines.append(
+            f"\nช่วงก่อนหน้า: รายรับ {_money(previous['income'])}, "
+            f"รายจ่าย {_money(previous['expense'])}"
+        )
+    if settings["daily_spending_limit"] > 0:
+        lines.append(f"งบใช้จ่ายต่อวัน: {_money(settings['daily_spending_limit'])}")
+    if settings["monthly_income"] > 0:
+        lines.append(f"รายได้ต่อเดือน: {_money(settings['monthly_income'])}")
+    if goal:
+        lines.append(f"เป้าหมายทางการเงิน: {goal[:500]}")
+    data = "\n".join(lines)
+
+    return f"""
+            สรุปการเงิน{ROUTINE_LABELS[routine]}ของ {username} และให้คำแนะนำแบบสั้น ๆ
+
+ข้อมูลช่วงนี้:
+{data}
+
+กรุณาสรุปผลในรูปแบบ Markdown โดยใช้โครงสร้างดังนี้:
+
+## 📊 สรุป{ROUTINE_LABELS[routine]}
+- ภาพรวมการใช้จ่ายเทียบกับช่วงก่อนหน้า
+
+## 🎯 ความคืบหน้าตามเป้าหมาย
+- 1-3 ข้อ
+
+## ✅ คำแนะนำ
+- 2-3 คำแนะนำที่นำไปใช้ได้จริง
+
+เน้นความกระชับ ใช้อีโมจิน้อย ๆ
+            """
+
+
+# --- Generation -------------------------------------------------------------
+
+
+async def _finish_on_cancel(coro):
+    """Await ``coro``; if we are cancelled meanwhile, let it finish first."""
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await asyncio.gather(task, return_exceptions=True)
+        raise
+
+
+async def _generate(client, prompt: str, renew_lease, store) -> None:
+    """
+    Generate a summary and ``store`` it. A run stopped mid-call still waits
+    for the call and stores its answer, so resuming does not pay for it
+    again; only a killed process loses calls in flight.
+    """
+    from server.routers.ai import NO_THINKING
+
+    async def call():
+        response = await ai_scheduler.run(
+            lambda: timed_generate(
+                client, model=SUMMARY_MODEL, contents=prompt, config=NO_THINKING
+            )
+        )
+        await store(response.text)
+
+    for attempt in range(SATURATED_RETRIES):
+        await renew_lease()
+        try:
+            return await _finish_on_cancel(call())
+        except SchedulerSaturated:
+            # Interactive traffic has the slots; back off instead of failing.
+            await asyncio.sleep(2**attempt)
+    raise SchedulerSaturated("AI scheduler stayed saturated")
+
+
+async def _process_batch(client, routine, start, end, settings_rows, renew_lease) -> dict:
+    ids = [row["user_id"] for row in settings_rows]
+    done = set(
+        await ScheduledSummary.filter(
+            routine=routine, period_start=start, user_id__in=ids
+        ).values_list("user_id", flat=True)
+    )
+    pending = [row for row in settings_rows if row["user_id"] not in done]
+    counts = {"generated": 0, "failed": 0, "skipped": len(done)}
+    if not pending:
+        return counts
+
+    previous_start, _ = period_bounds(routine, start)
+    digests = await load_batch_digests(
+        [row["user_id"] for row in pending], start, end, previous_start
+    )
+    names = await _usernames(list(digests))
+    counts["skipped"] += len(pending) - len(digests)
+
+    slots = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+
+    async def summarize(row):
+        user_id = row["user_id"]
+        prompt = build_summary_prompt(
+            routine,
+            names.get(user_id, user_id),
+            row["goal_description"],
+            row,
+            digests[user_id],
+        )
+
+        async def store(content: str) -> None:
+            try:
+                await ScheduledSummary.create(
+                    user_id=user_id,
+                    routine=routine,
+                    period_start=start,
+                    period_end=end,
+                    content=content,
+                )
+                counts["generated"] += 1
+            except IntegrityError:
+                # Another worker stored it after our lease lapsed.
+                counts["skipped"] += 1
+
+        async with slots:
+            if await ScheduledSummary.exists(
+                routine=routine, period_start=start, user_id=user_id
+            ):
+                # Stored by a worker that held the run before us.
+                counts["skipped"] += 1
+                return
+            try:
+                await _generate(client, prompt, renew_lease, store)
+            except LeaseLost:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduled {routine} summary failed for user {user_id}: {e}")
+                counts["failed"] += 1
+
+    # return_exceptions: a cancelled batch still waits for calls in flight.
+    results = await asyncio.gather(
+        *(summarize(row) for row in pending if row["user_id"] in digests),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return counts
+
+
+# --- Runs -------------------------------------------------------------------
+
+
+async def _claim(routine: str, start) -> Optional[SummaryRun]:
+    """The run for this period if it is unfinished and nobody else holds it."""
+    run, _ = await SummaryRun.get_or_create(
+        routine=routine, period_start=start, defaults={"status": "running"}
+    )
+    if run.status == "done":
+        return None
+    now = _utcnow()
+    lease_until = now + datetime.timedelta(seconds=SUMMARY_LEASE_SECONDS)
+    claimed = await SummaryRun.filter(
+        Q(lease_until__isnull=True) | Q(lease_until__lt=now),
+        id=run.id,
+        status="running",
+    ).update(lease_until=lease_until)
+    if not claimed:
+        return None
+    await run.refresh_from_db()
+    run.lease_until = lease_until
+    return run
+
+
+class _Lease:
+    """Our hold on ``run``; every write is conditional on still holding it."""
+
+    def __init__(self, run: SummaryRun):
+        self.run = run
+        self._lock = asyncio.Lock()
+
+    async def renew(self, force: bool = False) -> None:
+        """Extend the lease once half of it is used; raises ``LeaseLost``."""
+        async with self._lock:
+            remaining = (self.run.lease_until - _utcnow()).total_seconds()
+            if not force and remaining > SUMMARY_LEASE_SECONDS / 2:
+                return
+            lease_until = _utcnow() + datetime.timedelta(seconds=SUMMARY_LEASE_SECONDS)
+            renewed = await SummaryRun.filter(
+                id=self.run.id, lease_until=self.run.lease_until
+            ).update(lease_until=lease_until)
+            if not renewed:
+                raise LeaseLost(f"Lost the lease on {self.run.routine} {self.run.period_start}")
+            self.run.lease_until = lease_until
+
+    async def release(self) -> None:
+        await SummaryRun.filter(
+            id=self.run.id, lease_until=self.run.lease_until
+        ).update(lease_until=None)
+
+
+async def run_routine(
+    routine: str,
+    today: Optional[datetime.date] = None,
+    deadline: Optional[float] = None,
+    client=None,
+) -> dict:
+    """
+    Summarize the last finished period of ``routine``, resuming from its
+    checkpoint. Stops between batches once ``time.monotonic()`` passes
+    ``deadline``; the next call carries on from there.
+    """
+    today = today or rollup_day(_utcnow())
+    start, end = period_bounds(routine, today)
+    report = {"routine": routine, "period_start": start.isoformat()}
+
+    if client is None:
+        from server.routers.ai import get_client
+
+        client = get_client()
+    if client is None:
+        return {**report, "status": "ai_not_configured"}
+
+    run = await _claim(routine, start)
+    if run is None:
+        return {**report, "status": "done_or_locked"}
+
+    lease, lost = _Lease(run), False
+    totals = {"generated": 0, "failed": 0, "skipped": 0, "batches": 0}
+    try:
+        while True:
+            if deadline is not None and time.monotonic() > deadline:
+                report["status"] = "paused"
+                break
+            query = UsersSetting.filter(conclusion_routine__iexact=routine)
+            if run.cursor is not None:
+                query = query.filter(user_id__gt=run.cursor)
+            batch = (
+                await query.order_by("user_id")
+                .limit(SUMMARY_BATCH_SIZE)
+                .values(
+                    "user_id",
+                    "goal_description",
+                    "daily_spending_limit",
+                    "monthly_income",
+                )
+            )
+            if not batch:
+                if run.failed and run.passes < SUMMARY_MAX_PASSES:
+                    # Sweep again; only users without a summary do any work.
+                    logger.warning(
+                        f"{run.failed} {routine} summaries failed, starting pass "
+                        f"{run.passes + 1}"
+                    )
+                    await lease.renew(force=True)
+                    run.cursor, run.failed, run.passes = None, 0, run.passes + 1
+                    await run.save(update_fields=["cursor", "failed", "passes", "updated_at"])
+                    continue
+                await lease.renew(force=True)
+                run.status = "done"
+                await run.save(update_fields=["status", "updated_at"])
+                report["status"] = "done"
+                break
+
+            counts = await _process_batch(
+                client, routine, start, end, batch, lease.renew
+            )
+            for key, value in counts.items():
+                totals[key] += value
+            totals["batches"] += 1
+            await lease.renew(force=True)
+            run.cursor = batch[-1]["user_id"]
+            run.generated += counts["generated"]
+            run.failed += counts["failed"]
+            await run.save(update_fields=["cursor", "generated", "failed", "updated_at"])
+    except LeaseLost as e:
+        logger.warning(f"{e}; leaving the run to its new holder")
+        lost = True
+        report["status"] = "lease_lost"
+    finally:
+        if not lost:
+            await lease.release()
+
+    logger.info(
+        f"Scheduled {routine} summaries for {start}: {report['status']}, "
+        f"{totals['generated']} generated, {totals['failed']} failed"
+    )
+    return {**report, **totals}
+
+
+async def run_due(
+    routines=ROUTINES,
+    today: Optional[datetime.date] = None,
+    max_seconds: Optional[float] = None,
+    client=None,
+) -> List[dict]:
+    """``run_routine`` for each routine, sharing one ``max_seconds`` budget."""
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    return [
+        await run_routine(routine, today, deadline, client) for routine in routines
+    ]
+
+
+async def summaries_status(limit: int = 20) -> list:
+    return (
+        await SummaryRun.all()
+        .order_by("-period_start", "routine")
+        .limit(limit)
+        .values(
+            "routine",
+            "period_start",
+            "status",
+            "cursor",
+            "passes",
+            "generated",
+            "failed",
+            "updated_at",
+        )
+    )
+
+
+async def _main(args):
+    from server.db.main import get_tortoise_config
+
+    config = get_tortoise_config()
+    if not config:
+        raise SystemExit(1)
+    await Tortoise.init(config=config)
+    await Tortoise.generate_schemas(safe=True)
+
+    if args.command == "status":
+        for run in await summaries_status():
+            print(
+                f"{run['routine']} {run['period_start']}: {run['status']} "
+                f"pass={run['passes']} generated={run['generated']} "
+                f"failed={run['failed']} cursor={run['cursor']}"
+            )
+        return
+
+    routines = [args.routine] if args.routine else ROUTINES
+    today = datetime.date.fromisoformat(args.date) if args.date else None
+    for report in await run_due(routines, today, args.max_seconds):
+        print(report)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run or inspect scheduled summaries")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--routine", choices=ROUTINES, default=None)
+    parser.add_argument("--date", default=None, help="pretend today is YYYY-MM-DD")
+    parser.add_argument("--max-seconds", type=float, default=None)
+    run_async(_main(parser.parse_args()))
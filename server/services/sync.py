@@ -0,0 +1,153 @@
+"""
+Delta sync for transactions.
+
+A client keeps the ``watermark`` from its last sync and asks for everything
+that changed after it:
+
+- ``changes``: rows whose ``lastest_edit`` is after the watermark, read in
+  keyset order on ``(lastest_edit, id)`` (index ``(user_id, lastest_edit)``),
+  so concurrent edits during paging land on a later page;
+- ``deleted``: ids of rows deleted (or moved to another user) since then,
+  from ``TransactionTombstone``, sent on the last page.
+
+Tombstones are compacted after ``SYNC_TOMBSTONE_RETENTION_DAYS``. A client
+whose watermark is older than that gets ``reset=True`` and a full listing,
+and must replace its local copy.
+
+    python -m server.services.sync compact
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from tortoise import Tortoise, run_async
+from tortoise.expressions import Q
+
+from server.db.models import Transactions, TransactionTombstone
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+TOMBSTONE_RETENTION = datetime.timedelta(
+    days=float(os.getenv("SYNC_TOMBSTONE_RETENTION_DAYS", "30"))
+)
+# Rows are stamped before their transaction commits; overlap the next sync by
+# this much so a slow commit is never skipped. Re-sent rows are idempotent.
+SYNC_OVERLAP = datetime.timedelta(
+    seconds=float(os.getenv("SYNC_OVERLAP_SECONDS", "30"))
+)
+COMPACTION_INTERVAL = float(os.getenv("SYNC_COMPACTION_INTERVAL_SECONDS", "3600"))
+
+_last_compaction: Optional[float] = None
+
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+async def record_tombstone(transaction_id, user_id: str, using_db=None) -> None:
+    """Call inside the deleting transaction so the tombstone commits with it."""
+    await TransactionTombstone.create(
+        transaction_id=transaction_id, user_id=user_id, using_db=using_db
+    )
+
+
+async def load_changes(
+    user_id: str,
+    since: Optional[datetime.datetime],
+    after: Optional[tuple],
+    limit: int,
+    fields: tuple,
+) -> dict:
+    """
+    One sync page. ``after`` is the ``(lastest_edit, id)`` of the previous
+    page's last row, or None on the first page.
+    """
+    now = _utcnow()
+    reset = since is not None and since < now - TOMBSTONE_RETENTION
+    if reset:
+        since = None
+
+    query = Transactions.filter(user_id=user_id)
+    if since is not None:
+        query = query.filter(lastest_edit__gt=since)
+    if after is not None:
+        last_edit, last_id = after
+        query = query.filter(
+            Q(lastest_edit__gt=last_edit) | Q(lastest_edit=last_edit, id__gt=last_id)
+        )
+    rows = (
+        await query.order_by("lastest_edit", "id")
+        .limit(limit + 1)
+        .values(*fields, "lastest_edit")
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    deleted = []
+    if not has_more and since is not None:
+        deleted = await TransactionTombstone.filter(
+            user_id=user_id, deleted_at__gt=since
+        ).values_list("transaction_id", flat=True)
+
+    await maybe_compact()
+    return {
+        "changes": rows,
+        "deleted": list(dict.fromkeys(deleted)),
+        "has_more": has_more,
+        "after": (rows[-1]["lastest_edit"], rows[-1]["id"]) if has_more else None,
+        "watermark": now - SYNC_OVERLAP,
+        "reset": reset,
+    }
+
+
+async def compact_tombstones(
+    retention: datetime.timedelta = TOMBSTONE_RETENTION,
+) -> int:
+    deleted = await TransactionTombstone.filter(
+        deleted_at__lt=_utcnow() - retention
+    ).delete()
+    if deleted:
+        logger.info(f"Compacted {deleted} transaction tombstones")
+    return deleted
+
+
+async def maybe_compact() -> None:
+    """Compact at most once per ``COMPACTION_INTERVAL`` per process."""
+    global _last_compaction
+    if (
+        _last_compaction is not None
+        and time.monotonic() - _last_compaction < COMPACTION_INTERVAL
+    ):
+        return
+    _last_compaction = time.monotonic()
+    try:
+        await compact_tombstones()
+    except Exception as e:
+        # Compaction is housekeeping; a failure must not fail the sync.
+        logger.error(f"Tombstone compaction failed: {e}")
+
+
+async def _main(args):
+    from server.db.main import get_tortoise_config
+
+    config = get_tortoise_config()
+    if not config:
+        raise SystemExit(1)
+    await Tortoise.init(config=config)
+    await Tortoise.generate_schemas(safe=True)
+    count = await compact_tombstones()
+    print(f"compacted {count} tombstones")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Delta sync maintenance")
+    parser.add_argument("command", choices=["compact"])
+    run_async(_main(parser.parse_args()))